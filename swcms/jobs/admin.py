@@ -0,0 +1,19 @@
+from django.contrib import admin
+
+from user_dashboard.admin import LargeTableAdmin
+
+from .models import Job, ScheduleState
+
+
+@admin.register(Job)
+class JobAdmin(LargeTableAdmin):
+    list_display = ('name', 'queue', 'status', 'attempts', 'run_at', 'finished_at')
+    list_filter = ('status', 'queue')
+    search_fields = ('^name', '=dedup_key')
+    readonly_fields = ('claim_token', 'locked_until', 'enqueued_at', 'started_at', 'finished_at', 'last_error')
+    date_hierarchy = 'run_at'
+
+
+@admin.register(ScheduleState)
+class ScheduleStateAdmin(admin.ModelAdmin):
+    list_display = ('name', 'next_run_at')
@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
+
+
+class JobsConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'jobs'
+
+    def ready(self):
+        # Register every app's @task functions before anything enqueues
+        autodiscover_modules('tasks')
+
+        from user_dashboard.metrics import registry
+        from .worker import queue_gauges
+        registry.add_collector(queue_gauges)
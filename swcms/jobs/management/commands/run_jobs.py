@@ -0,0 +1,52 @@
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from jobs.worker import Worker
+
+
+def _serve_metrics(port, metrics):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            body = metrics.render().encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+class Command(BaseCommand):
+    help = "Run background jobs and periodic schedules. Start several for more throughput."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--queue', action='append', dest='queues',
+                            help="Queue to work on; repeat for several (default: all in JOBS_QUEUES).")
+        parser.add_argument('--concurrency', type=int, default=4, help="Jobs run at once by this process.")
+        parser.add_argument('--poll-interval', type=float, default=1.0)
+        parser.add_argument('--burst', action='store_true', help="Exit once no job is ready.")
+        parser.add_argument('--metrics-port', type=int,
+                            help="Serve this worker's job metrics on 127.0.0.1:PORT.")
+
+    def handle(self, *args, **options):
+        queues = options['queues'] or list(getattr(settings, 'JOBS_QUEUES', {'default': {}}))
+        worker = Worker(queues, concurrency=options['concurrency'], poll_interval=options['poll_interval'])
+        if options['metrics_port']:
+            _serve_metrics(options['metrics_port'], worker.metrics)
+
+        # Finish the jobs in hand on SIGTERM/Ctrl-C instead of abandoning them
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *args: worker.stopping.set())
+        self.stdout.write(f"Worker {worker.name} on queues {', '.join(queues)}")
+        total = worker.run(burst=options['burst'])
+        self.stdout.write(f"Ran {total} jobs.")
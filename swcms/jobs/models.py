@@ -0,0 +1,53 @@
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """One call of a registered task, claimed and run by `manage.py run_jobs`."""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    queue = models.CharField(max_length=50, default='default')
+    name = models.CharField(max_length=200, help_text="Registered task name")
+    kwargs = models.JSONField(default=dict, blank=True)
+    dedup_key = models.CharField(max_length=200, null=True, blank=True,
+                                 help_text="At most one queued job per key")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    claim_token = models.CharField(max_length=64, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    enqueued_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['queue', 'run_at'], condition=models.Q(status='queued'),
+                         name='jobs_ready_idx'),
+            models.Index(fields=['queue', 'locked_until'], condition=models.Q(status='running'),
+                         name='jobs_running_idx'),
+            models.Index(fields=['claim_token'], name='jobs_claim_token_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['dedup_key'], condition=models.Q(status='queued'),
+                                    name='jobs_unique_queued_dedup_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} [{self.queue}] - {self.status}"
+
+
+class ScheduleState(models.Model):
+    """When a JOBS_SCHEDULE entry is next due; shared by all workers."""
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} at {self.next_run_at}"
@@ -0,0 +1,221 @@
+"""
+Database-backed job queue.
+
+Functions decorated with @task are registered by name; enqueue() inserts a
+Job row, normally inside the caller's transaction so the job exists exactly
+when the change that needs it commits. A job with a dedup_key is skipped
+while another job with that key is still queued (a partial unique index
+enforces it), which collapses bursts such as "recalculate rewards".
+
+claim_jobs() hands ready rows to one worker. On backends with
+SELECT ... FOR UPDATE SKIP LOCKED (Postgres) candidates are locked without
+waiting on rows other workers are claiming; on SQLite, which has no row
+locks but serialises writers, the claim is a single conditional UPDATE over
+a LIMITed subquery. Either way the rows are stamped with a unique claim
+token and read back by it. A claimed job holds a lease; if its worker dies
+the lease runs out and the job is claimed again, unless that was its last
+attempt, in which case it is marked failed. Failures are retried with
+exponential backoff and jitter until max_attempts.
+"""
+import logging
+import random
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_tasks = {}
+
+
+class UnknownTask(Exception):
+    pass
+
+
+class Task:
+
+    def __init__(self, func, name, queue, max_attempts):
+        self.func = func
+        self.name = name
+        self.queue = queue
+        self.max_attempts = max_attempts
+
+    def __call__(self, **kwargs):
+        return self.func(**kwargs)
+
+    def enqueue(self, dedup_key=None, run_at=None, **kwargs):
+        return enqueue(self.name, dedup_key=dedup_key, run_at=run_at, **kwargs)
+
+
+def task(queue='default', max_attempts=5, name=None):
+    """Register a function as a task; call .enqueue(**kwargs) to queue it."""
+    def register(func):
+        registered = Task(func, name or f'{func.__module__}.{func.__name__}', queue, max_attempts)
+        _tasks[registered.name] = registered
+        return registered
+    return register
+
+
+def get_task(name):
+    try:
+        return _tasks[name]
+    except KeyError:
+        raise UnknownTask(name) from None
+
+
+def queue_settings(queue):
+    return getattr(settings, 'JOBS_QUEUES', {}).get(queue, {})
+
+
+def lease_duration():
+    return timedelta(seconds=getattr(settings, 'JOBS_LEASE_SECONDS', 300))
+
+
+def enqueue(name, dedup_key=None, run_at=None, **kwargs):
+    """Queue a call of task `name`; returns the Job, or None if deduplicated."""
+    registered = get_task(name)
+    job = Job(
+        queue=registered.queue, name=name, kwargs=kwargs, dedup_key=dedup_key,
+        max_attempts=registered.max_attempts, run_at=run_at or timezone.now(),
+    )
+    try:
+        # A savepoint, so a duplicate doesn't break the caller's transaction
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return None
+    if getattr(settings, 'JOBS_IMMEDIATE', False):
+        # Development/test mode: run after commit in this process
+        transaction.on_commit(lambda: run_immediately(job))
+    return job
+
+
+def run_immediately(job):
+    claimed = claim_jobs(job.queue, 1, ids=[job.pk])
+    for claimed_job in claimed:
+        execute(claimed_job)
+
+
+def _ready_condition(now):
+    # A lease that ran out on the last attempt is not retried; see fail_abandoned()
+    return (
+        Q(status='queued', run_at__lte=now)
+        | Q(status='running', locked_until__lt=now, attempts__lt=F('max_attempts'))
+    )
+
+
+def _ready(queue, now):
+    """Jobs a worker may take: due and queued, or running on an expired lease with attempts left."""
+    return Job.objects.filter(_ready_condition(now), queue=queue)
+
+
+def fail_abandoned(queue, now=None):
+    """Fail jobs whose lease ran out on their last attempt (the task hangs or kills its worker); return how many."""
+    now = now or timezone.now()
+    return Job.objects.filter(
+        queue=queue, status='running', locked_until__lt=now, attempts__gte=F('max_attempts'),
+    ).update(
+        status='failed', finished_at=now, locked_until=None,
+        last_error='Lease expired on the last attempt; the worker hung or died.',
+    )
+
+
+def running_count(queue, now=None):
+    now = now or timezone.now()
+    return Job.objects.filter(queue=queue, status='running', locked_until__gte=now).count()
+
+
+def claim_jobs(queue, limit, ids=None):
+    """Claim up to `limit` ready jobs from `queue`, honouring its concurrency."""
+    now = timezone.now()
+    concurrency = queue_settings(queue).get('concurrency')
+    if concurrency is not None:
+        limit = min(limit, concurrency - running_count(queue, now))
+    if limit <= 0:
+        return []
+    fail_abandoned(queue, now)
+
+    token = uuid.uuid4().hex
+    candidates = _ready(queue, now)
+    if ids is not None:
+        candidates = candidates.filter(pk__in=ids)
+    claim = dict(
+        status='running', claim_token=token, locked_until=now + lease_duration(),
+        started_at=now, attempts=F('attempts') + 1,
+    )
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            picked = list(
+                candidates.select_for_update(skip_locked=True)
+                .order_by('run_at', 'pk').values_list('pk', flat=True)[:limit]
+            )
+            Job.objects.filter(pk__in=picked).update(**claim)
+    else:
+        # One statement, so it is atomic under SQLite's single writer; the
+        # status re-check inside it makes a lost race claim nothing.
+        subquery = candidates.order_by('run_at', 'pk').values('pk')[:limit]
+        Job.objects.filter(pk__in=subquery).filter(_ready_condition(now)).update(**claim)
+
+    claimed = list(Job.objects.filter(claim_token=token).order_by('run_at', 'pk'))
+    if concurrency is not None and claimed and running_count(queue, now) > concurrency:
+        # Another worker claimed at the same moment; back off and let the
+        # next poll sort it out rather than exceed the limit.
+        try:
+            with transaction.atomic():
+                Job.objects.filter(claim_token=token, status='running').update(
+                    status='queued', claim_token='', locked_until=None, attempts=F('attempts') - 1,
+                )
+            return []
+        except IntegrityError:
+            # A duplicate was queued meanwhile; running ours is simpler
+            pass
+    return claimed
+
+
+def backoff(attempts):
+    """Seconds before retry `attempts`: exponential, capped, with jitter."""
+    base = getattr(settings, 'JOBS_RETRY_BASE_SECONDS', 10)
+    cap = getattr(settings, 'JOBS_RETRY_MAX_SECONDS', 3600)
+    delay = min(cap, base * 2 ** (attempts - 1))
+    return delay / 2 + random.uniform(0, delay / 2)
+
+
+def execute(job):
+    """Run a claimed job and record the outcome; returns True on success."""
+    try:
+        get_task(job.name)(**job.kwargs)
+    except Exception as exc:
+        logger.exception('Job %s (%s) failed on attempt %d', job.pk, job.name, job.attempts)
+        _record_failure(job, exc)
+        return False
+    Job.objects.filter(pk=job.pk, claim_token=job.claim_token).update(
+        status='done', finished_at=timezone.now(), locked_until=None,
+    )
+    job.status = 'done'
+    return True
+
+
+def _record_failure(job, exc):
+    now = timezone.now()
+    mine = Job.objects.filter(pk=job.pk, claim_token=job.claim_token)
+    error = repr(exc)[:2000]
+    if job.attempts < job.max_attempts and not isinstance(exc, UnknownTask):
+        try:
+            with transaction.atomic():
+                mine.update(
+                    status='queued', run_at=now + timedelta(seconds=backoff(job.attempts)),
+                    locked_until=None, last_error=error,
+                )
+            job.status = 'queued'
+            return
+        except IntegrityError:
+            # A newer job with the same dedup_key is queued and will do the work
+            pass
+    mine.update(status='failed', finished_at=now, locked_until=None, last_error=error)
+    job.status = 'failed'
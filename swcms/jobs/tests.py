@@ -0,0 +1,113 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from user_dashboard.models import Panchayath, PickupRequest, Profile, Reward, Ward
+
+from . import queue
+from .models import Job
+from .worker import queue_gauges, run_due_schedules
+
+calls = []
+
+
+@queue.task(queue='tests')
+def record(value):
+    calls.append(value)
+
+
+@queue.task(queue='tests', max_attempts=2)
+def explode():
+    raise RuntimeError('boom')
+
+
+@override_settings(JOBS_QUEUES={'tests': {'concurrency': 1}}, JOBS_IMMEDIATE=False)
+class JobQueueTests(TestCase):
+
+    def setUp(self):
+        calls.clear()
+
+    def test_dedup_key_collapses_queued_jobs(self):
+        self.assertIsNotNone(record.enqueue(dedup_key='k', value=1))
+        self.assertIsNone(record.enqueue(dedup_key='k', value=2))
+        [job] = queue.claim_jobs('tests', 5)
+        # Once claimed, a new job with the key may be queued again
+        self.assertIsNotNone(record.enqueue(dedup_key='k', value=3))
+        queue.execute(job)
+        self.assertEqual(calls, [1])
+
+    def test_claim_honours_queue_concurrency(self):
+        for value in range(3):
+            record.enqueue(value=value)
+        self.assertEqual(len(queue.claim_jobs('tests', 5)), 1)
+        self.assertEqual(queue.claim_jobs('tests', 5), [])
+
+    def test_failures_back_off_then_fail(self):
+        explode.enqueue()
+        [job] = queue.claim_jobs('tests', 1)
+        self.assertFalse(queue.execute(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn('boom', job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        [job] = queue.claim_jobs('tests', 1)
+        queue.execute(job)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+
+    def test_expired_lease_is_reclaimed(self):
+        record.enqueue(value=1)
+        [first] = queue.claim_jobs('tests', 1)
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        [second] = queue.claim_jobs('tests', 1)
+        self.assertEqual(first.pk, second.pk)
+        self.assertNotEqual(first.claim_token, second.claim_token)
+        # The stale worker can no longer record an outcome
+        queue.execute(first)
+        self.assertEqual(Job.objects.get().status, 'running')
+
+    def test_lease_expiring_on_the_last_attempt_fails_the_job(self):
+        explode.enqueue()
+        for attempt in (1, 2):
+            [job] = queue.claim_jobs('tests', 1)
+            self.assertEqual(job.attempts, attempt)
+            # The worker hangs or dies without recording an outcome
+            Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(queue.claim_jobs('tests', 1), [])
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertIn('Lease expired', job.last_error)
+
+    @override_settings(JOBS_SCHEDULE={'tick': {'task': 'jobs.tests.record', 'every': 60, 'kwargs': {'value': 't'}}})
+    def test_schedule_fires_once_per_period(self):
+        now = timezone.now()
+        self.assertEqual(run_due_schedules(now), ['tick'])
+        self.assertEqual(run_due_schedules(now + timedelta(seconds=30)), [])
+        self.assertEqual(Job.objects.filter(name='jobs.tests.record').count(), 1)
+        self.assertIn('swcms_job_queue_depth{queue="tests"} 1', queue_gauges())
+
+
+@override_settings(JOBS_IMMEDIATE=True)
+class RewardRecalculationJobTests(TestCase):
+
+    def test_mark_completed_queues_recalculation(self):
+        ward = Ward.objects.create(name='W1', ward_number=1, panchayath=Panchayath.objects.create(name='P', code='P1'))
+        resident = User.objects.create_user('resident')
+        Profile.objects.create(user=resident, role='user', ward=ward)
+        worker = User.objects.create_user('worker')
+        Profile.objects.create(user=worker, role='worker', ward=ward)
+        pickup = PickupRequest.objects.create(
+            user=resident, waste_type='dry', status='picked', schedule_date_time=timezone.now(),
+        )
+        self.client.force_login(worker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('mark_completed', args=[pickup.pk]), {'waste_weight': '4.5'})
+        self.assertEqual(Job.objects.get().status, 'done')
+        reward = Reward.objects.get(user=resident)
+        self.assertEqual((reward.points, reward.total_waste_collected), (100, Decimal('4.5')))
@@ -0,0 +1,174 @@
+"""
+The run_jobs worker loop, periodic scheduler and job metrics.
+
+A Worker polls its queues, claims at most as many jobs as it has idle
+threads and runs them on a thread pool. Between polls it fires any
+JOBS_SCHEDULE entries that are due: each entry's ScheduleState row is
+advanced with a conditional UPDATE, so however many workers run, only the
+one whose update succeeds enqueues that period's job. Queue wait (from
+run_at to start) and run time are recorded per task in fixed-bucket
+histograms; queue_gauges() adds queue depth and the age of the oldest ready
+job to the web /metrics page from the database.
+"""
+import logging
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Min
+from django.utils import timezone
+
+from user_dashboard.metrics import LATENCY_BUCKETS, Histogram
+
+from . import queue as job_queue
+from .models import Job, ScheduleState
+
+logger = logging.getLogger(__name__)
+
+WAIT_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+
+class JobMetrics:
+    """Per-task wait/run histograms and outcome counters for one worker."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.wait = {}
+        self.run = {}
+        self.outcomes = {}
+
+    def observe(self, job, wait, duration, ok):
+        key = (job.queue, job.name)
+        with self._lock:
+            if key not in self.run:
+                self.wait[key] = Histogram(WAIT_BUCKETS)
+                self.run[key] = Histogram(LATENCY_BUCKETS)
+            self.wait[key].observe(wait)
+            self.run[key].observe(duration)
+            outcome = (*key, 'success' if ok else 'error')
+            self.outcomes[outcome] = self.outcomes.get(outcome, 0) + 1
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name, help_text, histograms in (
+                ('swcms_job_wait_seconds', 'Time from a job becoming due to it starting.', self.wait),
+                ('swcms_job_duration_seconds', 'Job run time.', self.run),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (queue, task), histogram in sorted(histograms.items()):
+                    labels = f'queue="{queue}",task="{task}"'
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{{labels}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{labels}}} {histogram.count}')
+            lines.append('# HELP swcms_jobs_total Jobs run by outcome.')
+            lines.append('# TYPE swcms_jobs_total counter')
+            for (queue, task, outcome), count in sorted(self.outcomes.items()):
+                lines.append(f'swcms_jobs_total{{queue="{queue}",task="{task}",outcome="{outcome}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+
+def queue_gauges():
+    """Exposition lines for queue depth and oldest ready job, per queue."""
+    now = timezone.now()
+    rows = (
+        Job.objects.filter(status='queued', run_at__lte=now)
+        .values('queue').annotate(depth=Count('pk'), oldest=Min('run_at'))
+    )
+    lines = [
+        '# HELP swcms_job_queue_depth Jobs due and waiting for a worker.',
+        '# TYPE swcms_job_queue_depth gauge',
+    ]
+    ages = []
+    for row in rows:
+        lines.append(f'swcms_job_queue_depth{{queue="{row["queue"]}"}} {row["depth"]}')
+        ages.append(f'swcms_job_oldest_age_seconds{{queue="{row["queue"]}"}} '
+                    f'{(now - row["oldest"]).total_seconds():.3f}')
+    lines.append('# HELP swcms_job_oldest_age_seconds Age of the oldest due job.')
+    lines.append('# TYPE swcms_job_oldest_age_seconds gauge')
+    return lines + ages
+
+
+def run_due_schedules(now=None):
+    """Enqueue each JOBS_SCHEDULE entry whose period has come round."""
+    now = now or timezone.now()
+    enqueued = []
+    for name, entry in getattr(settings, 'JOBS_SCHEDULE', {}).items():
+        every = timedelta(seconds=entry['every'])
+        ScheduleState.objects.get_or_create(name=name, defaults={'next_run_at': now})
+        advanced = ScheduleState.objects.filter(name=name, next_run_at__lte=now).update(next_run_at=now + every)
+        if advanced:
+            job_queue.enqueue(entry['task'], dedup_key=f'schedule:{name}', **entry.get('kwargs', {}))
+            enqueued.append(name)
+    return enqueued
+
+
+class Worker:
+
+    def __init__(self, queues, concurrency=4, poll_interval=1.0, metrics=None):
+        self.queues = list(queues)
+        self.concurrency = concurrency
+        self.poll_interval = poll_interval
+        self.metrics = metrics or JobMetrics()
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='jobs')
+        self.busy = 0
+        self._busy_lock = threading.Lock()
+        self.stopping = threading.Event()
+
+    def _run(self, job):
+        started = time.perf_counter()
+        try:
+            ok = job_queue.execute(job)
+        except Exception:
+            # Recording the outcome failed (e.g. the database went away); the
+            # lease will expire and another worker retries the job.
+            logger.exception('Could not record the outcome of job %s', job.pk)
+            ok = False
+        finally:
+            connection.close()
+            with self._busy_lock:
+                self.busy -= 1
+        wait = max(0.0, (job.started_at - job.run_at).total_seconds())
+        self.metrics.observe(job, wait, time.perf_counter() - started, ok)
+
+    def poll_once(self):
+        """Fire due schedules and start as many jobs as there are idle threads."""
+        run_due_schedules()
+        started = 0
+        for queue in self.queues:
+            with self._busy_lock:
+                idle = self.concurrency - self.busy
+            if idle <= 0:
+                break
+            for job in job_queue.claim_jobs(queue, idle):
+                with self._busy_lock:
+                    self.busy += 1
+                self.executor.submit(self._run, job)
+                started += 1
+        return started
+
+    def _has_ready_jobs(self):
+        return Job.objects.filter(queue__in=self.queues, status='queued', run_at__lte=timezone.now()).exists()
+
+    def run(self, max_jobs=None, burst=False):
+        """Poll until stopped; with burst, stop once nothing is left to claim."""
+        total = 0
+        while not self.stopping.is_set():
+            started = self.poll_once()
+            total += started
+            if max_jobs is not None and total >= max_jobs:
+                break
+            if burst and not started and not self.busy and not self._has_ready_jobs():
+                break
+            if not started:
+                self.stopping.wait(self.poll_interval)
+        self.executor.shutdown(wait=True)
+        return total
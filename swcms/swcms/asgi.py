@@ -2,6 +2,8 @@
 ASGI config for swcms project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Serve it (e.g. ``uvicorn swcms.asgi:application``) to get the worker
+dashboard's live updates, whose event stream is an async view.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
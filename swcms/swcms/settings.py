@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
+from datetime import timedelta
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -33,6 +34,50 @@ LOGIN_URL = 'login'
 RAZORPAY_KEY_ID = 'rzp_test_RVEferDnVRYHXc'
 RAZORPAY_KEY_SECRET = '3lxVPZxfaMNh0GvsiYJL3433'
 
+# Payment gateway adapter (see user_dashboard/gateway.py). Point the base URL
+# at `manage.py mock_gateway` to work without the real API.
+PAYMENT_GATEWAY_BASE_URL = 'https://api.razorpay.com'
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = 3.05
+PAYMENT_GATEWAY_READ_TIMEOUT = 10.0
+PAYMENT_GATEWAY_MAX_RETRIES = 2
+PAYMENT_GATEWAY_BREAKER_THRESHOLD = 5
+PAYMENT_GATEWAY_BREAKER_RESET = 30.0
+
+# Gateway webhooks (see user_dashboard/webhooks.py). Set the secret to the one
+# configured in the Razorpay dashboard; with background processing off, run
+# `manage.py process_webhooks` instead.
+RAZORPAY_WEBHOOK_SECRET = ''
+PAYMENT_WEBHOOK_BATCH_SIZE = 200
+PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND = True
+
+# Background jobs (see jobs/queue.py); run workers with `manage.py run_jobs`.
+# concurrency caps how many jobs of a queue run at once across all workers.
+JOBS_QUEUES = {
+    'default': {'concurrency': 8},
+    'rewards': {'concurrency': 1},
+    'maintenance': {'concurrency': 2},
+    'notifications': {'concurrency': 1},
+    'images': {'concurrency': 2},
+}
+JOBS_SCHEDULE = {
+    'purge-idempotency-keys': {'task': 'user_dashboard.tasks.purge_idempotency_keys', 'every': 3600},
+    'discard-abandoned-uploads': {'task': 'user_dashboard.tasks.discard_abandoned_uploads', 'every': 3600},
+    'process-payment-webhooks': {'task': 'user_dashboard.tasks.process_payment_webhooks', 'every': 60},
+    'purge-pickup-events': {'task': 'user_dashboard.tasks.purge_pickup_events', 'every': 600},
+    # Catches pickups left unassigned because no worker was on duty
+    'assign-pickups': {'task': 'user_dashboard.tasks.assign_pickups', 'every': 60},
+    # Picks up notification retries once their backoff has passed
+    'send-notifications': {'task': 'user_dashboard.tasks.send_notifications', 'every': 30},
+    'cluster-feedback': {'task': 'user_dashboard.tasks.cluster_feedback', 'every': 300},
+    # Resumes purges whose job was lost; admin deletions queue one at once
+    'purge-deleted-users': {'task': 'user_dashboard.tasks.purge_deleted_users', 'every': 600},
+}
+JOBS_LEASE_SECONDS = 300
+JOBS_RETRY_BASE_SECONDS = 10
+JOBS_RETRY_MAX_SECONDS = 3600
+# Run jobs in the enqueuing process right after commit (no worker needed)
+JOBS_IMMEDIATE = False
+
 
 # Application definition
 
@@ -44,9 +89,11 @@ INSTALLED_APPS = [
     'django.contrib.messages',
     'django.contrib.staticfiles',
     'user_dashboard',
+    'jobs',
 ]
 
 MIDDLEWARE = [
+    'user_dashboard.metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -54,6 +101,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'user_dashboard.profiling.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'swcms.urls'
@@ -76,6 +124,23 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'swcms.wsgi.application'
 
+# Request metrics exposed at /metrics (see user_dashboard/metrics.py)
+METRICS_N_PLUS_ONE_THRESHOLD = 10
+# Scrapers send `Authorization: Bearer <METRICS_TOKEN>`, or connect from an
+# allowed address. Behind a reverse proxy REMOTE_ADDR is the proxy's own
+# (usually 127.0.0.1), so only list addresses when the app is reached directly.
+METRICS_TOKEN = ''
+METRICS_ALLOWED_IPS = []
+
+# Sampling profiler (see user_dashboard/profiling.py); off unless enabled
+PROFILER_ENABLED = False
+PROFILER_SAMPLE_RATE = 0.0
+PROFILER_HEADER = 'X-Profile'
+PROFILER_URL_NAMES = []
+PROFILER_INTERVAL = 0.005
+PROFILER_DIR = BASE_DIR / 'profiles'
+PROFILER_MAX_PROFILES = 50
+
 
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
@@ -129,9 +194,78 @@ STATICFILES_DIRS = [BASE_DIR / 'user_dashboard/static']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# How media_view hands file transfers to the front server: None (Django
+# streams the file), 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache).
+# For nginx, map MEDIA_ACCEL_PREFIX to MEDIA_ROOT in an `internal` location.
+MEDIA_ACCEL = None
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# Chunked pickup photo uploads (see user_dashboard/uploads.py)
+PICKUP_PHOTO_MAX_BYTES = 15 * 1024 * 1024
+PICKUP_PHOTO_CHUNK_BYTES = 1024 * 1024
+PICKUP_UPLOAD_DIR = BASE_DIR / 'upload_chunks'
+
+# How long a pickup submission's idempotency key answers retries
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+
 # Use console email backend in development so password reset emails appear in console
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Notification outbox (see user_dashboard/notifications.py). Rate limits are
+# messages per second per channel.
+NOTIFICATION_SMS_BACKEND = 'user_dashboard.notifications.ConsoleSMSBackend'
+NOTIFICATION_SMS_FILE_PATH = BASE_DIR / 'sms-messages'
+NOTIFICATION_RATE_LIMITS = {'email': 10, 'sms': 2}
+NOTIFICATION_BATCH_SIZE = 100
+NOTIFICATION_MAX_ATTEMPTS = 5
+# One send_notifications run stops after this, well inside JOBS_LEASE_SECONDS
+NOTIFICATION_SEND_SECONDS = 120
+
+# Live worker dashboard (see user_dashboard/live.py); needs an ASGI server
+# such as `uvicorn swcms.asgi:application`, under WSGI pages just don't update.
+LIVE_POLL_INTERVAL = 1.0
+LIVE_HEARTBEAT_SECONDS = 15
+LIVE_STREAM_SECONDS = 300
+LIVE_RETRY_MS = 3000
+LIVE_BATCH_SIZE = 500
+# Events this recent are read again in case a lower id commits late
+LIVE_SETTLE_SECONDS = 5
+LIVE_EVENT_RETENTION = timedelta(hours=1)
+
+# Offline sync API for the worker app (see user_dashboard/sync.py)
+SYNC_PAGE_SIZE = 500
+SYNC_MAX_PAGE_SIZE = 2000
+SYNC_SETTLE_SECONDS = 5
+SYNC_MAX_ACTIONS = 200
+SYNC_MAX_UPLOAD_BYTES = 1024 * 1024
+
+# Route planning (see user_dashboard/routing.py). Above ROUTE_MATRIX_MAX_STOPS
+# distances are computed per row instead of as a full matrix.
+ROUTE_TIME_BUDGET = 0.5
+ROUTE_MATRIX_MAX_STOPS = 2000
+
+# Pickup time slots (see user_dashboard/slots.py). Availability is cached; use
+# a shared cache such as Redis when running more than one process.
+SLOT_CACHE_SECONDS = 300
+
+# Pickup assignment to workers (see user_dashboard/assignment.py)
+ASSIGNMENT_BATCH_SIZE = 1000
+
+# How long a worker's claim on a pickup lasts unless renewed (see user_dashboard/claims.py)
+CLAIM_LEASE_SECONDS = 30 * 60
+
+# Full-text search over feedback and pickups (see user_dashboard/search.py)
+SEARCH_RESULT_LIMIT = 50
+
+# Duplicate complaint clustering (see user_dashboard/clustering.py)
+FEEDBACK_CLUSTER_THRESHOLD = 0.5
+FEEDBACK_CLUSTER_WINDOW_HOURS = 72
+FEEDBACK_CLUSTER_LOOKBACK_DAYS = 30
+
+# Background removal of deleted users (see user_dashboard/purge.py)
+USER_PURGE_BATCH_SIZE = 500
+USER_PURGE_MAX_BATCHES = 200
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
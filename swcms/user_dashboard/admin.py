@@ -1,8 +1,66 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Max
+from django.utils.functional import cached_property
 from .models import (
-    Panchayath, Ward, Profile, PickupRequest, 
-    Reward, Payment, Feedback
+    Panchayath, Ward, Profile, PickupRequest, PickupSlot, SlotUsage,
+    Reward, Payment, Feedback, FeedbackCluster, WebhookEvent, Notification, UserPurge
 )
+from . import search
+
+# Unfiltered changelists above this many rows show an estimated total
+ESTIMATED_COUNT_THRESHOLD = 10000
+
+
+def _estimated_row_count(queryset):
+    """Cheap row estimate for a whole table, or None if unavailable."""
+    connection = connections[queryset.db]
+    model = queryset.model
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] and row[0] > 0:
+            return int(row[0])
+        return None
+    # SQLite and others: the highest primary key is read straight off the
+    # index and is an upper bound on the row count.
+    return model._default_manager.using(queryset.db).aggregate(max_pk=Max('pk'))['max_pk']
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that avoids an exact COUNT(*) on large unfiltered tables."""
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = _estimated_row_count(queryset)
+            if estimate is not None and estimate > ESTIMATED_COUNT_THRESHOLD:
+                return estimate
+        return super().count
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Base admin for tables expected to grow to millions of rows."""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+class FullTextSearchMixin:
+    """Also match the changelist search against a full-text index (see search.py)."""
+    search_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        matches = search.matching(self.search_index, search_term)
+        if matches is None:
+            return results, may_have_duplicates
+        return results | queryset.filter(pk__in=matches), may_have_duplicates
 
 @admin.register(Panchayath)
 class PanchayathAdmin(admin.ModelAdmin):
@@ -15,37 +73,104 @@ class PanchayathAdmin(admin.ModelAdmin):
 class WardAdmin(admin.ModelAdmin):
     list_display = ('name', 'panchayath', 'ward_number')
     list_filter = ('panchayath',)
+    list_select_related = ('panchayath',)
     search_fields = ('name', 'panchayath__name')
     fields = ('name', 'panchayath', 'ward_number')
 
+@admin.register(PickupSlot)
+class PickupSlotAdmin(admin.ModelAdmin):
+    list_display = ('ward', 'weekday', 'start_time', 'end_time', 'capacity', 'is_active')
+    list_editable = ('capacity', 'is_active')
+    list_filter = ('weekday', 'is_active', 'ward__panchayath')
+    list_select_related = ('ward',)
+    search_fields = ('ward__name',)
+    autocomplete_fields = ('ward',)
+
+@admin.register(SlotUsage)
+class SlotUsageAdmin(LargeTableAdmin):
+    list_display = ('slot', 'date', 'booked')
+    list_select_related = ('slot__ward',)
+    readonly_fields = ('slot', 'date', 'booked')
+    date_hierarchy = 'date'
+
 @admin.register(Profile)
-class ProfileAdmin(admin.ModelAdmin):
+class ProfileAdmin(LargeTableAdmin):
     list_display = ('user', 'role', 'ward', 'mobile_number')
     list_filter = ('role', 'ward')
-    search_fields = ('user__username', 'mobile_number')
+    list_select_related = ('user', 'ward__panchayath')
+    search_fields = ('^user__username', '^mobile_number')
+    raw_id_fields = ('user',)
+    autocomplete_fields = ('ward',)
 
 @admin.register(PickupRequest)
-class PickupRequestAdmin(admin.ModelAdmin):
+class PickupRequestAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = ('request_id', 'user', 'waste_type', 'status', 'created_at')
-    list_filter = ('status', 'waste_type', 'created_at')
-    search_fields = ('request_id', 'user__username')
+    list_filter = ('status', 'waste_type')
+    list_select_related = ('user',)
+    search_fields = ('=request_id', '^user__username')
+    search_index = search.PICKUPS
     readonly_fields = ('request_id', 'created_at', 'updated_at')
+    raw_id_fields = ('user', 'slot')
+    date_hierarchy = 'created_at'
 
 @admin.register(Reward)
-class RewardAdmin(admin.ModelAdmin):
+class RewardAdmin(LargeTableAdmin):
     list_display = ('user', 'points', 'total_waste_collected')
-    search_fields = ('user__username',)
+    list_select_related = ('user',)
+    search_fields = ('^user__username',)
+    raw_id_fields = ('user',)
 
 @admin.register(Payment)
-class PaymentAdmin(admin.ModelAdmin):
+class PaymentAdmin(LargeTableAdmin):
     list_display = ('user', 'pickup_request', 'amount', 'status', 'created_at')
-    list_filter = ('status', 'created_at')
-    search_fields = ('user__username', 'razorpay_order_id')
-    readonly_fields = ('created_at',)
+    list_filter = ('status',)
+    list_select_related = ('user', 'pickup_request__user')
+    search_fields = ('^user__username', '=razorpay_order_id')
+    readonly_fields = ('created_at', 'reconciled_at')
+    raw_id_fields = ('user', 'pickup_request')
+    date_hierarchy = 'created_at'
 
 @admin.register(Feedback)
-class FeedbackAdmin(admin.ModelAdmin):
+class FeedbackAdmin(FullTextSearchMixin, LargeTableAdmin):
     list_display = ('subject', 'user', 'ward', 'status', 'is_complaint', 'created_at')
-    list_filter = ('status', 'is_complaint', 'ward', 'created_at')
-    search_fields = ('subject', 'user__username')
+    list_filter = ('status', 'is_complaint', 'ward')
+    list_select_related = ('user', 'ward__panchayath')
+    search_fields = ('^subject', '^user__username')
+    search_index = search.FEEDBACK
     readonly_fields = ('created_at',)
+    raw_id_fields = ('user', 'cluster')
+    autocomplete_fields = ('ward',)
+    date_hierarchy = 'created_at'
+
+@admin.register(FeedbackCluster)
+class FeedbackClusterAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'ward', 'created_at', 'updated_at')
+    list_select_related = ('ward__panchayath',)
+    search_fields = ('^subject',)
+    autocomplete_fields = ('ward',)
+    readonly_fields = ('created_at', 'updated_at')
+
+@admin.register(WebhookEvent)
+class WebhookEventAdmin(LargeTableAdmin):
+    list_display = ('event_id', 'received_at', 'processed_at', 'error')
+    search_fields = ('=event_id',)
+    readonly_fields = ('event_id', 'body', 'received_at', 'processed_at', 'error')
+    date_hierarchy = 'received_at'
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ('channel', 'recipient', 'subject', 'status', 'attempts', 'created_at', 'sent_at')
+    list_filter = ('channel', 'status')
+    search_fields = ('=recipient',)
+    readonly_fields = ('created_at', 'sent_at', 'last_error')
+    raw_id_fields = ('user',)
+    date_hierarchy = 'created_at'
+
+@admin.register(UserPurge)
+class UserPurgeAdmin(admin.ModelAdmin):
+    list_display = ('username', 'user_id', 'requested_by', 'requested_at', 'stage', 'last_pk', 'finished_at')
+    list_filter = ('finished_at',)
+    search_fields = ('^username',)
+    readonly_fields = (
+        'user_id', 'username', 'requested_by', 'requested_at', 'stage', 'last_pk', 'removed', 'updated_at', 'finished_at',
+    )
@@ -0,0 +1,146 @@
+"""
+Load-balanced assignment of pickups to a ward's workers.
+
+New pickups are handed out by the assign_pickups job, queued with each new
+pickup and run on a schedule as a backstop, rather than in the request. For
+every ward with pending pickups nobody holds, a WardLoad is rebuilt from the
+database: the ward's on-duty workers and their open (pending or picked)
+pickups counted per day. Pickups are then taken in schedule order and each
+goes to the worker with the fewest pickups that day, ties going to the one
+with less open work overall; a min-heap per day makes a batch of n pickups
+over w workers O(n log w). Assignments are written with one UPDATE per
+worker that only touches pickups still unassigned, so two assigners, or a
+worker claiming a pickup by marking it picked, never overwrite each other.
+
+A worker going off duty, changing ward or losing the worker role hands their
+pending pickups back, and they are redistributed the same way; pickups they
+have already picked stay theirs. `manage.py assign_pickups --rebalance`
+redistributes every pending pickup from scratch.
+"""
+import heapq
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import PickupRequest, Profile
+
+OPEN_STATUSES = ('pending', 'picked')
+
+
+class WardLoad:
+    """Open pickups per worker and day for one ward, with a min-heap per day."""
+
+    def __init__(self, worker_ids, counts=()):
+        self.workers = sorted(worker_ids)
+        self.totals = Counter()
+        self.daily = defaultdict(Counter)
+        for worker_id, date, count in counts:
+            self.totals[worker_id] += count
+            self.daily[date][worker_id] += count
+        self._heaps = {}
+
+    @classmethod
+    def from_db(cls, ward_id):
+        worker_ids = list(
+            Profile.objects.filter(ward_id=ward_id, role='worker', on_duty=True).values_list('user_id', flat=True)
+        )
+        counts = (
+            PickupRequest.objects
+            .filter(assigned_to_id__in=worker_ids, status__in=OPEN_STATUSES)
+            .annotate(day=TruncDate('schedule_date_time'))
+            .values_list('assigned_to_id', 'day')
+            .annotate(count=Count('pk'))
+            .values_list('assigned_to_id', 'day', 'count')
+        ) if worker_ids else ()
+        return cls(worker_ids, counts)
+
+    def _heap(self, date):
+        heap = self._heaps.get(date)
+        if heap is None:
+            # Overall totals only break ties, so entries built earlier may
+            # carry slightly stale ones
+            heap = self._heaps[date] = [(self.daily[date][w], self.totals[w], w) for w in self.workers]
+            heapq.heapify(heap)
+        return heap
+
+    def take(self, date):
+        """Return the least loaded worker on `date` and count one more pickup against them."""
+        if not self.workers:
+            return None
+        heap = self._heap(date)
+        day, total, worker_id = heap[0]
+        heapq.heapreplace(heap, (day + 1, total + 1, worker_id))
+        self.daily[date][worker_id] += 1
+        self.totals[worker_id] += 1
+        return worker_id
+
+
+def schedule_assignment():
+    # Imported here: tasks imports this module
+    from .tasks import assign_pickups
+    assign_pickups.enqueue(dedup_key='assign-pickups')
+
+
+def _unassigned(ward_id=None):
+    pickups = PickupRequest.objects.filter(status='pending', assigned_to__isnull=True)
+    # The join bypasses Profile's manager, so leave deleted households out by
+    # hand: soft_delete_user() cancels their pickups, but one may race it
+    if ward_id is not None:
+        return pickups.filter(user__profile__ward_id=ward_id, user__profile__deleted_at__isnull=True)
+    return pickups.filter(user__profile__ward__isnull=False, user__profile__deleted_at__isnull=True)
+
+
+def assign_ward(ward_id, batch_size=None):
+    """Assign one batch of the ward's unassigned pickups; return how many were."""
+    batch_size = batch_size or getattr(settings, 'ASSIGNMENT_BATCH_SIZE', 1000)
+    pickups = list(
+        _unassigned(ward_id).order_by('schedule_date_time', 'pk').values_list('pk', 'schedule_date_time')[:batch_size]
+    )
+    if not pickups:
+        return 0
+    load = WardLoad.from_db(ward_id)
+    if not load.workers:
+        return 0
+    chosen = defaultdict(list)
+    for pk, when in pickups:
+        chosen[load.take(timezone.localtime(when).date())].append(pk)
+    return sum(
+        PickupRequest.objects.filter(pk__in=ids, status='pending', assigned_to__isnull=True)
+        .update(assigned_to_id=worker_id)
+        for worker_id, ids in chosen.items()
+    )
+
+
+def assign_pending():
+    """Assign unassigned pending pickups in every ward; return how many were."""
+    total = 0
+    ward_ids = _unassigned().values_list('user__profile__ward_id', flat=True).distinct()
+    for ward_id in list(ward_ids):
+        while True:
+            assigned = assign_ward(ward_id)
+            total += assigned
+            if not assigned:
+                break
+    return total
+
+
+def hand_back(worker_id):
+    """Unassign a worker's pending pickups and queue them for others; return the count."""
+    count = PickupRequest.objects.filter(assigned_to_id=worker_id, status='pending').update(assigned_to=None)
+    if count:
+        schedule_assignment()
+    return count
+
+
+def rebalance_ward(ward_id):
+    """Redistribute all of a ward's pending pickups across its on-duty workers."""
+    PickupRequest.objects.filter(user__profile__ward_id=ward_id, status='pending').update(assigned_to=None)
+    total = 0
+    while True:
+        assigned = assign_ward(ward_id)
+        total += assigned
+        if not assigned:
+            return total
@@ -0,0 +1,111 @@
+"""
+Short leases on pending pickups, so workers in a ward don't all head to the
+same house.
+
+claim() is a single conditional UPDATE by primary key that only matches
+while the pickup is pending and either unclaimed, already the caller's, or
+held on a lease that has run out. When many workers claim at once, each
+statement locks just that one row, and exactly one of them sees it updated.
+renew() and release() are conditional on the caller still holding the
+claim in the same way, and so is pick(), which marks the pickup picked, so a
+claim landing just before it wins. Nothing sweeps expired leases: every reader compares
+claim_expires_at with the current time (PickupRequest.active_claimant), so
+a lapsed claim reads as unclaimed and the next claim() overwrites it.
+
+The endpoints answer JSON for the worker dashboard and apps, and publish a
+live event so other dashboards in the ward show the claim at once.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.db.models import Q
+from django.http import Http404, JsonResponse
+from django.utils import timezone
+from django.views.decorators.http import require_POST
+
+from .live import publish_pickup_changes
+from .models import PickupRequest, Profile
+
+
+def lease():
+    return timedelta(seconds=getattr(settings, 'CLAIM_LEASE_SECONDS', 1800))
+
+
+def claim(pickup_id, worker):
+    """Claim a pending pickup for `worker`; return the lease expiry, or None if someone else holds it."""
+    now = timezone.now()
+    expires_at = now + lease()
+    claimed = (
+        PickupRequest.objects
+        .filter(pk=pickup_id, status='pending')
+        .filter(_free_for(worker, now))
+        .update(claimed_by=worker, claim_expires_at=expires_at)
+    )
+    return expires_at if claimed else None
+
+
+def renew(pickup_id, worker):
+    """Extend the caller's claim; return the new expiry, or None if they no longer hold it."""
+    expires_at = timezone.now() + lease()
+    # A lapsed lease nobody else has taken can still be renewed
+    renewed = (
+        PickupRequest.objects.filter(pk=pickup_id, status='pending', claimed_by=worker)
+        .update(claim_expires_at=expires_at)
+    )
+    return expires_at if renewed else None
+
+
+def release(pickup_id, worker):
+    """Drop the caller's claim; return whether they held it."""
+    return bool(
+        PickupRequest.objects.filter(pk=pickup_id, claimed_by=worker)
+        .update(claimed_by=None, claim_expires_at=None)
+    )
+
+
+def _free_for(worker, now):
+    return Q(claimed_by__isnull=True) | Q(claim_expires_at__lte=now) | Q(claimed_by=worker)
+
+
+def pick(pickup_id, worker):
+    """Mark a pending pickup picked by `worker` unless another worker holds a live claim; return whether it was."""
+    now = timezone.now()
+    # Whoever picks it up is handling it, and their claim has served its purpose
+    return bool(
+        PickupRequest.objects.filter(pk=pickup_id, status='pending').filter(_free_for(worker, now))
+        .update(status='picked', assigned_to=worker, claimed_by=None, claim_expires_at=None, updated_at=now)
+    )
+
+
+def _state(pickup, worker):
+    claimant = pickup.active_claimant
+    return {
+        'pickup': pickup.pk,
+        'status': pickup.status,
+        'claimed': claimant is not None and claimant.pk == worker.pk,
+        'claimant': claimant.username if claimant is not None else None,
+        'expires_at': pickup.claim_expires_at.isoformat() if claimant is not None else None,
+    }
+
+
+ACTIONS = {'claim': claim, 'renew': renew, 'release': release}
+
+
+@login_required
+@require_POST
+def pickup_claim_view(request, pk, action):
+    """POST claim, renew or release on a pickup in the worker's ward; 409 if another worker holds it."""
+    ward_id = Profile.objects.filter(user=request.user, role='worker').values_list('ward_id', flat=True).first()
+    if ward_id is None:
+        return JsonResponse({'error': 'Only workers with a ward can claim pickups.'}, status=403)
+    pickups = PickupRequest.objects.filter(user__profile__ward_id=ward_id)
+    if not pickups.filter(pk=pk).exists():
+        raise Http404
+    with transaction.atomic():
+        ok = ACTIONS[action](pk, request.user)
+        if ok:
+            publish_pickup_changes([pk])
+    pickup = pickups.select_related('claimed_by').get(pk=pk)
+    return JsonResponse(_state(pickup, request.user), status=200 if ok else 409)
@@ -0,0 +1,227 @@
+"""
+Grouping of near-identical complaints for triage.
+
+When a bin overflows, many residents of a ward report it in nearly the same
+words. The cluster_feedback job looks at pending complaints from the last
+FEEDBACK_CLUSTER_LOOKBACK_DAYS. It puts two complaints together when they
+come from the same ward, were filed within FEEDBACK_CLUSTER_WINDOW_HOURS of
+each other, and their texts have a cosine similarity of at least
+FEEDBACK_CLUSTER_THRESHOLD. Chains of such pairs form a FeedbackCluster,
+which admins can answer and resolve in one go.
+
+Each text (subject and message) becomes a TF-IDF vector over its words and
+word pairs, hashed into a fixed number of columns, and is held as sparse
+arrays: one entry per (row, column). Complaints are sorted by ward and time,
+and each block of them is compared only with the earlier complaints still
+inside the window. The block's dot products are a join on column (one
+searchsorted) summed with bincount, so the cost grows with the pairs that
+share words, not with the square of the table. A re-run keeps a cluster's id
+when its complaints mostly stay together, so a page an admin has open does
+not go stale between runs.
+"""
+import re
+import zlib
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from .models import Feedback, FeedbackCluster
+
+HASH_BITS = 20
+BLOCK_SIZE = 256
+CHUNK_SIZE = 1024
+UPDATE_BATCH_SIZE = 5000
+
+WORD_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset(
+    'a an and are at be by for from has have in is it near of on or the there this to was were with'.split()
+)
+
+
+class _WordHashes(dict):
+    """crc32 of each distinct word, computed once; -1 for words to skip."""
+
+    def __missing__(self, word):
+        value = self[word] = -1 if len(word) < 2 or word in STOP_WORDS else zlib.crc32(word.encode())
+        return value
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Vectors:
+    """L2-normalised hashed TF-IDF rows in CSR form (indptr, indices, data)."""
+
+    def __init__(self, texts, hash_bits=HASH_BITS):
+        # Words are looked up without a Python-level loop, and only distinct
+        # ones go through crc32; word pairs are hashed from those in bulk
+        word_hashes = _WordHashes()
+        hashes, lengths = [], []
+        for text in texts:
+            words = WORD_RE.findall(text.lower())
+            hashes.extend(map(word_hashes.__getitem__, words))
+            lengths.append(len(words))
+
+        mask = (1 << hash_bits) - 1
+        hashes = np.asarray(hashes, dtype=np.int64)
+        word_rows = np.repeat(np.arange(len(lengths), dtype=np.int64), lengths)
+        keep = hashes >= 0
+        hashes, word_rows = hashes[keep], word_rows[keep]
+        follows = np.flatnonzero(word_rows[1:] == word_rows[:-1])
+        pair_hashes = (hashes[follows] * 1000003) ^ hashes[follows + 1]
+        rows = np.concatenate([word_rows, word_rows[follows]])
+        columns = np.concatenate([hashes, pair_hashes]) & mask
+
+        n = len(lengths)
+        keys, counts = np.unique(rows << hash_bits | columns, return_counts=True)
+        rows, cols = keys >> hash_bits, keys & mask
+        # Smoothed idf over the columns in use, sublinear term frequency
+        _, inverse, df = np.unique(cols, return_inverse=True, return_counts=True)
+        idf = np.log((1 + n) / (1 + df)) + 1
+        data = (1 + np.log(counts)) * idf[inverse]
+        norms = np.sqrt(np.bincount(rows, weights=data ** 2, minlength=n))
+        data /= np.where(norms > 0, norms, 1)[rows]
+
+        self.n = n
+        self.indptr = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=n))])
+        self.indices = cols
+        self.data = data
+
+    def _slice(self, start, stop):
+        lo, hi = self.indptr[start], self.indptr[stop]
+        rows = np.repeat(np.arange(stop - start), np.diff(self.indptr[start:stop + 1]))
+        return rows, self.indices[lo:hi], self.data[lo:hi]
+
+    def dot(self, rows, columns):
+        """Cosine similarities between two row ranges, as a dense (rows x columns) array."""
+        left_rows, left_cols, left_data = self._slice(*rows)
+        right_rows, right_cols, right_data = self._slice(*columns)
+        order = np.argsort(right_cols, kind='stable')
+        right_rows, right_cols, right_data = right_rows[order], right_cols[order], right_data[order]
+        # Pair every left entry with the right entries in the same column
+        lo = np.searchsorted(right_cols, left_cols, 'left')
+        hi = np.searchsorted(right_cols, left_cols, 'right')
+        counts = hi - lo
+        left = np.repeat(np.arange(len(left_cols)), counts)
+        right = np.repeat(lo - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+        width = columns[1] - columns[0]
+        sims = np.bincount(
+            left_rows[left] * width + right_rows[right],
+            weights=left_data[left] * right_data[right],
+            minlength=(rows[1] - rows[0]) * width,
+        )
+        return sims.reshape(rows[1] - rows[0], width)
+
+
+def _find(parent, i):
+    while parent[i] != i:
+        parent[i] = parent[parent[i]]
+        i = parent[i]
+    return i
+
+
+def similar_pairs(vectors, groups, times, window, threshold):
+    """
+    Pairs (i, j), j < i, in the same group, no more than `window` apart in
+    `times` and at least `threshold` similar. Rows must be sorted by group
+    and then time.
+    """
+    pairs = []
+    boundaries = np.flatnonzero(np.diff(groups)) + 1
+    for group_start, group_stop in zip(np.r_[0, boundaries], np.r_[boundaries, len(groups)]):
+        for start in range(group_start, group_stop, BLOCK_SIZE):
+            stop = min(start + BLOCK_SIZE, group_stop)
+            first = group_start + int(np.searchsorted(times[group_start:stop], times[start] - window, 'left'))
+            for chunk in range(first, stop, CHUNK_SIZE):
+                chunk_stop = min(chunk + CHUNK_SIZE, stop)
+                sims = vectors.dot((start, stop), (chunk, chunk_stop))
+                i = np.arange(start, stop)[:, None]
+                j = np.arange(chunk, chunk_stop)[None, :]
+                near = (sims >= threshold) & (j < i) & (times[i] - times[j] <= window)
+                rows, cols = np.nonzero(near)
+                pairs.extend(zip((rows + start).tolist(), (cols + chunk).tolist()))
+    return pairs
+
+
+def components(n, pairs):
+    """Label rows by connected component; rows in no pair get -1."""
+    parent = list(range(n))
+    for i, j in pairs:
+        a, b = _find(parent, i), _find(parent, j)
+        if a != b:
+            parent[max(a, b)] = min(a, b)
+    labels = np.full(n, -1, dtype=np.int64)
+    linked = {i for pair in pairs for i in pair}
+    for i in linked:
+        labels[i] = _find(parent, i)
+    return labels
+
+
+def _candidates(now, lookback_days):
+    return list(
+        Feedback.objects
+        .filter(is_complaint=True, status='pending', ward__isnull=False, created_at__gte=now - timedelta(days=lookback_days))
+        .order_by('ward_id', 'created_at', 'pk')
+        .values_list('pk', 'ward_id', 'created_at', 'subject', 'message', 'cluster_id')
+    )
+
+
+def cluster_complaints(now=None, threshold=None, window_hours=None, lookback_days=None):
+    """Recluster recent pending complaints; return (complaints, clusters). Unset options come from settings."""
+    now = now or timezone.now()
+    threshold = threshold if threshold is not None else _setting('FEEDBACK_CLUSTER_THRESHOLD', 0.5)
+    window_hours = window_hours if window_hours is not None else _setting('FEEDBACK_CLUSTER_WINDOW_HOURS', 72)
+    lookback_days = lookback_days if lookback_days is not None else _setting('FEEDBACK_CLUSTER_LOOKBACK_DAYS', 30)
+    rows = _candidates(now, lookback_days)
+    if not rows:
+        return 0, 0
+    pks, ward_ids, created, subjects, texts, current = zip(
+        *[(pk, ward, at, subject, f'{subject} {message}', cluster) for pk, ward, at, subject, message, cluster in rows]
+    )
+    groups = np.asarray(ward_ids, dtype=np.int64)
+    times = np.array([at.timestamp() for at in created])
+    pairs = similar_pairs(Vectors(texts), groups, times, window=window_hours * 3600, threshold=threshold)
+    labels = components(len(rows), pairs)
+
+    members = defaultdict(list)
+    for i, label in enumerate(labels.tolist()):
+        if label >= 0:
+            members[label].append(i)
+
+    with transaction.atomic():
+        # Largest first, so a split cluster keeps its id on its bigger part
+        taken, target = set(), [None] * len(rows)
+        for label, indexes in sorted(members.items(), key=lambda item: (-len(item[1]), item[0])):
+            votes = Counter(current[i] for i in indexes if current[i] is not None and current[i] not in taken)
+            if votes:
+                cluster_id = votes.most_common(1)[0][0]
+            else:
+                # The earliest complaint (the label is its row) names the cluster
+                cluster_id = FeedbackCluster.objects.create(ward_id=ward_ids[label], subject=subjects[label]).pk
+            taken.add(cluster_id)
+            for i in indexes:
+                target[i] = cluster_id
+
+        moves = defaultdict(list)
+        for i, cluster_id in enumerate(target):
+            if cluster_id != current[i]:
+                moves[cluster_id].append(pks[i])
+        for cluster_id, ids in moves.items():
+            for batch in range(0, len(ids), UPDATE_BATCH_SIZE):
+                Feedback.objects.filter(pk__in=ids[batch:batch + UPDATE_BATCH_SIZE]).update(cluster_id=cluster_id)
+        FeedbackCluster.objects.filter(pk__in=taken).update(updated_at=now)
+        FeedbackCluster.objects.filter(feedbacks__isnull=True).delete()
+    return len(rows), len(members)
+
+
+def resolve_cluster(cluster, response):
+    """Answer and resolve every pending complaint in `cluster`; return how many."""
+    # update() skips auto_now, so the sync API sees the change through updated_at
+    return Feedback.objects.filter(cluster=cluster, status='pending').update(
+        response=response, status='resolved', updated_at=timezone.now(),
+    )
@@ -1,8 +1,19 @@
 from django import forms
+from django.contrib.auth.forms import PasswordResetForm
 from django.contrib.auth.models import User
+from django.template import loader
 from django.core.exceptions import ValidationError
 from .models import Profile, PickupRequest, Ward, Panchayath, Reward, Feedback
+import uuid
 from datetime import datetime
+from decimal import Decimal
+from PIL import Image
+from django.core.files import File
+from .images import optimize_upload
+from .notifications import queue_email
+from .routing import parse_coordinates
+from .slots import local_date_time, ward_windows, window_for
+from .uploads import claim_completed_upload, upload_path
 
 class UserRegistrationForm(forms.ModelForm):
     password = forms.CharField(widget=forms.PasswordInput)
@@ -145,6 +156,12 @@ class PickupRequestForm(forms.ModelForm):
         label="Schedule Date and Time"
     )
 
+    upload_token = forms.UUIDField(required=False, widget=forms.HiddenInput)
+    # Read by the view before validation; see idempotency.py
+    idempotency_key = forms.CharField(
+        required=False, max_length=64, widget=forms.HiddenInput, initial=lambda: uuid.uuid4().hex,
+    )
+
     class Meta:
         model = PickupRequest
         fields = ['waste_type', 'description', 'image', 'schedule_date_time']
@@ -152,6 +169,16 @@ class PickupRequestForm(forms.ModelForm):
             'description': forms.Textarea(attrs={'rows': 4}),
         }
 
+    def clean_image(self):
+        image = self.cleaned_data.get('image')
+        # Only re-encode fresh uploads, not an already stored file
+        if image and hasattr(image, 'content_type'):
+            try:
+                image = optimize_upload(image)
+            except (OSError, Image.DecompressionBombError):
+                raise ValidationError("Upload a valid image.")
+        return image
+
     def clean_schedule_date_time(self):
         schedule_date_time = self.cleaned_data.get('schedule_date_time')
         if schedule_date_time:
@@ -159,9 +186,54 @@ class PickupRequestForm(forms.ModelForm):
             now = timezone.now()
             if schedule_date_time.date() < now.date():
                 raise ValidationError("Schedule date must be today or in the future.")
+            self.slot = self._find_slot(schedule_date_time)
         return schedule_date_time
 
-    def __init__(self, *args, **kwargs):
+    def _find_slot(self, schedule_date_time):
+        # Wards without slot definitions take pickups at any time
+        ward_id = Profile.objects.filter(user=self.user).values_list('ward_id', flat=True).first()
+        if ward_id is None:
+            return None
+        date, _ = local_date_time(schedule_date_time)
+        windows = ward_windows(ward_id, date.weekday())
+        if not windows:
+            return None
+        found = window_for(ward_id, schedule_date_time)
+        if found is None:
+            times = ', '.join(f"{w.start_time:%H:%M}-{w.end_time:%H:%M}" for w in windows)
+            raise ValidationError(f"Pick a time within one of your ward's collection slots that day: {times}.")
+        window, available = found
+        if not available:
+            raise ValidationError("That collection slot is full. Please pick another time.")
+        return window
+
+    def clean_upload_token(self):
+        token = self.cleaned_data.get('upload_token')
+        self.photo_upload = None
+        if token:
+            upload = claim_completed_upload(token, self.user)
+            if upload is None:
+                raise ValidationError("The photo upload has not finished yet.")
+            self.photo_upload = upload
+        return token
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = getattr(self, 'photo_upload', None)
+        # A chunked upload replaces the inline file; already-used tokens are
+        # handled by the view, which returns the original pickup.
+        if upload is not None and upload.status == 'complete' and not cleaned_data.get('image'):
+            with open(upload_path(upload), 'rb') as fp:
+                photo = File(fp, name=upload.filename)
+                try:
+                    cleaned_data['image'] = optimize_upload(photo)
+                except (OSError, Image.DecompressionBombError):
+                    self.add_error('upload_token', "Upload a valid image.")
+        return cleaned_data
+
+    def __init__(self, *args, user=None, **kwargs):
+        self.user = user
+        self.slot = None
         super().__init__(*args, **kwargs)
         # Apply consistent form classes for templates
         self.fields['waste_type'].widget.attrs.update({'class': 'form-select form-control'})
@@ -199,9 +271,32 @@ class UserProfileEditForm(forms.ModelForm):
 class ProfileEditForm(forms.ModelForm):
     class Meta:
         model = Profile
-        fields = ['mobile_number', 'location', 'ward']
+        fields = ['mobile_number', 'location', 'ward', 'latitude', 'longitude']
         widgets = {
             'mobile_number': forms.TextInput(attrs={'class': 'form-control'}),
             'location': forms.TextInput(attrs={'class': 'form-control'}),
             'ward': forms.Select(attrs={'class': 'form-select'}),
-        }
\ No newline at end of file
+            # Filled in by the page from the phone's location
+            'latitude': forms.HiddenInput(),
+            'longitude': forms.HiddenInput(),
+        }
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # A location typed as "lat, lng" doubles as the coordinates
+        coordinates = parse_coordinates(cleaned_data.get('location'))
+        if coordinates is not None and 'location' in self.changed_data:
+            cleaned_data['latitude'], cleaned_data['longitude'] = (
+                Decimal(str(round(value, 6))) for value in coordinates
+            )
+        return cleaned_data
+
+class OutboxPasswordResetForm(PasswordResetForm):
+    """Password reset that queues its mail in the notification outbox."""
+
+    def send_mail(self, subject_template_name, email_template_name, context,
+                  from_email, to_email, html_email_template_name=None):
+        subject = ''.join(loader.render_to_string(subject_template_name, context).splitlines())
+        body = loader.render_to_string(email_template_name, context)
+        html_body = loader.render_to_string(html_email_template_name, context) if html_email_template_name else ''
+        queue_email(to_email, subject, body, html_body=html_body, user=context.get('user'))
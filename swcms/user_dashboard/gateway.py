@@ -0,0 +1,230 @@
+"""
+Payment gateway adapter.
+
+RazorpayGateway talks to the Razorpay REST API over one pooled
+requests.Session per process, so orders reuse warm keep-alive connections
+instead of paying a TLS handshake each time. Every call has connect and read
+timeouts; connection errors, timeouts, 429s and 5xx responses are retried
+with capped exponential backoff and full jitter, and a CircuitBreaker stops
+calling a gateway that keeps failing so requests fail fast instead of piling
+up behind timeouts. Signature checks reuse a keyed HMAC prototype and only
+copy it per call. PAYMENT_GATEWAY_BASE_URL can point the adapter at the
+local stand-in server in mockgateway.py.
+"""
+import hashlib
+import hmac
+import logging
+import os
+import random
+import threading
+import time
+
+import requests
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class GatewayError(Exception):
+    """The gateway rejected a request or could not be reached."""
+
+
+class GatewayUnavailable(GatewayError):
+    """The circuit is open or retries were exhausted."""
+
+
+class CircuitBreaker:
+    """Open after `failure_threshold` consecutive failures.
+
+    While open, calls are refused until `reset_timeout` seconds have passed;
+    then a single trial call is let through (half-open) and its outcome
+    closes or re-opens the circuit.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if self.clock() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+def backoff_delay(attempt, base, cap, rng=random):
+    """Full-jitter backoff: uniform in [0, min(cap, base * 2**attempt)]."""
+    return rng.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class RazorpayGateway:
+
+    def __init__(self, key_id, key_secret, base_url='https://api.razorpay.com',
+                 connect_timeout=3.05, read_timeout=10.0, max_retries=2,
+                 backoff_base=0.2, backoff_cap=2.0, pool_size=10, breaker=None,
+                 sleep=time.sleep):
+        self.key_id = key_id
+        self.base_url = base_url.rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.pool_size = pool_size
+        self.breaker = breaker or CircuitBreaker()
+        self.sleep = sleep
+        self._auth = (key_id, key_secret)
+        # Keyed once; verify_* copy it instead of re-deriving the key pads
+        self._payment_mac = hmac.new(key_secret.encode(), digestmod=hashlib.sha256)
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        # Pooled sockets must not be shared with a forked child process
+        if self._session is None or self._session_pid != os.getpid():
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            session.auth = self._auth
+            self._session = session
+            self._session_pid = os.getpid()
+        return self._session
+
+    def _request(self, method, path, **kwargs):
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                raise GatewayUnavailable('Payment gateway circuit is open')
+            try:
+                response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+            except requests.RequestException as exc:
+                self.breaker.record_failure()
+                error = exc
+            except Exception:
+                # Whatever it was, don't leave a half-open breaker's trial outstanding
+                self.breaker.record_failure()
+                raise
+            else:
+                if response.status_code not in RETRY_STATUSES:
+                    # 4xx means the gateway is up and answered; don't trip the breaker
+                    self.breaker.record_success()
+                    if response.status_code >= 400:
+                        raise GatewayError(f'{method} {path} failed with {response.status_code}: {response.text[:200]}')
+                    try:
+                        return response.json()
+                    except ValueError:
+                        raise GatewayError(f'{method} {path} returned a body that is not JSON: {response.text[:200]}')
+                self.breaker.record_failure()
+                error = GatewayError(f'{method} {path} failed with {response.status_code}')
+            if attempt < self.max_retries:
+                self.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+        logger.warning('Payment gateway %s %s failed after %d attempts: %s',
+                       method, path, self.max_retries + 1, error)
+        raise GatewayUnavailable(str(error)) from error
+
+    def create_order(self, amount_paise, receipt, notes=None):
+        """Create an order and return the gateway's JSON for it.
+
+        Retrying after a read timeout can leave an extra unpaid order at the
+        gateway; those expire on their own and are never referenced here.
+        """
+        return self._request('POST', '/v1/orders', json={
+            'amount': amount_paise,
+            'currency': 'INR',
+            'receipt': receipt,
+            'notes': notes or {},
+        })
+
+    def fetch_order(self, order_id):
+        return self._request('GET', f'/v1/orders/{order_id}')
+
+    def settlement_report(self, day, count=100, skip=0):
+        """Return one page of the combined settlement report for `day`."""
+        return self._request('GET', '/v1/settlements/recon/combined', params={
+            'year': day.year, 'month': day.month, 'day': day.day, 'count': count, 'skip': skip,
+        })
+
+    def verify_payment_signature(self, order_id, payment_id, signature):
+        """Check the checkout handler's signature over "order_id|payment_id"."""
+        if not (order_id and payment_id and signature):
+            return False
+        mac = self._payment_mac.copy()
+        mac.update(f'{order_id}|{payment_id}'.encode())
+        return hmac.compare_digest(mac.hexdigest(), signature)
+
+
+def verify_webhook_signature(body, signature, secret):
+    """Check an X-Razorpay-Signature header against the raw request body."""
+    if not signature or not secret:
+        return False
+    expected = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+
+def get_gateway():
+    """Return the process-wide gateway configured from settings."""
+    global _gateway
+    if _gateway is None:
+        with _gateway_lock:
+            if _gateway is None:
+                _gateway = RazorpayGateway(
+                    settings.RAZORPAY_KEY_ID,
+                    settings.RAZORPAY_KEY_SECRET,
+                    base_url=getattr(settings, 'PAYMENT_GATEWAY_BASE_URL', 'https://api.razorpay.com'),
+                    connect_timeout=getattr(settings, 'PAYMENT_GATEWAY_CONNECT_TIMEOUT', 3.05),
+                    read_timeout=getattr(settings, 'PAYMENT_GATEWAY_READ_TIMEOUT', 10.0),
+                    max_retries=getattr(settings, 'PAYMENT_GATEWAY_MAX_RETRIES', 2),
+                    breaker=CircuitBreaker(
+                        failure_threshold=getattr(settings, 'PAYMENT_GATEWAY_BREAKER_THRESHOLD', 5),
+                        reset_timeout=getattr(settings, 'PAYMENT_GATEWAY_BREAKER_RESET', 30.0),
+                    ),
+                )
+    return _gateway
+
+
+@receiver(setting_changed)
+def reset_gateway(*, setting, **kwargs):
+    """Rebuild the gateway when tests override its settings."""
+    global _gateway
+    if setting.startswith(('PAYMENT_GATEWAY_', 'RAZORPAY_')):
+        _gateway = None
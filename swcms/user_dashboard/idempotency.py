@@ -0,0 +1,64 @@
+"""
+Idempotent pickup submission.
+
+The request form carries a random key generated when the page is rendered
+(API clients may send an `Idempotency-Key` header instead). The first
+submission claims the key by inserting an IdempotencyKey row in the same
+transaction that creates the pickup and its pending payment, so a concurrent
+duplicate blocks on the unique constraint and then finds the committed row.
+Later retries with the same key are answered from that row without writing
+anything. Keys older than IDEMPOTENCY_KEY_TTL are ignored and purged.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+MAX_KEY_LENGTH = 64
+
+
+def key_ttl():
+    return getattr(settings, 'IDEMPOTENCY_KEY_TTL', timedelta(hours=24))
+
+
+def request_key(request):
+    """Return the idempotency key sent with a request, or None."""
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key', '')
+    key = key.strip()
+    if not key or len(key) > MAX_KEY_LENGTH:
+        return None
+    return key
+
+
+def previous_pickup_id(user, key):
+    """Return the pickup id an earlier submission with this key created."""
+    return (
+        IdempotencyKey.objects
+        .filter(user=user, key=key, created_at__gte=timezone.now() - key_ttl())
+        .values_list('pickup_request_id', flat=True)
+        .first()
+    )
+
+
+def claim_key(user, key):
+    """Insert the key row; return None if another submission already holds it."""
+    # An expired row for the same key must not block its reuse
+    IdempotencyKey.objects.filter(user=user, key=key, created_at__lt=timezone.now() - key_ttl()).delete()
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(user=user, key=key)
+    except IntegrityError:
+        return None
+
+
+def purge_expired_keys(limit=500):
+    """Delete a bounded batch of expired keys; called opportunistically."""
+    expired = (
+        IdempotencyKey.objects
+        .filter(created_at__lt=timezone.now() - key_ttl())
+        .values_list('pk', flat=True)[:limit]
+    )
+    return IdempotencyKey.objects.filter(pk__in=list(expired)).delete()[0]
@@ -0,0 +1,95 @@
+"""
+Pickup photo pipeline.
+
+optimize_upload() runs synchronously while the pickup form is validated: it
+applies the EXIF orientation, drops all metadata and re-encodes the photo as
+a progressive JPEG no larger than MAX_DIMENSION. build_variants() then writes
+fixed-width JPEG and WebP renditions next to it and records them in
+PickupRequest.image_variants; schedule_variants() queues that step as the
+build_image_variants job, which the job workers run once the pickup has been
+committed.
+"""
+import io
+from pathlib import PurePosixPath
+
+from django.core.files.base import ContentFile
+from PIL import Image, ImageOps
+
+MAX_DIMENSION = 1600
+VARIANT_WIDTHS = (320, 640)
+JPEG_QUALITY = 82
+WEBP_QUALITY = 75
+VARIANT_DIR = 'pickup_images/variants'
+
+
+def _load_rgb(fp):
+    image = Image.open(fp)
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def _encode(image, fmt, quality):
+    buffer = io.BytesIO()
+    if fmt == 'jpeg':
+        image.save(buffer, 'JPEG', quality=quality, optimize=True, progressive=True)
+    else:
+        image.save(buffer, 'WEBP', quality=quality, method=4)
+    return buffer.getvalue()
+
+
+def optimize_upload(uploaded_file):
+    """Return a downscaled, metadata-free JPEG copy of an uploaded photo."""
+    uploaded_file.seek(0)
+    image = _load_rgb(uploaded_file)
+    image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.LANCZOS)
+    stem = PurePosixPath(uploaded_file.name).stem or 'pickup'
+    return ContentFile(_encode(image, 'jpeg', JPEG_QUALITY), name=f'{stem}.jpg')
+
+
+def _replace(storage, name, content):
+    """Save content under exactly `name`, overwriting an older rendition."""
+    if storage.exists(name):
+        storage.delete(name)
+    return storage.save(name, ContentFile(content))
+
+
+def build_variants(pickup):
+    """Write JPEG/WebP renditions of pickup.image and record them on the row."""
+    if not pickup.image:
+        return {}
+    storage = pickup.image.storage
+    with pickup.image.open('rb') as fp:
+        original = _load_rgb(fp)
+
+    # Variants are named after the pickup's request_id so media access
+    # control can find the owning pickup from the file name alone.
+    stem = pickup.request_id.hex
+    variants = {}
+    widths = [w for w in VARIANT_WIDTHS if w < original.width] + [original.width]
+    for width in widths:
+        if width == original.width:
+            resized = original
+            entry = {'jpeg': pickup.image.name}
+        else:
+            height = max(1, round(original.height * width / original.width))
+            resized = original.resize((width, height), Image.LANCZOS)
+            entry = {'jpeg': _replace(storage, f'{VARIANT_DIR}/{stem}_{width}.jpg',
+                                      _encode(resized, 'jpeg', JPEG_QUALITY))}
+        entry['webp'] = _replace(storage, f'{VARIANT_DIR}/{stem}_{width}.webp',
+                                 _encode(resized, 'webp', WEBP_QUALITY))
+        variants[str(width)] = entry
+
+    # update() so building variants does not bump updated_at
+    type(pickup).objects.filter(pk=pickup.pk).update(image_variants=variants)
+    pickup.image_variants = variants
+    return variants
+
+
+def schedule_variants(pickup):
+    """Queue the variants of a pickup's photo, to be built once it is committed."""
+    if pickup.image:
+        # Imported here: tasks imports this module
+        from .tasks import build_image_variants
+        build_image_variants.enqueue(dedup_key=f'image-variants-{pickup.pk}', pickup_id=pickup.pk)
@@ -0,0 +1,265 @@
+"""
+Live worker dashboard updates over Server-Sent Events.
+
+Every pickup transition calls publish_pickup_changes() inside its
+transaction, which appends a compact PickupEvent row (pickup, status,
+payment status) for the pickup's ward. worker_events_view is an async view,
+served by swcms/asgi.py, that streams a ward's events to the worker
+dashboard, where rows are patched in place instead of reloading the page.
+
+The async ORM runs queries on one shared thread, so streams never query on
+their own while idle: a WardBroadcaster per event loop polls once per
+LIVE_POLL_INTERVAL for new events in every ward with a listener and fans
+them out to the subscribers' queues. A (re)connecting client sends the last
+id it saw (Last-Event-ID, or ?after= from the page) and first gets what it
+missed with one indexed query; if that is too much, or already purged, it
+is told to reload. Heartbeats carry the current position, so a quiet ward's
+reconnect does not look like a gap. Event ids are assigned at insert, not
+commit, so the broadcaster keeps re-reading events newer than
+LIVE_SETTLE_SECONDS and the catch-up also covers that window; both skip
+what they already sent. Under WSGI the view answers 204, which
+stops EventSource retrying, and the dashboard behaves as before.
+"""
+import asyncio
+import json
+import logging
+import weakref
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, HttpResponseForbidden, StreamingHttpResponse
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import PickupEvent, PickupRequest, Profile
+
+logger = logging.getLogger(__name__)
+
+RESET = 'event: reset\ndata: {}\n\n'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+# Publishing
+
+def publish_pickup_changes(pickup_ids):
+    """Record the current state of each pickup for its ward's dashboards."""
+    rows = (
+        PickupRequest.objects.filter(pk__in=pickup_ids, user__profile__ward__isnull=False)
+        .values_list('pk', 'status', 'user__profile__ward_id', 'payment__status')
+    )
+    PickupEvent.objects.bulk_create([
+        PickupEvent(pickup_id=pk, status=status, ward_id=ward_id, payment_status=payment_status or '')
+        for pk, status, ward_id, payment_status in rows
+    ])
+
+
+def publish_pickup_change(pickup):
+    publish_pickup_changes([pickup.pk])
+
+
+def latest_event_id():
+    return PickupEvent.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def purge_old_events(limit=5000):
+    """Delete one batch of events older than LIVE_EVENT_RETENTION; return the count."""
+    cutoff = timezone.now() - _setting('LIVE_EVENT_RETENTION', timedelta(hours=1))
+    ids = list(PickupEvent.objects.filter(created_at__lt=cutoff).order_by('id').values_list('id', flat=True)[:limit])
+    if not ids:
+        return 0
+    return PickupEvent.objects.filter(id__in=ids).delete()[0]
+
+
+# Fan-out
+
+class Subscription:
+
+    def __init__(self, ward_id, maxsize):
+        self.ward_id = ward_id
+        self.queue = asyncio.Queue(maxsize)
+        self.overflowed = False
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client can't keep up; it will be told to reload
+            self.overflowed = True
+
+
+class WardBroadcaster:
+    """Poll new events for all listening wards and hand them to subscribers."""
+
+    def __init__(self, interval=None, batch_size=None):
+        self.interval = interval or _setting('LIVE_POLL_INTERVAL', 1.0)
+        self.batch_size = batch_size or _setting('LIVE_BATCH_SIZE', 500)
+        self.subscribers = {}
+        # Every event up to the cursor has been handed out; past it, those in `delivered` have
+        self.cursor = None
+        self.delivered = set()
+        self._task = None
+
+    def subscribe(self, ward_id, after):
+        subscription = Subscription(ward_id, self.batch_size)
+        self.subscribers.setdefault(ward_id, set()).add(subscription)
+        if self.cursor is None:
+            self.cursor = after
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        listeners = self.subscribers.get(subscription.ward_id, set())
+        listeners.discard(subscription)
+        if not listeners:
+            self.subscribers.pop(subscription.ward_id, None)
+        if not self.subscribers and self._task is not None:
+            self._task.cancel()
+            self._task = None
+            self.cursor = None
+            self.delivered = set()
+
+    async def poll_once(self):
+        if not self.subscribers:
+            return 0
+        settled = timezone.now() - timedelta(seconds=_setting('LIVE_SETTLE_SECONDS', 5))
+        events = [
+            event async for event in
+            PickupEvent.objects.filter(id__gt=self.cursor, ward_id__in=list(self.subscribers)).order_by('id')[:self.batch_size]
+        ]
+        # No await from here on: once the cursor moves, everything up to it is queued
+        fresh = [event for event in events if event.id not in self.delivered]
+        for event in fresh:
+            self.delivered.add(event.id)
+            for subscription in self.subscribers.get(event.ward_id, ()):
+                subscription.put(event)
+        # Ids are taken at insert, not commit, so a lower one can still turn
+        # up while its transaction is open; the cursor only passes events
+        # older than LIVE_SETTLE_SECONDS and the rest are read again
+        for event in events:
+            if event.created_at > settled:
+                break
+            self.cursor = event.id
+        self.delivered = {event_id for event_id in self.delivered if event_id > self.cursor}
+        return len(fresh)
+
+    async def _run(self):
+        while True:
+            try:
+                await self.poll_once()
+            except Exception:
+                logger.exception('Polling pickup events failed')
+            await asyncio.sleep(self.interval)
+
+
+_broadcasters = weakref.WeakKeyDictionary()
+
+
+def get_broadcaster():
+    loop = asyncio.get_running_loop()
+    broadcaster = _broadcasters.get(loop)
+    if broadcaster is None:
+        broadcaster = _broadcasters[loop] = WardBroadcaster()
+    return broadcaster
+
+
+# Streaming
+
+def format_event(event):
+    data = json.dumps(
+        {'pickup': event.pickup_id, 'status': event.status, 'payment': event.payment_status},
+        separators=(',', ':'),
+    )
+    return f'id: {event.id}\nevent: pickup\ndata: {data}\n\n'
+
+
+async def event_stream(ward_id, after, broadcaster=None):
+    """Yield SSE messages for a ward, starting after event id `after`."""
+    broadcaster = broadcaster or get_broadcaster()
+    heartbeat = _setting('LIVE_HEARTBEAT_SECONDS', 15)
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + _setting('LIVE_STREAM_SECONDS', 300)
+    # Subscribe before catching up so nothing falls between the two
+    subscription = broadcaster.subscribe(ward_id, after)
+    try:
+        yield f'retry: {_setting("LIVE_RETRY_MS", 3000)}\n\n'
+        if after and not await PickupEvent.objects.filter(id__lte=after).aexists():
+            # Events after `after` may already have been purged
+            yield RESET
+            return
+        # Also the last few seconds before `after`, in case a lower id committed after the client saw it
+        recent = timezone.now() - timedelta(seconds=_setting('LIVE_SETTLE_SECONDS', 5))
+        backlog = [
+            event async for event in
+            PickupEvent.objects.filter(Q(id__gt=after) | Q(created_at__gte=recent), ward_id=ward_id)
+            .order_by('id')[:broadcaster.batch_size + 1]
+        ]
+        if len(backlog) > broadcaster.batch_size:
+            yield RESET
+            return
+        last = after
+        sent = set()
+        for event in backlog:
+            last = max(last, event.id)
+            sent.add(event.id)
+            yield format_event(event)
+
+        while True:
+            if subscription.overflowed:
+                yield RESET
+                return
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Let the client reconnect, so long-lived connections get rebalanced
+                return
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), min(heartbeat, remaining))
+            except asyncio.TimeoutError:
+                last = max(last, broadcaster.cursor or 0)
+                sent = {event_id for event_id in sent if event_id > (broadcaster.cursor or 0)}
+                yield f'id: {last}\n\n'
+                continue
+            # The broadcaster may relay what the catch-up already sent, or an
+            # id below the last one sent that committed late
+            if event.id not in sent:
+                sent.add(event.id)
+                last = max(last, event.id)
+                yield format_event(event)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+def _resume_point(request):
+    for value in (request.headers.get('Last-Event-ID'), request.GET.get('after')):
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+@login_required
+async def worker_events_view(request):
+    """Stream pickup changes in the worker's ward as text/event-stream."""
+    if not isinstance(request, ASGIRequest):
+        # A WSGI worker would be tied up for the whole stream
+        return HttpResponse(status=204)
+    user = await request.auser()
+    ward_id = await (
+        Profile.objects.filter(user_id=user.pk, role='worker', ward__isnull=False)
+        .values_list('ward_id', flat=True).afirst()
+    )
+    if ward_id is None:
+        return HttpResponseForbidden()
+    after = _resume_point(request)
+    if after is None:
+        after = await PickupEvent.objects.order_by('-id').values_list('id', flat=True).afirst() or 0
+    response = StreamingHttpResponse(event_stream(ward_id, after), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,238 @@
+"""
+Local multi-process load-test harness.
+
+serve() pre-forks several processes that each run swcms.wsgi.application in
+a threaded wsgiref server on one shared listening socket, so requests really
+hit the database concurrently. run_clients() spreads virtual residents,
+workers and admins over several driver processes; each virtual user is a
+thread replaying its role's scenario against localhost until the deadline.
+Every step is timed and summarize() reduces the samples to throughput, error
+rate and latency percentiles per scenario step.
+"""
+import http.cookiejar
+import multiprocessing
+import random
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import timedelta
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer
+
+from django.db import connections
+from django.utils import timezone
+
+class _ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+def _serve_on_socket(listen_socket):
+    from swcms.wsgi import application
+
+    server = _ThreadingWSGIServer(listen_socket.getsockname(), _QuietHandler, bind_and_activate=False)
+    server.socket.close()
+    server.socket = listen_socket
+    server.server_name, server.server_port = listen_socket.getsockname()[:2]
+    server.setup_environ()
+    server.set_app(application)
+    server.serve_forever()
+
+
+def serve(port, workers):
+    """Start `workers` server processes on 127.0.0.1:port; return them."""
+    listen_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listen_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listen_socket.bind(('127.0.0.1', port))
+    listen_socket.listen(1024)
+
+    # Forked children must not share the parent's database connections
+    connections.close_all()
+    context = multiprocessing.get_context('fork')
+    processes = []
+    for _ in range(workers):
+        process = context.Process(target=_serve_on_socket, args=(listen_socket,), daemon=True)
+        process.start()
+        processes.append(process)
+    listen_socket.close()
+    return processes
+
+
+def wait_until_ready(base_url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/login/', timeout=2).read()
+            return True
+        except (urllib.error.URLError, ConnectionError):
+            time.sleep(0.2)
+    return False
+
+
+class VirtualUser:
+    """A cookie-carrying HTTP client that records one sample per step."""
+
+    def __init__(self, base_url, scenario, samples):
+        self.base_url = base_url
+        self.scenario = scenario
+        self.samples = samples
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies))
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == 'csrftoken':
+                return cookie.value
+        return ''
+
+    def request(self, step, path, data=None, expect_login=False):
+        if data is not None:
+            data = dict(data, csrfmiddlewaretoken=self.csrf_token())
+            data = urllib.parse.urlencode(data).encode()
+        start = time.perf_counter()
+        body = b''
+        try:
+            with self.opener.open(self.base_url + path, data=data, timeout=60) as response:
+                body = response.read()
+                final_url = response.geturl()
+            # Being bounced to the login page means the step did not happen
+            ok = expect_login or '/login/' not in final_url
+        except (urllib.error.URLError, ConnectionError, TimeoutError, socket.timeout):
+            ok = False
+        self.samples.append((self.scenario, step, time.perf_counter() - start, ok))
+        return body
+
+    def login(self, username, password):
+        self.request('login_page', '/login/', expect_login=True)
+        self.request('login', '/login/', {'username': username, 'password': password})
+
+
+def resident_scenario(user, account, rng):
+    user.request('index', '/')
+    user.request('request_pickup_page', '/request-pickup/')
+    when = timezone.localtime() + timedelta(days=rng.randint(0, 7), hours=rng.randint(1, 12))
+    user.request('request_pickup', '/request-pickup/', {
+        'waste_type': rng.choice(['wet', 'dry', 'plastic', 'e-waste', 'recyclable']),
+        'description': 'Load test pickup',
+        'schedule_date_time': when.strftime('%Y-%m-%dT%H:%M'),
+        'idempotency_key': '%032x' % rng.getrandbits(128),
+    })
+    user.request('request_management', '/request-management/')
+
+
+def worker_scenario(user, account, rng):
+    user.request('worker_dashboard', '/worker-dashboard/')
+    if account['pickups']:
+        pk = account['pickups'].pop()
+        user.request('mark_picked', f'/mark-picked/{pk}/')
+        user.request('mark_completed', f'/mark-completed/{pk}/', {
+            'waste_weight': f'{rng.uniform(0.5, 25):.2f}',
+        })
+
+
+def admin_scenario(user, account, rng):
+    user.request('admin_dashboard', '/admin-dashboard/')
+    user.request('admin_users', '/admin-users/')
+    user.request('admin_rewards', '/admin-rewards/')
+
+
+SCENARIOS = {
+    'resident': resident_scenario,
+    'worker': worker_scenario,
+    'admin': admin_scenario,
+}
+
+
+def _run_virtual_user(base_url, account, password, deadline, think_time, seed, samples):
+    rng = random.Random(seed)
+    user = VirtualUser(base_url, account['scenario'], samples)
+    user.login(account['username'], password)
+    scenario = SCENARIOS[account['scenario']]
+    while time.monotonic() < deadline:
+        scenario(user, account, rng)
+        if think_time:
+            time.sleep(rng.expovariate(1 / think_time))
+
+
+def _driver_process(base_url, accounts, password, duration, think_time, seed, queue):
+    samples = []
+    deadline = time.monotonic() + duration
+    threads = [
+        threading.Thread(
+            target=_run_virtual_user,
+            args=(base_url, account, password, deadline, think_time, seed + i, samples),
+            daemon=True,
+        )
+        for i, account in enumerate(accounts)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.put(samples)
+
+
+def run_clients(base_url, accounts, password, duration, processes, think_time, seed=0):
+    """Drive `accounts` from `processes` driver processes.
+
+    Returns the samples and the wall-clock seconds the run actually took,
+    which exceeds `duration` when logins or the last requests are slow.
+    """
+    context = multiprocessing.get_context('fork')
+    queue = context.Queue()
+    chunks = [accounts[i::processes] for i in range(processes)]
+    drivers = [
+        context.Process(
+            target=_driver_process,
+            args=(base_url, chunk, password, duration, think_time, seed + n * 100003, queue),
+        )
+        for n, chunk in enumerate(chunks) if chunk
+    ]
+    started = time.monotonic()
+    for driver in drivers:
+        driver.start()
+    samples = []
+    for _ in drivers:
+        samples.extend(queue.get())
+    for driver in drivers:
+        driver.join()
+    return samples, time.monotonic() - started
+
+
+def _percentile(ordered, pct):
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+def summarize(samples, elapsed):
+    """Reduce raw samples to per-(scenario, step) statistics."""
+    grouped = defaultdict(list)
+    errors = defaultdict(int)
+    for scenario, step, latency, ok in samples:
+        grouped[(scenario, step)].append(latency)
+        if not ok:
+            errors[(scenario, step)] += 1
+    report = []
+    for (scenario, step), timings in sorted(grouped.items()):
+        timings.sort()
+        report.append({
+            'scenario': scenario,
+            'step': step,
+            'requests': len(timings),
+            'errors': errors[(scenario, step)],
+            'error_rate': errors[(scenario, step)] / len(timings),
+            'throughput': len(timings) / elapsed,
+            'p50_ms': _percentile(timings, 50) * 1000,
+            'p95_ms': _percentile(timings, 95) * 1000,
+            'p99_ms': _percentile(timings, 99) * 1000,
+        })
+    return report
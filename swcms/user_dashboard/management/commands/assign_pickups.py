@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from user_dashboard.assignment import assign_pending, rebalance_ward
+from user_dashboard.models import Ward
+
+
+class Command(BaseCommand):
+    help = "Assign pending pickups to on-duty workers, or redistribute them with --rebalance."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebalance', action='store_true',
+                            help="Take back every pending pickup and share them out again.")
+        parser.add_argument('--ward', type=int, action='append', dest='wards',
+                            help="Ward id to rebalance (repeatable); all wards by default.")
+
+    def handle(self, *args, **options):
+        if not options['rebalance']:
+            self.stdout.write(self.style.SUCCESS(f"Assigned {assign_pending()} pickups."))
+            return
+        ward_ids = options['wards'] or Ward.objects.values_list('pk', flat=True)
+        total = 0
+        for ward_id in ward_ids:
+            total += rebalance_ward(ward_id)
+        self.stdout.write(self.style.SUCCESS(f"Reassigned {total} pending pickups."))
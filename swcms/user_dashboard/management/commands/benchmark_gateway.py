@@ -0,0 +1,44 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user_dashboard.gateway import RazorpayGateway
+from user_dashboard.mockgateway import MockGatewayServer
+
+
+class Command(BaseCommand):
+    help = "Time order creation and signature checks against the local mock gateway."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=500)
+        parser.add_argument('--signatures', type=int, default=100000)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help="Simulated gateway latency per request, in seconds.")
+
+    def handle(self, *args, **options):
+        key_id, key_secret = settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET
+        server = MockGatewayServer(key_id, key_secret, delay=options['delay']).start()
+        try:
+            pooled = RazorpayGateway(key_id, key_secret, base_url=server.base_url)
+            self._time_orders('pooled session', options['orders'], lambda: pooled)
+            # A new gateway per call means a new connection per order
+            self._time_orders('session per call', options['orders'],
+                              lambda: RazorpayGateway(key_id, key_secret, base_url=server.base_url))
+        finally:
+            server.stop()
+
+        gateway = RazorpayGateway(key_id, key_secret)
+        count = options['signatures']
+        started = time.perf_counter()
+        for i in range(count):
+            gateway.verify_payment_signature('order_bench', f'pay_{i}', '0' * 64)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{'signature checks':<18} {count / elapsed:>10.0f}/s  {elapsed / count * 1e6:>8.2f} us each")
+
+    def _time_orders(self, label, count, gateway_for):
+        started = time.perf_counter()
+        for i in range(count):
+            gateway_for().create_order(10000, f'bench-{i}')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"{label:<18} {count / elapsed:>10.0f}/s  {elapsed / count * 1e3:>8.2f} ms each")
@@ -0,0 +1,41 @@
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand
+
+from user_dashboard.routing import Distances, nearest_neighbour, route_length, two_opt
+
+
+class Command(BaseCommand):
+    help = "Time nearest-neighbour and 2-opt route planning on random ward-sized stop sets."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--stops', type=int, nargs='+', default=[50, 500, 5000])
+        parser.add_argument('--time-budget', type=float, default=None,
+                            help="Seconds allowed for 2-opt; unlimited by default.")
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        rng = np.random.default_rng(options['seed'])
+        self.stdout.write(f"{'stops':>6} {'nn km':>9} {'2-opt km':>9} {'gain':>6} {'nn s':>7} {'2-opt s':>8} {'passes':>6}")
+        for count in options['stops']:
+            # Roughly a 5 km square ward
+            lat = 12.97 + rng.random(count) * 0.045
+            lng = 77.59 + rng.random(count) * 0.045
+            started = time.perf_counter()
+            distances = Distances(lat, lng)
+            order = nearest_neighbour(distances, 0)
+            nn_elapsed = time.perf_counter() - started
+            nn_length = route_length(order, distances)
+
+            started = time.perf_counter()
+            deadline = None if options['time_budget'] is None else started + options['time_budget']
+            order, passes = two_opt(order, distances, deadline=deadline)
+            opt_elapsed = time.perf_counter() - started
+            opt_length = route_length(order, distances)
+
+            gain = 1 - opt_length / nn_length if nn_length else 0.0
+            self.stdout.write(
+                f"{count:>6} {nn_length:>9.2f} {opt_length:>9.2f} {gain:>6.1%} "
+                f"{nn_elapsed:>7.3f} {opt_elapsed:>8.3f} {passes:>6}"
+            )
@@ -0,0 +1,157 @@
+import json
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from user_dashboard.metrics import QueryTracker
+from user_dashboard.models import Profile, PickupRequest
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+class _Rollback(Exception):
+    """Raised to undo whatever a benchmarked request wrote."""
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class Command(BaseCommand):
+    help = "Benchmark the hot dashboard views and compare against a JSON baseline."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--warmup', type=int, default=2)
+        parser.add_argument('--baseline', default=str(DEFAULT_BASELINE))
+        parser.add_argument('--tolerance', type=float, default=0.25,
+                            help="Allowed relative p95 latency increase before failing.")
+        parser.add_argument('--update-baseline', action='store_true',
+                            help="Write the measured results as the new baseline.")
+
+    def handle(self, *args, **options):
+        scenarios = self._scenarios()
+        # The test client needs the test environment (ALLOWED_HOSTS etc.);
+        # it is already in place when this runs from the test suite.
+        try:
+            setup_test_environment()
+            owns_environment = True
+        except RuntimeError:
+            owns_environment = False
+        try:
+            results = {
+                name: self._measure(login_user, method, url, data, options['iterations'], options['warmup'])
+                for name, login_user, method, url, data in scenarios
+            }
+        finally:
+            if owns_environment:
+                teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<24} p50={result['p50_ms']:8.2f}ms p95={result['p95_ms']:8.2f}ms "
+                f"p99={result['p99_ms']:8.2f}ms queries={result['queries']}"
+            )
+
+        baseline_path = Path(options['baseline'])
+        if options['update_baseline']:
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(results, indent=2, sort_keys=True) + '\n')
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {baseline_path}; run with --update-baseline to create one."
+            ))
+            return
+
+        regressions = self._compare(json.loads(baseline_path.read_text()), results, options['tolerance'])
+        if regressions:
+            raise CommandError("Benchmark regressions:\n" + '\n'.join(regressions))
+        self.stdout.write(self.style.SUCCESS("No regressions against baseline."))
+
+    def _scenarios(self):
+        """Pick actors and records from the current database for each hot view."""
+        resident = Profile.objects.filter(role='user', user__pickuprequest__isnull=False).select_related('user').first()
+        admin = Profile.objects.filter(role='admin').select_related('user').first()
+        picked = PickupRequest.objects.filter(status='picked', user__profile__ward__isnull=False).first()
+        completed = PickupRequest.objects.filter(status='completed', user__profile__ward__isnull=False).first()
+        if not (resident and admin and picked and completed):
+            raise CommandError("Not enough data to benchmark. Run `manage.py seed_scale` first.")
+
+        worker = Profile.objects.filter(role='worker', ward=picked.user.profile.ward).select_related('user').first()
+        receipt_worker = Profile.objects.filter(role='worker', ward=completed.user.profile.ward).select_related('user').first()
+        if not (worker and receipt_worker):
+            raise CommandError("No worker is assigned to the benchmark wards.")
+
+        return [
+            ('index', resident.user, 'get', reverse('index'), None),
+            ('worker_dashboard_view', worker.user, 'get', reverse('worker_dashboard'), None),
+            ('admin_dashboard_view', admin.user, 'get', reverse('admin_dashboard'), None),
+            ('admin_rewards_view', admin.user, 'get', reverse('admin_rewards'), None),
+            ('admin_feedbacks_search', admin.user, 'get', reverse('admin_feedbacks'), {'q': 'overflowing bin'}),
+            ('mark_completed_view', worker.user, 'post', reverse('mark_completed', args=[picked.pk]), {'waste_weight': '4.50'}),
+            ('print_receipt_view', receipt_worker.user, 'get', reverse('print_receipt', args=[completed.pk]), None),
+        ]
+
+    def _measure(self, login_user, method, url, data, iterations, warmup):
+        client = Client()
+        client.force_login(login_user)
+        timings = []
+        query_counts = []
+        for i in range(warmup + iterations):
+            # Each request runs in a rolled-back transaction so writing views
+            # such as mark_completed see identical state on every iteration.
+            tracker = QueryTracker()
+            try:
+                with transaction.atomic():
+                    with connection.execute_wrapper(tracker):
+                        start = time.perf_counter()
+                        response = getattr(client, method)(url, data or {})
+                        elapsed = time.perf_counter() - start
+                    raise _Rollback
+            except _Rollback:
+                pass
+            if response.status_code >= 400:
+                raise CommandError(f"{url} returned HTTP {response.status_code}")
+            if i >= warmup:
+                timings.append(elapsed * 1000)
+                query_counts.append(tracker.count)
+        return {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'mean_ms': round(statistics.fmean(timings), 3),
+            'queries': max(query_counts),
+        }
+
+    @staticmethod
+    def _compare(baseline, results, tolerance):
+        regressions = []
+        for name, result in results.items():
+            expected = baseline.get(name)
+            if expected is None:
+                continue
+            allowed_ms = expected['p95_ms'] * (1 + tolerance)
+            if result['p95_ms'] > allowed_ms:
+                regressions.append(
+                    f"{name}: p95 {result['p95_ms']:.2f}ms exceeds {allowed_ms:.2f}ms "
+                    f"(baseline {expected['p95_ms']:.2f}ms)"
+                )
+            if result['queries'] > expected['queries']:
+                regressions.append(
+                    f"{name}: {result['queries']} queries, baseline {expected['queries']}"
+                )
+        return regressions
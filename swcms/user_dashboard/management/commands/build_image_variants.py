@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from user_dashboard.images import build_variants
+from user_dashboard.models import PickupRequest
+
+
+class Command(BaseCommand):
+    help = "Generate thumbnail and WebP variants for pickup photos that lack them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help="Rebuild variants even for pickups that already have them.")
+
+    def handle(self, *args, **options):
+        pickups = PickupRequest.objects.exclude(image='').exclude(image__isnull=True)
+        if not options['all']:
+            pickups = pickups.filter(image_variants={})
+
+        built = failed = 0
+        for pickup in pickups.only('pk', 'image', 'image_variants').iterator(chunk_size=200):
+            try:
+                build_variants(pickup)
+                built += 1
+            except (OSError, ValueError) as exc:
+                failed += 1
+                self.stderr.write(f"Pickup {pickup.pk}: {exc}")
+        self.stdout.write(self.style.SUCCESS(f"Built variants for {built} pickups ({failed} failed)."))
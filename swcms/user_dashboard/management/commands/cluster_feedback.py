@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user_dashboard.clustering import cluster_complaints
+
+
+class Command(BaseCommand):
+    help = "Group near-identical pending complaints per ward so they can be resolved together."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threshold', type=float,
+                            help="Cosine similarity needed to pair two complaints (FEEDBACK_CLUSTER_THRESHOLD).")
+        parser.add_argument('--window-hours', type=float,
+                            help="How far apart two duplicates may be filed (FEEDBACK_CLUSTER_WINDOW_HOURS).")
+        parser.add_argument('--lookback-days', type=int,
+                            help="How far back to look for pending complaints (FEEDBACK_CLUSTER_LOOKBACK_DAYS).")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        complaints, clusters = cluster_complaints(
+            threshold=options['threshold'],
+            window_hours=options['window_hours'],
+            lookback_days=options['lookback_days'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Grouped {complaints} pending complaints into {clusters} clusters "
+            f"in {time.perf_counter() - started:.1f}s."
+        ))
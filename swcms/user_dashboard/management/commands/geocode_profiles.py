@@ -0,0 +1,59 @@
+import time
+
+import requests
+from django.core.management.base import BaseCommand
+
+from user_dashboard.models import Profile
+from user_dashboard.routing import parse_coordinates
+
+
+class Command(BaseCommand):
+    help = "Fill in household coordinates from their location text for route planning."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--geocoder-url', default='',
+                            help="Nominatim-compatible search URL for free-text addresses, "
+                                 "e.g. https://nominatim.openstreetmap.org/search")
+        parser.add_argument('--delay', type=float, default=1.0,
+                            help="Seconds between geocoder requests.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--overwrite', action='store_true',
+                            help="Also redo profiles that already have coordinates.")
+
+    def handle(self, *args, **options):
+        profiles = Profile.objects.exclude(location__isnull=True).exclude(location='')
+        if not options['overwrite']:
+            profiles = profiles.filter(latitude__isnull=True)
+        session = requests.Session() if options['geocoder_url'] else None
+        if session is not None:
+            session.headers['User-Agent'] = 'swcms-geocoder'
+
+        pending, updated, missed = [], 0, 0
+        for profile in profiles.only('pk', 'location').iterator(chunk_size=options['batch_size']):
+            point = parse_coordinates(profile.location)
+            if point is None and session is not None:
+                point = self._lookup(session, options['geocoder_url'], profile.location)
+                time.sleep(options['delay'])
+            if point is None:
+                missed += 1
+                continue
+            profile.latitude, profile.longitude = (round(value, 6) for value in point)
+            pending.append(profile)
+            if len(pending) >= options['batch_size']:
+                updated += Profile.objects.bulk_update(pending, ['latitude', 'longitude'])
+                pending = []
+        if pending:
+            updated += Profile.objects.bulk_update(pending, ['latitude', 'longitude'])
+        self.stdout.write(self.style.SUCCESS(f"Located {updated} profiles; {missed} could not be placed."))
+
+    def _lookup(self, session, url, address):
+        try:
+            response = session.get(url, params={'q': address, 'format': 'json', 'limit': 1}, timeout=10)
+            response.raise_for_status()
+            results = response.json()
+        except (requests.RequestException, ValueError) as exc:
+            self.stderr.write(f"Geocoding {address!r} failed: {exc}")
+            return None
+        if not results:
+            return None
+        return parse_coordinates(f"{results[0]['lat']},{results[0]['lon']}")
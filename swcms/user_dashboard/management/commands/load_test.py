@@ -0,0 +1,100 @@
+import json
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_dashboard import loadtest
+from user_dashboard.models import Profile, PickupRequest
+
+
+class Command(BaseCommand):
+    help = "Load-test the WSGI app locally with concurrent residents, workers and admins."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--residents', type=int, default=200)
+        parser.add_argument('--workers', type=int, default=50)
+        parser.add_argument('--admins', type=int, default=5)
+        parser.add_argument('--duration', type=float, default=60.0, help="Seconds to run.")
+        parser.add_argument('--server-workers', type=int, default=4,
+                            help="WSGI server processes.")
+        parser.add_argument('--client-processes', type=int, default=8,
+                            help="Processes driving the virtual users.")
+        parser.add_argument('--think-time', type=float, default=1.0,
+                            help="Mean pause between scenario iterations, in seconds.")
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--username-prefix', default='seed_',
+                            help="Only accounts with this prefix are used (see seed_scale).")
+        parser.add_argument('--password', default='seedpass')
+        parser.add_argument('--json', dest='json_path', help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        accounts = self._accounts(options)
+        base_url = f"http://127.0.0.1:{options['port']}"
+
+        servers = loadtest.serve(options['port'], options['server_workers'])
+        try:
+            if not loadtest.wait_until_ready(base_url):
+                raise CommandError(f"Server did not come up on {base_url}")
+            self.stdout.write(
+                f"Running {len(accounts)} virtual users against {base_url} for {options['duration']:.0f}s..."
+            )
+            samples, elapsed = loadtest.run_clients(
+                base_url, accounts, options['password'], options['duration'],
+                options['client_processes'], options['think_time'],
+            )
+        finally:
+            for server in servers:
+                server.terminate()
+            for server in servers:
+                server.join()
+
+        report = loadtest.summarize(samples, elapsed)
+        self.stdout.write(
+            f"{'scenario':<10} {'step':<22} {'reqs':>7} {'err%':>6} {'req/s':>8} "
+            f"{'p50ms':>9} {'p95ms':>9} {'p99ms':>9}"
+        )
+        for row in report:
+            self.stdout.write(
+                f"{row['scenario']:<10} {row['step']:<22} {row['requests']:>7} "
+                f"{row['error_rate'] * 100:>6.1f} {row['throughput']:>8.2f} "
+                f"{row['p50_ms']:>9.1f} {row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}"
+            )
+        if options['json_path']:
+            with open(options['json_path'], 'w') as fh:
+                json.dump(report, fh, indent=2)
+
+    def _accounts(self, options):
+        prefix = options['username_prefix']
+        profiles = Profile.objects.filter(user__username__startswith=prefix).select_related('user')
+
+        residents = list(profiles.filter(role='user')[:options['residents']])
+        workers = list(profiles.filter(role='worker', ward__isnull=False)[:options['workers']])
+        admins = list(profiles.filter(role='admin')[:options['admins']])
+        if len(residents) < options['residents'] or len(workers) < options['workers'] or len(admins) < options['admins']:
+            raise CommandError(
+                f"Found {len(residents)} residents, {len(workers)} workers and {len(admins)} admins "
+                f"with prefix '{prefix}'. Run `manage.py seed_scale` with enough accounts first."
+            )
+
+        # Share each ward's open pickups between its workers so they do not
+        # all race for the same rows.
+        workers_by_ward = defaultdict(list)
+        for profile in workers:
+            workers_by_ward[profile.ward_id].append(profile)
+        queues = {profile.pk: [] for profile in workers}
+        open_pickups = (
+            PickupRequest.objects
+            .filter(status='pending', user__profile__ward_id__in=workers_by_ward)
+            .values_list('pk', 'user__profile__ward_id')
+        )
+        for i, (pk, ward_id) in enumerate(open_pickups):
+            ward_workers = workers_by_ward[ward_id]
+            queues[ward_workers[i % len(ward_workers)].pk].append(pk)
+
+        accounts = [{'scenario': 'resident', 'username': p.user.username} for p in residents]
+        accounts += [
+            {'scenario': 'worker', 'username': p.user.username, 'pickups': queues[p.pk]}
+            for p in workers
+        ]
+        accounts += [{'scenario': 'admin', 'username': p.user.username} for p in admins]
+        return accounts
@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from user_dashboard.mockgateway import MockGatewayServer
+
+
+class Command(BaseCommand):
+    help = "Run a local stand-in for the payment gateway API."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8766)
+        parser.add_argument('--delay', type=float, default=0.0,
+                            help="Seconds to wait before answering each request.")
+
+    def handle(self, *args, **options):
+        server = MockGatewayServer(
+            settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET,
+            port=options['port'], delay=options['delay'],
+        )
+        self.stdout.write(
+            f"Mock gateway on {server.base_url}; set PAYMENT_GATEWAY_BASE_URL to use it. Ctrl-C to stop."
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
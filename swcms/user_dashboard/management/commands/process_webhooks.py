@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user_dashboard.webhooks import process_pending_events
+
+
+class Command(BaseCommand):
+    help = "Apply stored payment gateway webhook events in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=float, metavar='SECONDS',
+                            help="Keep polling the inbox at this interval instead of exiting.")
+
+    def handle(self, *args, **options):
+        while True:
+            handled = process_pending_events()
+            if handled or not options['loop']:
+                self.stdout.write(f"Processed {handled} webhook events.")
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
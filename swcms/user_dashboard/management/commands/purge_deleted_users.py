@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user_dashboard.models import UserPurge
+from user_dashboard.purge import STAGE_NAMES, purge_pending
+
+
+class Command(BaseCommand):
+    help = "Remove the data of users deleted by an admin, in batches, and report progress."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Rows per batch (USER_PURGE_BATCH_SIZE).")
+        parser.add_argument('--status', action='store_true', help="Only report unfinished purges.")
+
+    def handle(self, *args, **options):
+        if not options['status']:
+            started = time.perf_counter()
+            while purge_pending(batch_size=options['batch_size']):
+                pass
+            self.stdout.write(self.style.SUCCESS(f"Purged in {time.perf_counter() - started:.1f}s."))
+        for purge in UserPurge.objects.filter(finished_at__isnull=True).order_by('requested_at'):
+            stage = purge.stage or STAGE_NAMES[0]
+            done = ', '.join(f"{name} {count}" for name, count in purge.removed.items()) or 'nothing yet'
+            self.stdout.write(
+                f"{purge.username} (id {purge.user_id}): stage {STAGE_NAMES.index(stage) + 1}/{len(STAGE_NAMES)} "
+                f"{stage} past pk {purge.last_pk}; removed {done}"
+            )
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_dashboard import search
+
+
+class Command(BaseCommand):
+    help = "Restore the full-text index triggers and rebuild the indexes from their tables (SQLite)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('indexes', nargs='*', metavar='index',
+                            help=f"Indexes to rebuild ({', '.join(sorted(search.INDEXES))}); all by default.")
+        parser.add_argument('--no-optimize', action='store_true',
+                            help="Skip merging the rebuilt index into a single segment.")
+
+    def handle(self, *args, **options):
+        kind = search.backend()
+        if kind != 'sqlite':
+            if kind == 'postgresql':
+                self.stdout.write("PostgreSQL indexes the columns directly; nothing to rebuild.")
+                return
+            raise CommandError("No full-text index here: SQLite was built without FTS5, or the backend is unsupported.")
+        unknown = set(options['indexes']) - set(search.INDEXES)
+        if unknown:
+            raise CommandError(f"Unknown index: {', '.join(sorted(unknown))}")
+        for name in options['indexes'] or sorted(search.INDEXES):
+            started = time.perf_counter()
+            search.rebuild(search.INDEXES[name], optimize=not options['no_optimize'])
+            self.stdout.write(f"{name}: rebuilt in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,47 @@
+import csv
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from user_dashboard.gateway import GatewayError, get_gateway
+from user_dashboard.reconciliation import REPORT_FIELDS, Reconciler, iter_api_rows, iter_csv_rows
+
+
+class Command(BaseCommand):
+    help = "Match payments against a settlement report and write a mismatch report."
+
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help="Settlement CSV export to read.")
+        source.add_argument('--api', action='store_true',
+                            help="Page through the gateway's settlement report instead.")
+        parser.add_argument('--date', type=date.fromisoformat,
+                            help="Settlement day, YYYY-MM-DD (default: yesterday).")
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument('--report', help="Write mismatches to this CSV file (default: stdout).")
+        parser.add_argument('--dry-run', action='store_true', help="Report only; don't update payments.")
+
+    def handle(self, *args, **options):
+        day = options['date'] or date.today() - timedelta(days=1)
+        report_file = open(options['report'], 'w', newline='') if options['report'] else self.stdout
+        try:
+            writer = csv.DictWriter(report_file, fieldnames=REPORT_FIELDS)
+            writer.writeheader()
+            reconciler = Reconciler(day, writer, chunk_size=options['chunk_size'], apply=not options['dry_run'])
+            if options['file']:
+                with open(options['file'], newline='') as settlement:
+                    stats = reconciler.run(iter_csv_rows(settlement))
+            else:
+                try:
+                    stats = reconciler.run(iter_api_rows(get_gateway(), day))
+                except GatewayError as exc:
+                    raise CommandError(f"Could not fetch the settlement report: {exc}")
+        finally:
+            if report_file is not self.stdout:
+                report_file.close()
+
+        self.stderr.write(
+            f"{day}: {stats['rows']} rows, {stats['matched']} matched, {stats['updated']} updated, "
+            f"{stats['skipped']} skipped, {stats['mismatched']} mismatches "
+            f"({stats['unsettled']} payments missing from the report)."
+        )
@@ -0,0 +1,161 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from user_dashboard.models import (
+    Panchayath, Ward, Profile, PickupRequest, Reward, Payment, Feedback
+)
+
+SEED_PREFIX = 'seed'
+
+COMPLAINT_SUBJECTS = [
+    'Overflowing bin near temple',
+    'Missed pickup on main road',
+    'Garbage burning behind market',
+    'Collection vehicle did not arrive',
+    'Plastic dumped near canal',
+]
+FEEDBACK_SUBJECTS = [
+    'Thanks to the collection crew',
+    'Suggestion for evening pickups',
+    'Request for extra recycling bags',
+]
+
+
+class Command(BaseCommand):
+    help = "Generate deterministic production-scale data with bulk_create."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--panchayaths', type=int, default=5)
+        parser.add_argument('--wards-per-panchayath', type=int, default=10)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--workers-per-ward', type=int, default=2)
+        parser.add_argument('--admins', type=int, default=1)
+        parser.add_argument('--pickups-per-user', type=int, default=10)
+        parser.add_argument('--feedback', type=int, default=None,
+                            help="Number of feedback rows (default: one per five users).")
+        parser.add_argument('--password', default='seedpass',
+                            help="Password shared by every generated account.")
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if Panchayath.objects.filter(code__startswith=f'{SEED_PREFIX.upper()}-').exists():
+            raise CommandError("Seed data already exists. Flush the database before seeding again.")
+
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+        password = make_password(options['password'])
+        now = timezone.now().replace(minute=0, second=0, microsecond=0)
+
+        with transaction.atomic():
+            panchayaths = Panchayath.objects.bulk_create([
+                Panchayath(name=f'Seed Panchayath {i}', code=f'{SEED_PREFIX.upper()}-{i}')
+                for i in range(options['panchayaths'])
+            ], batch_size=batch_size)
+
+            wards = Ward.objects.bulk_create([
+                Ward(name=f'Ward {n} of {p.name}', panchayath=p, ward_number=n)
+                for p in panchayaths
+                for n in range(1, options['wards_per_panchayath'] + 1)
+            ], batch_size=batch_size)
+            if not wards:
+                raise CommandError("At least one ward is required.")
+
+            accounts = [(f'{SEED_PREFIX}_user_{i}', 'user', rng.choice(wards)) for i in range(options['users'])]
+            accounts += [
+                (f'{SEED_PREFIX}_worker_{n}_{i}', 'worker', w)
+                for n, w in enumerate(wards)
+                for i in range(options['workers_per_ward'])
+            ]
+            accounts += [(f'{SEED_PREFIX}_admin_{i}', 'admin', wards[0]) for i in range(options['admins'])]
+
+            users = User.objects.bulk_create([
+                User(username=username, email=f'{username}@example.com', password=password)
+                for username, _, _ in accounts
+            ], batch_size=batch_size)
+
+            Profile.objects.bulk_create([
+                Profile(
+                    user=user,
+                    role=role,
+                    ward=ward,
+                    mobile_number=f'9{rng.randrange(10 ** 9):09d}',
+                    location=f'House {rng.randrange(1, 500)}, {ward.name}',
+                )
+                for user, (_, role, ward) in zip(users, accounts)
+            ], batch_size=batch_size)
+
+            residents = [user for user, (_, role, _) in zip(users, accounts) if role == 'user']
+            ward_of = {user.pk: ward for user, (_, _, ward) in zip(users, accounts)}
+
+            waste_types = [choice for choice, _ in PickupRequest.WASTE_TYPE_CHOICES]
+            statuses = [choice for choice, _ in PickupRequest.STATUS_CHOICES]
+            pickups = []
+            for user in residents:
+                for _ in range(options['pickups_per_user']):
+                    status = rng.choice(statuses)
+                    pickups.append(PickupRequest(
+                        user=user,
+                        waste_type=rng.choice(waste_types),
+                        description=rng.choice(['', 'Kitchen waste', 'Old electronics', 'Bottles and cans']),
+                        schedule_date_time=now + timedelta(hours=rng.randrange(-24 * 60, 24 * 14)),
+                        status=status,
+                        waste_weight=Decimal(rng.randrange(50, 5000)) / 100 if status == 'completed' else None,
+                    ))
+            pickups = PickupRequest.objects.bulk_create(pickups, batch_size=batch_size)
+
+            payments = []
+            for n, pickup in enumerate(pickups):
+                if pickup.status == 'cancelled' or rng.random() < 0.2:
+                    continue
+                paid = pickup.status == 'completed' or rng.random() < 0.3
+                cash = paid and rng.random() < 0.4
+                payments.append(Payment(
+                    user=pickup.user,
+                    pickup_request=pickup,
+                    amount=Decimal('100.00'),
+                    razorpay_order_id=None if cash else f'order_seed{n}',
+                    razorpay_payment_id=('cash' if cash else f'pay_seed{n}') if paid else None,
+                    status='completed' if paid else 'pending',
+                ))
+            Payment.objects.bulk_create(payments, batch_size=batch_size)
+
+            totals = {}
+            for pickup in pickups:
+                if pickup.waste_weight is not None:
+                    totals[pickup.user_id] = totals.get(pickup.user_id, Decimal('0')) + pickup.waste_weight
+            Reward.objects.bulk_create([
+                Reward(user=user, points=rng.randrange(10, 101), total_waste_collected=totals.get(user.pk, Decimal('0')))
+                for user in residents
+            ], batch_size=batch_size)
+
+            feedback_count = options['feedback']
+            if feedback_count is None:
+                feedback_count = len(residents) // 5
+            feedbacks = []
+            for _ in range(feedback_count if residents else 0):
+                user = rng.choice(residents)
+                is_complaint = rng.random() < 0.6
+                resolved = rng.random() < 0.5
+                feedbacks.append(Feedback(
+                    user=user,
+                    subject=rng.choice(COMPLAINT_SUBJECTS if is_complaint else FEEDBACK_SUBJECTS),
+                    message=f'Reported by {user.username} in {ward_of[user.pk].name}.',
+                    is_complaint=is_complaint,
+                    ward=ward_of[user.pk],
+                    status='resolved' if resolved else 'pending',
+                    response='Resolved by the ward crew.' if resolved else None,
+                ))
+            Feedback.objects.bulk_create(feedbacks, batch_size=batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {len(panchayaths)} panchayaths, {len(wards)} wards, {len(users)} accounts, "
+            f"{len(pickups)} pickups, {len(payments)} payments and {len(feedbacks)} feedback rows."
+        ))
@@ -0,0 +1,103 @@
+import itertools
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from user_dashboard.reward_policies import CURRENT_POLICY, IMPACT_WEIGHTS, Policy, RewardHistory
+
+
+class Command(BaseCommand):
+    help = "Compare reward policies (waste-type weights and point scales) against the current one on past pickups."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--policies', metavar='FILE',
+                            help='JSON list of {"name", "weights": {type: weight}, "min_points", "max_points"}.')
+        parser.add_argument('--weight', action='append', default=[], metavar='TYPE=W1,W2',
+                            help="Weights to try for a waste type (repeatable); every combination is evaluated.")
+        parser.add_argument('--points', action='append', default=[], metavar='MIN:MAX',
+                            help="Point scales to try (repeatable); combined with --weight.")
+        parser.add_argument('--top', type=int, default=10, help="Size of the leaderboard compared for overlap.")
+        parser.add_argument('--json', action='store_true', help="Print the full reports as JSON.")
+        parser.add_argument('--synthetic-pickups', type=int,
+                            help="Use this many random pickups instead of the database, for timing.")
+        parser.add_argument('--synthetic-households', type=int, default=50000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        policies = self._policies(options)
+        if not policies:
+            raise CommandError("Nothing to compare: give --policies, --weight or --points.")
+
+        started = time.perf_counter()
+        history = self._synthetic(options) if options['synthetic_pickups'] else RewardHistory.load()
+        loaded = time.perf_counter() - started
+        started = time.perf_counter()
+        reports = history.compare(policies, top=options['top'])
+        evaluated = time.perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps(reports, indent=2))
+            return
+        self.stdout.write(
+            f"{history.pickups} pickups, {len(history.user_ids)} households; "
+            f"loaded in {loaded:.2f}s, {len(policies)} policies evaluated in {evaluated:.2f}s"
+        )
+        self.stdout.write(
+            f"{'policy':<40} {'spearman':>8} {'moved':>7} {'mean d':>7} {'top':>5} "
+            f"{'p25':>5} {'p50':>5} {'p75':>5}  ward with largest change"
+        )
+        for report in reports:
+            points = report['points']['percentiles']
+            ward = report['wards'][0] if report['wards'] else None
+            moved = report['changed'] / report['households'] if report['households'] else 0.0
+            self.stdout.write(
+                f"{report['policy']:<40.40} {report['spearman']:>8.3f} {moved:>7.1%} {report['mean_rank_shift']:>7.1f} "
+                f"{report['top_overlap']:>5.0%} {points['p25']:>5.0f} {points['p50']:>5.0f} {points['p75']:>5.0f}  "
+                + (f"{ward['ward_id'] or 'none'}: {ward['change']:+.1f} points" if ward else '')
+            )
+
+    def _policies(self, options):
+        policies = []
+        if options['policies']:
+            try:
+                with open(options['policies']) as fh:
+                    policies.extend(Policy.from_dict(data) for data in json.load(fh))
+            except (OSError, ValueError, KeyError, TypeError) as exc:
+                raise CommandError(f"Cannot read policies from {options['policies']}: {exc}")
+
+        grid = []
+        for spec in options['weight']:
+            waste_type, _, values = spec.partition('=')
+            try:
+                grid.append([(waste_type, float(v)) for v in values.split(',')])
+            except ValueError:
+                raise CommandError(f"Bad --weight {spec!r}; expected TYPE=W1,W2")
+        scales = []
+        for spec in options['points']:
+            try:
+                low, high = (float(v) for v in spec.split(':'))
+            except ValueError:
+                raise CommandError(f"Bad --points {spec!r}; expected MIN:MAX")
+            scales.append((low, high))
+        if grid or scales:
+            for combination in itertools.product(*grid):
+                for low, high in scales or [(CURRENT_POLICY.min_points, CURRENT_POLICY.max_points)]:
+                    weights = {**IMPACT_WEIGHTS, **dict(combination)}
+                    name = ' '.join([f'{t}={w:g}' for t, w in combination] + ([f'{low:g}-{high:g}pts'] if scales else []))
+                    policies.append(Policy(name, weights, low, high))
+        return policies
+
+    def _synthetic(self, options):
+        rng = np.random.default_rng(options['seed'])
+        households, pickups = options['synthetic_households'], options['synthetic_pickups']
+        waste_types = list(IMPACT_WEIGHTS)
+        return RewardHistory(
+            np.arange(1, households + 1),
+            rng.integers(1, 51, households),
+            waste_types,
+            rng.integers(0, households, pickups),
+            rng.integers(0, len(waste_types), pickups),
+            np.round(rng.gamma(2.0, 2.5, pickups), 2),
+        )
@@ -0,0 +1,154 @@
+"""
+Access-controlled serving of files under MEDIA_ROOT.
+
+media_view checks that the requester may see the pickup a photo belongs to
+(its owner, a worker of the same ward, or an admin) and then hands the
+transfer to the front-end server: nginx via X-Accel-Redirect or
+Apache/lighttpd via X-Sendfile, selected by MEDIA_ACCEL. Without one it falls
+back to a FileResponse that honours conditional GETs and single byte ranges;
+full responses go through the WSGI server's file_wrapper (sendfile) when it
+has one.
+"""
+import mimetypes
+import os
+import re
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseForbidden
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+from .images import VARIANT_DIR
+from .models import PickupRequest, Profile
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+VARIANT_NAME_RE = re.compile(r'^([0-9a-f]{32})_\d+\.(?:jpg|webp)$')
+
+
+def _pickup_for(path):
+    """Find the pickup a media path belongs to, using indexed lookups."""
+    directory, _, filename = path.rpartition('/')
+    if directory == VARIANT_DIR:
+        match = VARIANT_NAME_RE.match(filename)
+        if match is None:
+            return None
+        return PickupRequest.objects.filter(request_id=match.group(1)).select_related('user__profile').first()
+    return PickupRequest.objects.filter(image=path).select_related('user__profile').first()
+
+
+def can_view_pickup_media(user, pickup):
+    if user.is_staff or pickup.user_id == user.pk:
+        return True
+    profile = Profile.objects.filter(user=user).only('role', 'ward_id').first()
+    if profile is None:
+        return False
+    if profile.role == 'admin':
+        return True
+    owner_profile = getattr(pickup.user, 'profile', None)
+    return (
+        profile.role == 'worker'
+        and profile.ward_id is not None
+        and owner_profile is not None
+        and owner_profile.ward_id == profile.ward_id
+    )
+
+
+class _RangeFile:
+    """Read at most `length` bytes from `fileobj` starting where it is."""
+
+    def __init__(self, fileobj, length):
+        self.fileobj = fileobj
+        self.remaining = length
+        self.name = fileobj.name
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        if size < 0 or size > self.remaining:
+            size = self.remaining
+        data = self.fileobj.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.fileobj.close()
+
+
+def _parse_range(header, size):
+    """Return (start, end) for a single satisfiable byte range, else None."""
+    match = RANGE_RE.match(header.strip())
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    elif last:
+        start = max(0, size - int(last))
+        end = size - 1
+    else:
+        return None
+    if start > end or start >= size:
+        return None
+    return start, end
+
+
+def serve_file(request, full_path, relative_path):
+    """Send a file, via the front server when configured."""
+    stat = full_path.stat()
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    not_modified = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if not_modified is not None:
+        return not_modified
+
+    content_type = mimetypes.guess_type(full_path.name)[0] or 'application/octet-stream'
+    accel = getattr(settings, 'MEDIA_ACCEL', None)
+    if accel == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + relative_path
+    elif accel == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = str(full_path)
+    else:
+        byte_range = None
+        if 'HTTP_RANGE' in request.META and request.method == 'GET':
+            byte_range = _parse_range(request.META['HTTP_RANGE'], stat.st_size)
+            if byte_range is None:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+        fileobj = open(full_path, 'rb')
+        if byte_range is None:
+            response = FileResponse(fileobj, content_type=content_type)
+        else:
+            start, end = byte_range
+            fileobj.seek(start)
+            response = FileResponse(_RangeFile(fileobj, end - start + 1), content_type=content_type, status=206)
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+        response['Accept-Ranges'] = 'bytes'
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@login_required
+def media_view(request, path):
+    """Serve a pickup photo to users allowed to see the pickup."""
+    path = os.path.normpath(path).replace('\\', '/')
+    if path.startswith(('../', '/')) or path == '..':
+        raise Http404
+    pickup = _pickup_for(path)
+    if pickup is None:
+        raise Http404
+    if not can_view_pickup_media(request.user, pickup):
+        return HttpResponseForbidden()
+
+    full_path = Path(settings.MEDIA_ROOT) / path
+    if not full_path.is_file():
+        raise Http404
+    return serve_file(request, full_path, path)
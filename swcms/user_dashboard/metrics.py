@@ -0,0 +1,200 @@
+"""
+Per-request latency and SQL instrumentation.
+
+RequestMetricsMiddleware records, per URL name, the request latency, the
+number of database queries and the time spent in the database into
+fixed-bucket histograms kept in process memory. Requests that run the same
+SQL template more often than METRICS_N_PLUS_ONE_THRESHOLD are counted and
+logged as likely N+1 patterns. metrics_view renders everything in the
+Prometheus text exposition format; each worker process reports its own
+numbers, which Prometheus sums when it scrapes them all. Scrapers present
+METRICS_TOKEN as a bearer token or connect from METRICS_ALLOWED_IPS (empty
+by default: behind a local reverse proxy every request comes from
+127.0.0.1); staff users can always look.
+"""
+import hmac
+import logging
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+DB_TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+
+class Histogram:
+    """Fixed-bucket histogram; observations cost one bisect and two adds."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """Yield (upper bound, cumulative count) pairs, ending with +Inf."""
+        running = 0
+        for bound, count in zip(self.buckets, self.counts):
+            running += count
+            yield bound, running
+        yield '+Inf', self.count
+
+
+class MetricsRegistry:
+    """Thread-safe store of per-view histograms and counters."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Callables returning extra exposition lines, e.g. queue gauges
+        self.collectors = []
+        self.reset()
+
+    def add_collector(self, collector):
+        if collector not in self.collectors:
+            self.collectors.append(collector)
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}
+            self.query_count = {}
+            self.db_time = {}
+            self.n_plus_one = Counter()
+
+    def observe(self, view, duration, queries, db_time, n_plus_one=False):
+        with self._lock:
+            if view not in self.latency:
+                self.latency[view] = Histogram(LATENCY_BUCKETS)
+                self.query_count[view] = Histogram(QUERY_COUNT_BUCKETS)
+                self.db_time[view] = Histogram(DB_TIME_BUCKETS)
+            self.latency[view].observe(duration)
+            self.query_count[view].observe(queries)
+            self.db_time[view].observe(db_time)
+            if n_plus_one:
+                self.n_plus_one[view] += 1
+
+    def render(self):
+        """Return all metrics in Prometheus text format."""
+        lines = []
+        with self._lock:
+            self._render_histograms(
+                lines, 'swcms_request_duration_seconds',
+                'Request latency by URL name.', self.latency,
+            )
+            self._render_histograms(
+                lines, 'swcms_request_db_queries',
+                'Database queries per request by URL name.', self.query_count,
+            )
+            self._render_histograms(
+                lines, 'swcms_request_db_duration_seconds',
+                'Time spent in the database per request by URL name.', self.db_time,
+            )
+            lines.append('# HELP swcms_request_n_plus_one_total Requests that repeated one SQL template above the threshold.')
+            lines.append('# TYPE swcms_request_n_plus_one_total counter')
+            for view, count in sorted(self.n_plus_one.items()):
+                lines.append(f'swcms_request_n_plus_one_total{{view="{view}"}} {count}')
+        for collector in self.collectors:
+            lines.extend(collector())
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histograms(lines, name, help_text, histograms):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for view, histogram in sorted(histograms.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f'{name}_bucket{{view="{view}",le="{bound}"}} {count}')
+            lines.append(f'{name}_sum{{view="{view}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{view="{view}"}} {histogram.count}')
+
+
+registry = MetricsRegistry()
+
+
+class QueryTracker:
+    """Database execute wrapper that counts and times queries by SQL template."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.templates = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            self.templates[sql] += 1
+
+    def most_repeated(self):
+        """Return (sql, count) for the most repeated template, or (None, 0)."""
+        if not self.templates:
+            return None, 0
+        return self.templates.most_common(1)[0]
+
+
+class RequestMetricsMiddleware:
+    """Record latency and SQL statistics for every request."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.n_plus_one_threshold = getattr(
+            settings, 'METRICS_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD
+        )
+
+    def __call__(self, request):
+        tracker = QueryTracker()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            for alias in connections:
+                stack.enter_context(connections[alias].execute_wrapper(tracker))
+            response = self.get_response(request)
+        duration = time.perf_counter() - start
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else 'unmatched'
+
+        sql, repeats = tracker.most_repeated()
+        n_plus_one = repeats > self.n_plus_one_threshold
+        if n_plus_one:
+            logger.warning(
+                'Possible N+1 in %s: query repeated %d times: %s',
+                view, repeats, sql[:200],
+            )
+
+        registry.observe(view, duration, tracker.count, tracker.duration, n_plus_one)
+        return response
+
+
+def _may_scrape(request):
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    scheme, _, supplied = request.headers.get('Authorization', '').partition(' ')
+    if token and scheme.lower() == 'bearer' and hmac.compare_digest(supplied.encode(), token.encode()):
+        return True
+    if request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ()):
+        return True
+    return request.user.is_staff
+
+
+def metrics_view(request):
+    """Expose collected metrics to Prometheus."""
+    if not _may_scrape(request):
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0005_panchayath_alter_ward_options_ward_panchayath_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='profile',
+            name='mobile_number',
+            field=models.CharField(blank=True, db_index=True, max_length=15, null=True),
+        ),
+        migrations.AlterField(
+            model_name='profile',
+            name='role',
+            field=models.CharField(choices=[('user', 'User'), ('worker', 'Worker'), ('admin', 'Admin')], db_index=True, default='user', max_length=50),
+        ),
+    ]
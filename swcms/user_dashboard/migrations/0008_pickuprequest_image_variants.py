@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0007_admin_list_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pickuprequest',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, help_text='Resized renditions of image keyed by width'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 00:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0009_photoupload'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='pickuprequest',
+            name='image',
+            field=models.ImageField(blank=True, db_index=True, null=True, upload_to='pickup_images/'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:02
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0014_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(max_length=20)),
+                ('payment_status', models.CharField(blank=True, max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('pickup', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user_dashboard.pickuprequest')),
+                ('ward', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='user_dashboard.ward')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['ward', 'id'], name='pickupevent_ward_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0017_profile_coordinates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('weekday', models.PositiveSmallIntegerField(choices=[(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'), (6, 'Sunday')])),
+                ('start_time', models.TimeField()),
+                ('end_time', models.TimeField()),
+                ('capacity', models.PositiveIntegerField(help_text="Pickups the ward's crews can serve in this window")),
+                ('is_active', models.BooleanField(default=True)),
+                ('ward', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='slots', to='user_dashboard.ward')),
+            ],
+            options={
+                'ordering': ['ward', 'weekday', 'start_time'],
+            },
+        ),
+        migrations.AddField(
+            model_name='pickuprequest',
+            name='slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='pickups', to='user_dashboard.pickupslot'),
+        ),
+        migrations.CreateModel(
+            name='SlotUsage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('booked', models.PositiveIntegerField(default=0)),
+                ('slot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='usage', to='user_dashboard.pickupslot')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='pickupslot',
+            index=models.Index(fields=['ward', 'weekday'], name='pickupslot_ward_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='slotusage',
+            constraint=models.UniqueConstraint(fields=('slot', 'date'), name='unique_slot_usage_per_day'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 01:15
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0018_pickup_slots'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pickuprequest',
+            name='assigned_to',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='assigned_pickups', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='on_duty',
+            field=models.BooleanField(default=True, help_text='Workers off duty are not assigned new pickups'),
+        ),
+        migrations.AddIndex(
+            model_name='pickuprequest',
+            index=models.Index(fields=['assigned_to', 'status', 'schedule_date_time'], name='pickup_assignee_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='pickuprequest',
+            index=models.Index(condition=models.Q(('assigned_to__isnull', True), ('status', 'pending')), fields=['schedule_date_time'], name='pickup_unassigned_idx'),
+        ),
+    ]
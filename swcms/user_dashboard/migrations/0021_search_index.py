@@ -0,0 +1,81 @@
+# Full-text indexes for user_dashboard.search
+
+from django.db import migrations
+
+# (FTS table, source table, text columns, tsvector weights); search.py
+# builds its queries from the same names and the same tsvector expression
+INDEXES = [
+    ('search_feedback', 'user_dashboard_feedback', ['subject', 'message', 'response'], ['A', 'B', 'C']),
+    ('search_pickup', 'user_dashboard_pickuprequest', ['description'], ['A']),
+]
+
+
+def _fts5_available(cursor):
+    cursor.execute("SELECT sqlite_compileoption_used('ENABLE_FTS5')")
+    return bool(cursor.fetchone()[0])
+
+
+def _sqlite_create(cursor, table, source, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{c}' for c in columns)
+    old = ', '.join(f'old.{c}' for c in columns)
+    cursor.execute(
+        f"CREATE VIRTUAL TABLE {table} USING fts5({cols}, content='{source}', content_rowid='id', "
+        f"tokenize='porter unicode61 remove_diacritics 2')"
+    )
+    # External content: the index stores no text of its own, so every change
+    # to the source row has to remove the old terms and add the new ones
+    cursor.execute(
+        f"CREATE TRIGGER {table}_ai AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES (new.id, {new}); END"
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {table}_ad AFTER DELETE ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', old.id, {old}); END"
+    )
+    cursor.execute(
+        f"CREATE TRIGGER {table}_au AFTER UPDATE OF {cols} ON {source} BEGIN "
+        f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', old.id, {old}); "
+        f"INSERT INTO {table}(rowid, {cols}) VALUES (new.id, {new}); END"
+    )
+    cursor.execute(f"INSERT INTO {table}({table}) VALUES ('rebuild')")
+
+
+def _tsvector(columns, weights):
+    return ' || '.join(
+        f"setweight(to_tsvector('english', coalesce({c}, '')), '{w}')" for c, w in zip(columns, weights)
+    )
+
+
+def create_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        if vendor == 'sqlite' and _fts5_available(cursor):
+            for table, source, columns, _ in INDEXES:
+                _sqlite_create(cursor, table, source, columns)
+        elif vendor == 'postgresql':
+            for table, source, columns, weights in INDEXES:
+                cursor.execute(f'CREATE INDEX {table}_idx ON {source} USING gin (({_tsvector(columns, weights)}))')
+
+
+def drop_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    with schema_editor.connection.cursor() as cursor:
+        for table, source, _, _ in INDEXES:
+            if vendor == 'sqlite':
+                for suffix in ('ai', 'ad', 'au'):
+                    cursor.execute(f'DROP TRIGGER IF EXISTS {table}_{suffix}')
+                cursor.execute(f'DROP TABLE IF EXISTS {table}')
+            elif vendor == 'postgresql':
+                cursor.execute(f'DROP INDEX IF EXISTS {table}_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0020_pickup_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
@@ -0,0 +1,39 @@
+# Prefix indexes for the admin user search (admin_users_view)
+
+from django.db import migrations
+
+# (index, column); the view matches LOWER(column) LIKE 'prefix%', which
+# Postgres can answer from these with text_pattern_ops in any collation
+INDEXES = [
+    ('user_search_username_idx', 'username'),
+    ('user_search_email_idx', 'email'),
+]
+
+
+def create_indexes(apps, schema_editor):
+    # SQLite cannot use an expression index for LIKE, so it gets none
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, column in INDEXES:
+            cursor.execute(f'CREATE INDEX {name} ON auth_user (LOWER({column}) text_pattern_ops)')
+
+
+def drop_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        for name, _ in INDEXES:
+            cursor.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('user_dashboard', '0024_notification_claims'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_indexes, drop_indexes),
+    ]
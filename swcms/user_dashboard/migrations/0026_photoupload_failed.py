@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 02:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user_dashboard', '0025_user_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='photoupload',
+            name='status',
+            field=models.CharField(choices=[('uploading', 'Uploading'), ('complete', 'Complete'), ('consumed', 'Consumed'), ('failed', 'Failed')], default='uploading', max_length=20),
+        ),
+    ]
@@ -0,0 +1,162 @@
+"""
+Local stand-in for the Razorpay API.
+
+MockGatewayServer implements the small part of the REST API the adapter
+uses (creating and fetching orders, paging settlement reports from its
+`settlements` dict) with basic-auth checks, plus knobs for
+tests and benchmarks: a fixed response delay and a number of upcoming
+requests to fail with 503. It runs on a background thread, so tests can
+start one on an ephemeral port and point PAYMENT_GATEWAY_BASE_URL at it;
+`manage.py mock_gateway` runs one in the foreground. signed_webhook() builds
+deliveries the way the gateway signs them.
+"""
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Send headers and body in one segment so keep-alive clients don't stall
+    # on delayed ACKs
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        raw = self.rfile.read(length) if length else b''
+        return json.loads(raw or b'{}')
+
+    def _authorized(self):
+        expected = 'Basic ' + base64.b64encode(
+            f'{self.server.key_id}:{self.server.key_secret}'.encode()
+        ).decode()
+        return self.headers.get('Authorization') == expected
+
+    def _handle(self, method):
+        mock = self.server
+        if method == 'POST':
+            # Always drain the body so keep-alive connections stay in sync
+            payload = self._read_json()
+        if mock.delay:
+            time.sleep(mock.delay)
+        with mock.lock:
+            mock.request_count += 1
+            failing = mock.fail_next > 0
+            if failing:
+                mock.fail_next -= 1
+        if failing:
+            return self._send(503, {'error': {'code': 'SERVER_ERROR'}})
+        if not self._authorized():
+            return self._send(401, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Authentication failed'}})
+
+        if method == 'POST' and self.path == '/v1/orders':
+            if not isinstance(payload.get('amount'), int) or payload['amount'] < 100:
+                return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Invalid amount'}})
+            order = {
+                'id': f'order_mock{next(mock.ids):010d}',
+                'entity': 'order',
+                'amount': payload['amount'],
+                'amount_paid': 0,
+                'amount_due': payload['amount'],
+                'currency': payload.get('currency', 'INR'),
+                'receipt': payload.get('receipt'),
+                'status': 'created',
+                'notes': payload.get('notes') or {},
+                'created_at': int(time.time()),
+            }
+            with mock.lock:
+                mock.orders[order['id']] = order
+            return self._send(200, order)
+        if method == 'GET' and self.path.startswith('/v1/settlements/recon/combined'):
+            query = {key: values[0] for key, values in parse_qs(urlsplit(self.path).query).items()}
+            try:
+                day = f"{int(query['year']):04d}-{int(query['month']):02d}-{int(query['day']):02d}"
+                count = min(int(query.get('count', 10)), 1000)
+                skip = int(query.get('skip', 0))
+            except (KeyError, ValueError):
+                return self._send(400, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Invalid date'}})
+            items = mock.settlements.get(day, [])[skip:skip + count]
+            return self._send(200, {'entity': 'collection', 'count': len(items), 'items': items})
+        if method == 'GET' and self.path.startswith('/v1/orders/'):
+            order = mock.orders.get(self.path.rsplit('/', 1)[-1])
+            if order is None:
+                return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Not found'}})
+            return self._send(200, order)
+        return self._send(404, {'error': {'code': 'BAD_REQUEST_ERROR', 'description': 'Unknown endpoint'}})
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+class MockGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, key_id, key_secret, host='127.0.0.1', port=0, delay=0.0):
+        super().__init__((host, port), _Handler)
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.delay = delay
+        self.fail_next = 0
+        self.orders = {}
+        # 'YYYY-MM-DD' -> settlement report items for that day
+        self.settlements = {}
+        self.request_count = 0
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+def signed_webhook(event, order_id, payment_id, secret, event_id=None):
+    """Return (body, headers) for a webhook delivery about one payment."""
+    status = {'payment.failed': 'failed'}.get(event, 'captured')
+    body = json.dumps({
+        'entity': 'event',
+        'event': event,
+        'contains': ['payment'],
+        'payload': {'payment': {'entity': {
+            'id': payment_id, 'entity': 'payment', 'order_id': order_id, 'status': status,
+        }}},
+        'created_at': int(time.time()),
+    }).encode()
+    headers = {
+        'X-Razorpay-Signature': hmac.new(secret.encode(), body, hashlib.sha256).hexdigest(),
+        'X-Razorpay-Event-Id': event_id or f'evt_{hashlib.sha1(body).hexdigest()[:14]}',
+    }
+    return body, headers
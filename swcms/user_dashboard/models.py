@@ -1,5 +1,6 @@
 from django.db import models
 from django.contrib.auth.models import User
+from django.utils import timezone
 import uuid
 
 class Panchayath(models.Model):
@@ -29,16 +30,57 @@ class Ward(models.Model):
     def __str__(self):
         return f"{self.name} ({self.panchayath.name}, Ward {self.ward_number})" if self.panchayath else f"{self.name} (Ward {self.ward_number})"
 
+class PickupSlot(models.Model):
+    """A weekly collection window in a ward, with a cap on pickups per day."""
+    WEEKDAY_CHOICES = [
+        (0, 'Monday'),
+        (1, 'Tuesday'),
+        (2, 'Wednesday'),
+        (3, 'Thursday'),
+        (4, 'Friday'),
+        (5, 'Saturday'),
+        (6, 'Sunday'),
+    ]
+
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='slots')
+    weekday = models.PositiveSmallIntegerField(choices=WEEKDAY_CHOICES)
+    start_time = models.TimeField()
+    end_time = models.TimeField()
+    capacity = models.PositiveIntegerField(help_text="Pickups the ward's crews can serve in this window")
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['ward', 'weekday', 'start_time']
+        indexes = [
+            models.Index(fields=['ward', 'weekday'], name='pickupslot_ward_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.ward} {self.get_weekday_display()} {self.start_time:%H:%M}-{self.end_time:%H:%M}"
+
+class ProfileManager(models.Manager):
+    """Leaves out profiles of deleted users whose data is still being purged."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    mobile_number = models.CharField(max_length=15, blank=True, null=True)
+    mobile_number = models.CharField(max_length=15, blank=True, null=True, db_index=True)
     location = models.CharField(max_length=255, blank=True, null=True)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, null=True, blank=True)
     ward = models.ForeignKey(Ward, on_delete=models.SET_NULL, null=True, blank=True)
     role = models.CharField(max_length=50, choices=[
         ('user', 'User'),
         ('worker', 'Worker'),
         ('admin', 'Admin'),
-    ], default='user')
+    ], default='user', db_index=True)
+    on_duty = models.BooleanField(default=True, help_text="Workers off duty are not assigned new pickups")
+    deleted_at = models.DateTimeField(null=True, blank=True, help_text="Set when an admin deletes the user; see purge.py")
+
+    objects = ProfileManager()
+    all_objects = models.Manager()
 
     def __str__(self):
         return f"{self.user.username} - {self.role}"
@@ -62,16 +104,67 @@ class PickupRequest(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     waste_type = models.CharField(max_length=50, choices=WASTE_TYPE_CHOICES)
     description = models.TextField(blank=True, null=True)
-    image = models.ImageField(upload_to='pickup_images/', blank=True, null=True)
+    image = models.ImageField(upload_to='pickup_images/', blank=True, null=True, db_index=True)
+    image_variants = models.JSONField(default=dict, blank=True, help_text="Resized renditions of image keyed by width")
     schedule_date_time = models.DateTimeField()
+    slot = models.ForeignKey(PickupSlot, on_delete=models.SET_NULL, null=True, blank=True, related_name='pickups')
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    # Indexed by pickup_assignee_queue_idx below
+    assigned_to = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='assigned_pickups', db_index=False,
+    )
+    # A worker's lease on a pending pickup while they head there; see claims.py
+    claimed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='claimed_pickups')
+    claim_expires_at = models.DateTimeField(null=True, blank=True)
     waste_weight = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, help_text="Weight in kg")
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Delta sync pages through changes by (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='pickup_updated_idx'),
+            # A worker's queue, in visiting order
+            models.Index(fields=['assigned_to', 'status', 'schedule_date_time'], name='pickup_assignee_queue_idx'),
+            # Only the few pickups still waiting for a worker are scanned by assignment
+            models.Index(fields=['schedule_date_time'], condition=models.Q(status='pending', assigned_to__isnull=True),
+                         name='pickup_unassigned_idx'),
+        ]
+
     def __str__(self):
         return f"Request {self.request_id} by {self.user.username} - {self.status}"
 
+    @property
+    def active_claimant(self):
+        """The worker holding an unexpired claim, or None; lapsed claims are simply ignored."""
+        if self.claimed_by_id is None or self.claim_expires_at is None or self.claim_expires_at <= timezone.now():
+            return None
+        return self.claimed_by
+
+    def _image_srcset(self, fmt):
+        storage = self.image.storage
+        return ', '.join(
+            f"{storage.url(entry[fmt])} {width}w"
+            for width, entry in sorted(self.image_variants.items(), key=lambda item: int(item[0]))
+            if fmt in entry
+        )
+
+    @property
+    def image_jpeg_srcset(self):
+        return self._image_srcset('jpeg')
+
+    @property
+    def image_webp_srcset(self):
+        return self._image_srcset('webp')
+
+    @property
+    def image_thumbnail_url(self):
+        """Smallest available rendition, falling back to the image itself."""
+        if self.image_variants:
+            smallest = min(self.image_variants, key=int)
+            return self.image.storage.url(self.image_variants[smallest]['jpeg'])
+        return self.image.url if self.image else ''
+
 class Reward(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     points = models.IntegerField(default=0)
@@ -90,26 +183,199 @@ class Payment(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     pickup_request = models.OneToOneField(PickupRequest, on_delete=models.CASCADE)
     amount = models.DecimalField(max_digits=10, decimal_places=2)
-    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True)
+    razorpay_order_id = models.CharField(max_length=100, blank=True, null=True, db_index=True)
     razorpay_payment_id = models.CharField(max_length=100, blank=True, null=True)
     status = models.CharField(max_length=20, choices=PAYMENT_STATUS_CHOICES, default='pending')
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    reconciled_at = models.DateTimeField(null=True, blank=True, help_text="Last matched against a settlement report")
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='payment_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Payment for {self.pickup_request} - {self.amount}"
 
+class FeedbackCluster(models.Model):
+    """Near-identical pending complaints from one ward, grouped by the clustering job."""
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE, related_name='feedback_clusters')
+    subject = models.CharField(max_length=200, help_text="Subject of the earliest complaint in the cluster")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.subject} ({self.ward})"
+
 class Feedback(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     subject = models.CharField(max_length=200)
     message = models.TextField()
     is_complaint = models.BooleanField(default=False)
     ward = models.ForeignKey(Ward, on_delete=models.SET_NULL, null=True, blank=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
     status = models.CharField(max_length=20, choices=[
         ('pending', 'Pending'),
         ('resolved', 'Resolved'),
     ], default='pending')
     response = models.TextField(blank=True, null=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    cluster = models.ForeignKey(
+        FeedbackCluster, on_delete=models.SET_NULL, null=True, blank=True, related_name='feedbacks',
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['updated_at', 'id'], name='feedback_updated_idx'),
+            # What the clustering job reads
+            models.Index(
+                fields=['ward', 'created_at'], name='feedback_open_complaint_idx',
+                condition=models.Q(is_complaint=True, status='pending'),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.subject} by {self.user.username} - {self.status}"
+
+class PhotoUpload(models.Model):
+    """A resumable, chunked upload of a pickup photo, claimed by token."""
+    STATUS_CHOICES = [
+        ('uploading', 'Uploading'),
+        ('complete', 'Complete'),
+        ('consumed', 'Consumed'),
+        ('failed', 'Failed'),
+    ]
+
+    token = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    filename = models.CharField(max_length=255)
+    content_type = models.CharField(max_length=50)
+    size = models.PositiveIntegerField(help_text="Declared size in bytes")
+    received = models.PositiveIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='uploading')
+    pickup_request = models.ForeignKey(PickupRequest, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Upload {self.token} by {self.user.username} - {self.status}"
+
+class IdempotencyKey(models.Model):
+    """A client-supplied key recording which pickup a submission created."""
+    key = models.CharField(max_length=64)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    pickup_request = models.ForeignKey(PickupRequest, on_delete=models.CASCADE, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='unique_idempotency_key_per_user'),
+        ]
+
+    def __str__(self):
+        return f"{self.key} by {self.user.username}"
+
+class WebhookEvent(models.Model):
+    """A payment gateway webhook delivery, stored raw and applied later."""
+    event_id = models.CharField(max_length=100, unique=True)
+    body = models.TextField()
+    received_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    error = models.CharField(max_length=255, blank=True)
+
+    class Meta:
+        indexes = [
+            # Only the backlog is ever scanned, so index just that
+            models.Index(fields=['id'], condition=models.Q(processed_at__isnull=True),
+                         name='webhook_unprocessed_idx'),
+        ]
+
+    def __str__(self):
+        return self.event_id
+
+class Notification(models.Model):
+    """An outgoing email or SMS, written with the change it reports and sent later."""
+    CHANNEL_CHOICES = [
+        ('email', 'Email'),
+        ('sms', 'SMS'),
+    ]
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('sending', 'Sending'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES)
+    recipient = models.CharField(max_length=254)
+    subject = models.CharField(max_length=200, blank=True)
+    body = models.TextField()
+    html_body = models.TextField(blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.CharField(max_length=255, blank=True)
+    # Set with status 'sending' by the sender holding the row; see notifications.py
+    claim_token = models.UUIDField(null=True, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['channel', 'next_attempt_at'], condition=models.Q(status__in=['pending', 'sending']),
+                         name='notification_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.channel} to {self.recipient} - {self.status}"
+
+class PickupEvent(models.Model):
+    """A pickup status or payment change, streamed to the ward's worker dashboards."""
+    ward = models.ForeignKey(Ward, on_delete=models.CASCADE)
+    pickup = models.ForeignKey(PickupRequest, on_delete=models.CASCADE)
+    status = models.CharField(max_length=20)
+    payment_status = models.CharField(max_length=20, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['ward', 'id'], name='pickupevent_ward_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"Pickup {self.pickup_id} {self.status}"
+
+class SlotUsage(models.Model):
+    """How many pickups are booked in a slot on one date; see slots.py."""
+    slot = models.ForeignKey(PickupSlot, on_delete=models.CASCADE, related_name='usage')
+    date = models.DateField()
+    booked = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['slot', 'date'], name='unique_slot_usage_per_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.slot} on {self.date}: {self.booked}/{self.slot.capacity}"
+
+class UserPurge(models.Model):
+    """Progress of removing a deleted user's rows in the background; see purge.py."""
+    # Not a foreign key: the record outlives the user it describes
+    user_id = models.PositiveIntegerField(unique=True)
+    username = models.CharField(max_length=150)
+    requested_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    requested_at = models.DateTimeField(auto_now_add=True)
+    stage = models.CharField(max_length=50, blank=True, help_text="Stage in progress; empty before the first batch")
+    last_pk = models.BigIntegerField(default=0, help_text="Highest primary key handled in the current stage")
+    removed = models.JSONField(default=dict, blank=True, help_text="Rows deleted or detached per stage")
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-requested_at']
+
+    def __str__(self):
+        return f"Purge of {self.username} - {'done' if self.finished_at else self.stage or 'queued'}"
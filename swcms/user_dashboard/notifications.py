@@ -0,0 +1,331 @@
+"""
+Notification outbox.
+
+Views call notify() or queue_email() inside the transaction that makes the
+change being reported, so a notification exists exactly when the change
+commits and sending it never adds to request latency. send_pending(),
+run by the send_notifications job, drains due rows channel by channel in
+batches: one email connection (or SMS backend session) is opened per batch
+and reused for every message in it, a token bucket per channel keeps to
+NOTIFICATION_RATE_LIMITS, and failed messages are retried with exponential
+backoff until NOTIFICATION_MAX_ATTEMPTS. A batch is claimed (status
+'sending' and a token) before anything goes out and each row is saved right
+after its send; a run stops after NOTIFICATION_SEND_SECONDS, well inside
+the job's lease, and queues another if messages are left.
+
+SMS goes through NOTIFICATION_SMS_BACKEND, which follows the shape of
+Django's email backends; the console, file and in-memory backends here
+stand in for a real SMS gateway in development and tests.
+"""
+import logging
+import sys
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Notification
+
+logger = logging.getLogger(__name__)
+
+PICKUP_STATUS_MESSAGES = {
+    'picked': "Your {waste} pickup {ref} has been collected by our team.",
+    'completed': "Your {waste} pickup {ref} is complete ({weight} kg). Thank you for segregating your waste!",
+    'cancelled': "Your {waste} pickup {ref} has been cancelled.",
+}
+
+
+# SMS backends
+
+class BaseSMSBackend:
+
+    def __init__(self, fail_silently=False, **kwargs):
+        self.fail_silently = fail_silently
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send(self, recipient, body):
+        raise NotImplementedError
+
+
+class ConsoleSMSBackend(BaseSMSBackend):
+    """Write messages to stdout."""
+
+    def __init__(self, stream=None, **kwargs):
+        super().__init__(**kwargs)
+        self.stream = stream or sys.stdout
+
+    def send(self, recipient, body):
+        self.stream.write(f'SMS to {recipient}: {body}\n')
+        self.stream.flush()
+
+
+class FileSMSBackend(BaseSMSBackend):
+    """Append messages to a file under NOTIFICATION_SMS_FILE_PATH."""
+
+    def __init__(self, file_path=None, **kwargs):
+        super().__init__(**kwargs)
+        self.path = Path(file_path or getattr(settings, 'NOTIFICATION_SMS_FILE_PATH', 'sms-messages')) / 'sms.log'
+        self.stream = None
+
+    def open(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.stream = open(self.path, 'a', encoding='utf-8')
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def send(self, recipient, body):
+        self.stream.write(f'{timezone.now().isoformat()}\t{recipient}\t{body}\n')
+
+
+class LocmemSMSBackend(BaseSMSBackend):
+    """Keep messages in `LocmemSMSBackend.outbox` for tests."""
+    outbox = []
+
+    def send(self, recipient, body):
+        self.outbox.append((recipient, body))
+
+
+def get_sms_backend():
+    return import_string(getattr(settings, 'NOTIFICATION_SMS_BACKEND', 'user_dashboard.notifications.ConsoleSMSBackend'))()
+
+
+# Writing to the outbox
+
+def _schedule_sender():
+    # Imported here: tasks imports this module
+    from .tasks import send_notifications
+    send_notifications.enqueue(dedup_key='send-notifications')
+
+
+def queue_email(recipient, subject, body, html_body='', user=None):
+    """Add one email to the outbox; call inside the caller's transaction."""
+    Notification.objects.create(
+        channel='email', recipient=recipient, subject=subject, body=body, html_body=html_body, user=user,
+    )
+    _schedule_sender()
+
+
+def notify(user, subject, body):
+    """Queue a message to a user on each channel they can be reached on."""
+    rows = []
+    if user.email:
+        rows.append(Notification(user=user, channel='email', recipient=user.email, subject=subject, body=body))
+    mobile = getattr(getattr(user, 'profile', None), 'mobile_number', None)
+    if mobile:
+        rows.append(Notification(user=user, channel='sms', recipient=mobile, body=body))
+    if rows:
+        Notification.objects.bulk_create(rows)
+        _schedule_sender()
+    return rows
+
+
+def notify_pickup_status(pickup):
+    template = PICKUP_STATUS_MESSAGES.get(pickup.status)
+    if template is None:
+        return []
+    body = template.format(
+        waste=pickup.get_waste_type_display().lower(),
+        ref=str(pickup.request_id)[:8],
+        weight=pickup.waste_weight,
+    )
+    return notify(pickup.user, f'Pickup {pickup.get_status_display().lower()}', body)
+
+
+def notify_payment_received(payment):
+    body = f"We received your payment of Rs {payment.amount} for pickup {str(payment.pickup_request.request_id)[:8]}."
+    return notify(payment.user, 'Payment received', body)
+
+
+# Sending
+
+class TokenBucket:
+    """Allow `rate` sends per second on average with bursts up to `burst`."""
+
+    def __init__(self, rate, burst=None, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.clock = clock
+        self.sleep = sleep
+        self.updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            now = self.clock()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens < 1:
+                wait = (1 - self.tokens) / self.rate
+                self.sleep(wait)
+                self.updated = self.clock()
+                self.tokens = 0
+            else:
+                self.tokens -= 1
+
+
+_buckets = {}
+
+
+def _bucket(channel):
+    rate = getattr(settings, 'NOTIFICATION_RATE_LIMITS', {}).get(channel)
+    if rate is None:
+        return None
+    bucket = _buckets.get(channel)
+    if bucket is None or bucket.rate != rate:
+        bucket = _buckets[channel] = TokenBucket(rate)
+    return bucket
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=min(3600, 30 * 2 ** (attempts - 1)))
+
+
+class _EmailSender:
+
+    def __init__(self):
+        self.connection = get_connection()
+
+    def open(self):
+        self.connection.open()
+
+    def close(self):
+        self.connection.close()
+
+    def send(self, notification):
+        message = EmailMultiAlternatives(
+            notification.subject, notification.body, to=[notification.recipient], connection=self.connection,
+        )
+        if notification.html_body:
+            message.attach_alternative(notification.html_body, 'text/html')
+        message.send()
+
+
+class _SMSSender:
+
+    def __init__(self):
+        self.backend = get_sms_backend()
+
+    def open(self):
+        self.backend.open()
+
+    def close(self):
+        self.backend.close()
+
+    def send(self, notification):
+        self.backend.send(notification.recipient, notification.body)
+
+
+SENDERS = {'email': _EmailSender, 'sms': _SMSSender}
+
+
+def _send_seconds():
+    return getattr(settings, 'NOTIFICATION_SEND_SECONDS', 120)
+
+
+def _claim(channel, batch_size, now, hold_until):
+    """Mark up to `batch_size` due rows as being sent by us; return them."""
+    # Rows left 'sending' by a sender that died come due again when its hold runs out
+    due = (
+        Notification.objects
+        .filter(channel=channel, status__in=['pending', 'sending'], next_attempt_at__lte=now)
+    )
+    ids = list(due.order_by('next_attempt_at', 'pk').values_list('pk', flat=True)[:batch_size])
+    if not ids:
+        return []
+    token = uuid.uuid4()
+    # Conditional, so rows another sender claimed in between are left to it
+    due.filter(pk__in=ids).update(status='sending', claim_token=token, next_attempt_at=hold_until)
+    return list(Notification.objects.filter(claim_token=token, status='sending').order_by('pk'))
+
+
+def send_batch(channel, batch_size=None, deadline=None):
+    """
+    Send one batch of due notifications on a channel; return (sent, failed).
+
+    The batch is claimed first, each row is saved as soon as it is sent, and
+    rows not reached by `deadline` go back to the queue, so a sender that
+    dies or outlives its job's lease sends nothing twice but the one message
+    in flight.
+    """
+    batch_size = batch_size or getattr(settings, 'NOTIFICATION_BATCH_SIZE', 100)
+    max_attempts = getattr(settings, 'NOTIFICATION_MAX_ATTEMPTS', 5)
+    now = timezone.now()
+    deadline = deadline or now + timedelta(seconds=_send_seconds())
+    batch = _claim(channel, batch_size, now, deadline + timedelta(seconds=60))
+    if not batch:
+        return 0, 0
+
+    token = batch[0].claim_token
+    sender = SENDERS[channel]()
+    bucket = _bucket(channel)
+    sent = failed = 0
+    sender.open()
+    try:
+        for index, notification in enumerate(batch):
+            if bucket is not None:
+                bucket.acquire()
+            if timezone.now() >= deadline:
+                # Out of time: hand the rest back for the next run
+                unsent = [row.pk for row in batch[index:]]
+                Notification.objects.filter(pk__in=unsent, claim_token=token).update(
+                    status='pending', claim_token=None, next_attempt_at=timezone.now(),
+                )
+                break
+            notification.attempts += 1
+            notification.claim_token = None
+            try:
+                sender.send(notification)
+            except Exception as exc:
+                failed += 1
+                notification.last_error = repr(exc)[:255]
+                if notification.attempts >= max_attempts:
+                    notification.status = 'failed'
+                else:
+                    notification.status = 'pending'
+                    notification.next_attempt_at = timezone.now() + retry_delay(notification.attempts)
+                logger.warning('Sending %s notification %s failed: %r', channel, notification.pk, exc)
+            else:
+                sent += 1
+                notification.status = 'sent'
+                notification.sent_at = timezone.now()
+            notification.save(update_fields=['status', 'attempts', 'next_attempt_at', 'sent_at', 'last_error', 'claim_token'])
+    finally:
+        sender.close()
+    return sent, failed
+
+
+def send_pending(max_batches=50, seconds=None):
+    """
+    Drain due notifications on every channel for up to `seconds`
+    (NOTIFICATION_SEND_SECONDS, well inside the job lease); return
+    (sent, more), `more` being whether due rows were left.
+    """
+    deadline = timezone.now() + timedelta(seconds=seconds or _send_seconds())
+    total = 0
+    more = False
+    for channel in SENDERS:
+        for _ in range(max_batches):
+            if timezone.now() >= deadline:
+                return total, True
+            sent, failed = send_batch(channel, deadline=deadline)
+            total += sent
+            if not sent and not failed:
+                break
+        else:
+            more = True
+    return total, more
@@ -0,0 +1,234 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+When PROFILER_ENABLED is set, SamplingProfilerMiddleware profiles a request
+if it is picked by PROFILER_SAMPLE_RATE, carries the PROFILER_HEADER header
+from a staff or admin user, or resolves to one of PROFILER_URL_NAMES. A
+background thread samples the request thread's stack every PROFILER_INTERVAL seconds, so
+the view itself runs uninstrumented. Each profile is written to PROFILER_DIR
+as a collapsed-stack file (for flamegraph.pl / inferno) and a speedscope
+JSON file; only the newest PROFILER_MAX_PROFILES are kept.
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import FileResponse, Http404
+from django.shortcuts import render
+
+from .views import role_required
+
+logger = logging.getLogger(__name__)
+
+COLLAPSED_SUFFIX = '.collapsed'
+SPEEDSCOPE_SUFFIX = '.speedscope.json'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def profile_dir():
+    return Path(_setting('PROFILER_DIR', Path(settings.BASE_DIR) / 'profiles'))
+
+
+class StackSampler:
+    """Sample one thread's Python stack from a background thread."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+        self.started_at = None
+        self.duration = 0.0
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({code.co_filename}:{code.co_firstlineno})')
+                frame = frame.f_back
+            stack.reverse()
+            self.stacks[tuple(stack)] += 1
+
+
+def to_collapsed(stacks):
+    """Render sampled stacks in Brendan Gregg's collapsed format."""
+    return ''.join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.most_common())
+
+
+def to_speedscope(stacks, name, interval, duration):
+    """Render sampled stacks as a speedscope 'sampled' profile."""
+    frame_index = {}
+    frames = []
+    samples = []
+    weights = []
+    for stack, count in stacks.items():
+        indices = []
+        for frame in stack:
+            if frame not in frame_index:
+                frame_index[frame] = len(frames)
+                func, _, location = frame.partition(' (')
+                file, _, line = location.rstrip(')').rpartition(':')
+                frames.append({'name': func, 'file': file, 'line': int(line) if line.isdigit() else None})
+            indices.append(frame_index[frame])
+        samples.append(indices)
+        weights.append(count * interval)
+    return {
+        '$schema': 'https://www.speedscope.app/file-format-schema.json',
+        'shared': {'frames': frames},
+        'profiles': [{
+            'type': 'sampled',
+            'name': name,
+            'unit': 'seconds',
+            'startValue': 0,
+            'endValue': duration,
+            'samples': samples,
+            'weights': weights,
+        }],
+        'name': name,
+        'exporter': 'swcms',
+    }
+
+
+def save_profile(sampler, view_name):
+    """Write a profile to disk and trim the ring buffer. Returns the stem."""
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    safe_view = ''.join(c if c.isalnum() or c in '-_' else '_' for c in view_name)
+    stem = f"{time.strftime('%Y%m%d-%H%M%S')}-{safe_view}-{uuid.uuid4().hex[:8]}"
+    (directory / f'{stem}{COLLAPSED_SUFFIX}').write_text(to_collapsed(sampler.stacks))
+    (directory / f'{stem}{SPEEDSCOPE_SUFFIX}').write_text(json.dumps(
+        to_speedscope(sampler.stacks, view_name, sampler.interval, sampler.duration)
+    ))
+    _trim_ring_buffer(directory, _setting('PROFILER_MAX_PROFILES', 50))
+    return stem
+
+
+def _trim_ring_buffer(directory, max_profiles):
+    profiles = list_profiles(directory)
+    for profile in profiles[max_profiles:]:
+        for path in profile['paths']:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles(directory=None):
+    """Return saved profiles, newest first."""
+    directory = directory or profile_dir()
+    if not directory.is_dir():
+        return []
+    grouped = {}
+    for path in directory.iterdir():
+        for suffix in (COLLAPSED_SUFFIX, SPEEDSCOPE_SUFFIX):
+            if path.name.endswith(suffix):
+                stem = path.name[:-len(suffix)]
+                entry = grouped.setdefault(stem, {'name': stem, 'paths': [], 'mtime': 0, 'size': 0})
+                stat = path.stat()
+                entry['paths'].append(path)
+                entry['mtime'] = max(entry['mtime'], stat.st_mtime)
+                entry['size'] += stat.st_size
+    return sorted(grouped.values(), key=lambda entry: entry['name'], reverse=True)
+
+
+class SamplingProfilerMiddleware:
+    """Profile a configurable subset of requests with StackSampler."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.enabled = _setting('PROFILER_ENABLED', False)
+        self.sample_rate = _setting('PROFILER_SAMPLE_RATE', 0.0)
+        self.header = 'HTTP_' + _setting('PROFILER_HEADER', 'X-Profile').upper().replace('-', '_')
+        self.url_names = set(_setting('PROFILER_URL_NAMES', ()))
+        self.interval = _setting('PROFILER_INTERVAL', 0.005)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        sampler = getattr(request, '_profiler_sampler', None)
+        if sampler is not None:
+            sampler.stop()
+            try:
+                save_profile(sampler, request.resolver_match.view_name or 'unknown')
+            except OSError:
+                logger.exception('Could not save request profile')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not self.enabled or not self._should_profile(request):
+            return None
+        sampler = StackSampler(threading.get_ident(), self.interval)
+        request._profiler_sampler = sampler
+        sampler.start()
+        return None
+
+    def _should_profile(self, request):
+        if request.resolver_match.url_name in self.url_names:
+            return True
+        if request.META.get(self.header) and self._is_admin(request.user):
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @staticmethod
+    def _is_admin(user):
+        if not user.is_authenticated:
+            return False
+        if user.is_staff:
+            return True
+        profile = getattr(user, 'profile', None)
+        return profile is not None and profile.role == 'admin'
+
+
+@login_required
+@role_required(['admin'])
+def admin_profiles_view(request):
+    """List captured request profiles"""
+    profiles = list_profiles()
+    for profile in profiles:
+        profile['captured_at'] = time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(profile['mtime']))
+    if not _setting('PROFILER_ENABLED', False):
+        messages.info(request, "The sampling profiler is disabled. Set PROFILER_ENABLED to capture profiles.")
+    context = {
+        'profiles': profiles,
+        'page_title': 'Request Profiles',
+    }
+    return render(request, 'user_dashboard/admin_profiles.html', context)
+
+
+@login_required
+@role_required(['admin'])
+def admin_profile_download_view(request, name, fmt):
+    """Download a captured profile as collapsed stacks or speedscope JSON"""
+    suffix = {'collapsed': COLLAPSED_SUFFIX, 'speedscope': SPEEDSCOPE_SUFFIX}.get(fmt)
+    if suffix is None or '/' in name or '\\' in name or name.startswith('.'):
+        raise Http404
+    path = profile_dir() / f'{name}{suffix}'
+    if not path.is_file():
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=True, filename=path.name)
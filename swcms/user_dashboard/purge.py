@@ -0,0 +1,174 @@
+"""
+Deleting users without holding the database for the length of it.
+
+user.delete() collects every pickup, payment, event, upload, key and
+notification of the user in memory and removes them in one transaction,
+which for a long-standing household keeps writers waiting on the admin's
+request. soft_delete_user() instead marks the profile deleted (the default
+Profile manager then leaves it out of listings, rankings and assignment),
+deactivates the account so it can no longer sign in, hands a worker's
+pending pickups to others and records a UserPurge. A household's pending
+pickups are cancelled there and then, as if the household had cancelled
+them: their slot places are freed, and assignment, the worker dashboards
+and offline sync, which only deal in pending pickups, drop them at once
+rather than when the purge reaches them.
+
+The purge_deleted_users job works through STAGES for each UserPurge. A
+stage deletes the user's rows of one table, or detaches them where they
+outlive the user (Django's SET_NULL), in batches of USER_PURGE_BATCH_SIZE
+taken by ascending primary key. Each batch commits with the purge's
+progress (stage, last primary key, rows so far), so a job that dies resumes
+at the next batch. Tables that reference others go first, so the cascades
+Django would add to a batch find nothing left to collect, and the user row
+goes last. `manage.py purge_deleted_users` runs the job by hand and reports
+progress.
+"""
+import os
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.admin.models import LogEntry
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .assignment import hand_back
+from .live import publish_pickup_changes
+from .models import (
+    Feedback, IdempotencyKey, Notification, Payment, PhotoUpload, PickupEvent, PickupRequest, Profile, Reward,
+    UserPurge,
+)
+from .slots import release_pickups
+from .uploads import upload_path
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _remove_part_files(uploads):
+    for upload in uploads.only('token'):
+        try:
+            os.remove(upload_path(upload))
+        except FileNotFoundError:
+            pass
+
+
+class Stage:
+    """The rows of `model` matching any of `lookups` = user id; `detach` names the field to clear instead of deleting."""
+
+    def __init__(self, name, model, *lookups, detach=None, before_delete=None):
+        self.name = name
+        self.model = model
+        self.lookups = lookups
+        self.detach = detach
+        self.before_delete = before_delete
+
+    def rows(self, user_id):
+        manager = getattr(self.model, 'all_objects', self.model._default_manager)
+        return manager.filter(reduce(or_, (Q(**{lookup: user_id}) for lookup in self.lookups)))
+
+    def run_batch(self, user_id, after, size):
+        """Handle the next `size` rows past primary key `after`; return (rows, last pk), or (0, None) when done."""
+        rows = self.rows(user_id).filter(pk__gt=after)
+        ids = list(rows.order_by('pk').values_list('pk', flat=True)[:size])
+        if not ids:
+            return 0, None
+        batch = rows.filter(pk__lte=ids[-1])
+        if self.detach:
+            return batch.update(**{self.detach: None}), ids[-1]
+        if self.before_delete:
+            self.before_delete(batch)
+        return batch.delete()[0], ids[-1]
+
+
+STAGES = [
+    Stage('pickup events', PickupEvent, 'pickup__user'),
+    Stage('payments', Payment, 'user', 'pickup_request__user'),
+    Stage('idempotency keys', IdempotencyKey, 'user', 'pickup_request__user'),
+    Stage('uploads', PhotoUpload, 'user', before_delete=_remove_part_files),
+    # soft_delete_user() cancelled the pending ones; this catches any that
+    # raced it, so their slot places are still given back
+    Stage('pickups', PickupRequest, 'user', before_delete=release_pickups),
+    Stage('assigned pickups', PickupRequest, 'assigned_to', detach='assigned_to'),
+    Stage('claimed pickups', PickupRequest, 'claimed_by', detach='claimed_by'),
+    Stage('feedback', Feedback, 'user'),
+    Stage('notifications', Notification, 'user', detach='user'),
+    Stage('rewards', Reward, 'user'),
+    Stage('admin log', LogEntry, 'user'),
+    Stage('profile', Profile, 'user'),
+    # Cascades whatever was added since its stage ran, which is little
+    Stage('user', User, 'pk'),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+
+def _schedule_purge():
+    # Imported here: tasks imports this module
+    from .tasks import purge_deleted_users
+    purge_deleted_users.enqueue(dedup_key='purge-deleted-users')
+
+
+def _cancel_pending_pickups(user):
+    pending = PickupRequest.objects.filter(user=user, status='pending')
+    pickup_ids = list(pending.values_list('pk', flat=True))
+    if not pickup_ids:
+        return
+    release_pickups(pending)
+    # updated_at by hand, as update() skips auto_now and sync relies on it
+    PickupRequest.objects.filter(pk__in=pickup_ids, status='pending').update(
+        status='cancelled', updated_at=timezone.now(),
+    )
+    publish_pickup_changes(pickup_ids)
+
+
+def soft_delete_user(user, requested_by=None):
+    """Hide `user` at once and queue the removal of their data; return the UserPurge."""
+    with transaction.atomic():
+        role = Profile.objects.filter(user=user).values_list('role', flat=True).first()
+        Profile.all_objects.filter(user=user).update(deleted_at=timezone.now())
+        User.objects.filter(pk=user.pk).update(is_active=False)
+        purge, _ = UserPurge.objects.get_or_create(
+            user_id=user.pk, defaults={'username': user.username, 'requested_by': requested_by},
+        )
+        if role == 'worker':
+            hand_back(user.pk)
+        _cancel_pending_pickups(user)
+        _schedule_purge()
+    return purge
+
+
+def purge_step(purge, batch_size=None):
+    """Run one batch of `purge`; return False once the user is gone."""
+    if purge.finished_at:
+        return False
+    batch_size = batch_size or _setting('USER_PURGE_BATCH_SIZE', 500)
+    with transaction.atomic():
+        index = STAGE_NAMES.index(purge.stage) if purge.stage else 0
+        stage = STAGES[index]
+        count, last_pk = stage.run_batch(purge.user_id, purge.last_pk, batch_size)
+        if last_pk is not None:
+            purge.stage = stage.name
+            purge.last_pk = last_pk
+            purge.removed[stage.name] = purge.removed.get(stage.name, 0) + count
+        elif index + 1 < len(STAGES):
+            purge.stage = STAGE_NAMES[index + 1]
+            purge.last_pk = 0
+        else:
+            purge.finished_at = timezone.now()
+        purge.save()
+    return not purge.finished_at
+
+
+def purge_pending(batch_size=None, max_batches=None):
+    """Work through unfinished purges, oldest first, for up to `max_batches`; return True if any remain."""
+    max_batches = max_batches or _setting('USER_PURGE_MAX_BATCHES', 200)
+    batches = 0
+    for purge in UserPurge.objects.filter(finished_at__isnull=True).order_by('requested_at', 'pk'):
+        while purge_step(purge, batch_size):
+            batches += 1
+            if batches >= max_batches:
+                return True
+    return False
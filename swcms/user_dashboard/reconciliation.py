@@ -0,0 +1,229 @@
+"""
+Nightly payment reconciliation.
+
+Settlement rows are streamed from a CSV export (iter_csv_rows) or page by
+page from the gateway API (iter_api_rows) and handled in fixed-size chunks:
+each chunk's keys are resolved with one indexed query per kind of row into
+an in-memory map, compared, and any corrections are written back with a
+single bulk_update. Online payments are keyed by razorpay_order_id; cash
+collections (type "cash") by the pickup's request_id in the receipt column;
+a receipt that is not a UUID cannot name a pickup and is reported as an
+unknown payment. Only the current chunk is ever held in memory, and
+completed payments the report never mentioned are found afterwards with a
+query over the payments completed that day that were neither stamped with
+reconciled_at nor reported during the run.
+Every problem becomes a row in the mismatch report.
+"""
+import csv
+import uuid
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils import timezone
+
+from .live import publish_pickup_changes
+from .models import Payment
+
+REPORT_FIELDS = ['issue', 'kind', 'key', 'payment_id', 'expected_amount', 'reported_amount', 'status']
+
+
+def _report_paise(value):
+    """Whole paise from a report's amount (10000, "10000" or "10000.00"), or None if it isn't one."""
+    try:
+        amount = Decimal(str(value).strip())
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount != amount.to_integral_value():
+        return None
+    return int(amount)
+
+
+def _row(kind, key, payment_id, amount, settled=True):
+    return {
+        'kind': kind, 'key': key, 'payment_id': payment_id, 'settled': settled,
+        # Unreadable amounts are reported with the row, as given
+        'amount': _report_paise(amount), 'amount_text': '' if amount is None else str(amount),
+    }
+
+
+def iter_csv_rows(fileobj):
+    """Yield normalised rows from a settlement CSV, one line at a time.
+
+    Expected columns: type, entity_id, order_id, receipt, amount (in paise)
+    and optionally settled.
+    """
+    for line in csv.DictReader(fileobj):
+        kind = (line.get('type') or '').strip()
+        key = (line.get('receipt') if kind == 'cash' else line.get('order_id')) or ''
+        yield _row(
+            kind, key.strip(), (line.get('entity_id') or '').strip(), line.get('amount'),
+            (line.get('settled') or '1').strip().lower() not in ('0', 'false', 'no'),
+        )
+
+
+def iter_api_rows(gateway, day, page_size=100):
+    """Yield normalised rows from the gateway's paged settlement report."""
+    skip = 0
+    while True:
+        page = gateway.settlement_report(day, count=page_size, skip=skip)['items']
+        for item in page:
+            yield _row(
+                item.get('type', ''), item.get('order_id') or '', item.get('entity_id', ''),
+                item.get('amount', 0), bool(item.get('settled', True)),
+            )
+        if len(page) < page_size:
+            return
+        skip += page_size
+
+
+def _receipt(value):
+    """The pickup request_id a cash receipt names, in any of its spellings, or None."""
+    try:
+        return uuid.UUID(value)
+    except ValueError:
+        return None
+
+
+def _key(row):
+    """The (kind, key) a row is looked up by; cash receipts as UUIDs."""
+    return row['kind'], _receipt(row['key']) if row['kind'] == 'cash' else row['key']
+
+
+def _chunks(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _paise(amount):
+    return int(amount * 100)
+
+
+class Reconciler:
+    """Match settlement rows against payments; see the module docstring."""
+
+    def __init__(self, day, report_writer=None, chunk_size=1000, apply=True):
+        self.day = day
+        self.report = report_writer
+        self.chunk_size = chunk_size
+        self.apply = apply
+        self.stamp = timezone.now()
+        # Payments already reported from a row; small, unlike the whole report
+        self.flagged = set()
+        self.stats = {
+            'rows': 0, 'matched': 0, 'updated': 0, 'skipped': 0,
+            'mismatched': 0, 'unsettled': 0,
+        }
+
+    def _mismatch(self, issue, row=None, payment=None):
+        self.stats['mismatched'] += 1
+        if row is not None and payment is not None:
+            self.flagged.add(payment.pk)
+        if self.report is not None:
+            self.report.writerow({
+                'issue': issue,
+                'kind': row['kind'] if row else ('cash' if payment.razorpay_payment_id == 'cash' else 'payment'),
+                'key': row['key'] if row else (payment.razorpay_order_id or str(payment.pickup_request.request_id)),
+                'payment_id': row['payment_id'] if row else payment.razorpay_payment_id,
+                'expected_amount': _paise(payment.amount) if payment is not None else '',
+                'reported_amount': (row['amount'] if row['amount'] is not None else row['amount_text']) if row else '',
+                'status': payment.status if payment is not None else '',
+            })
+
+    def _lookup(self, chunk):
+        """Map (kind, key) to Payment for a chunk with one query per kind."""
+        order_ids = {row['key'] for row in chunk if row['kind'] == 'payment'}
+        receipts = {_receipt(row['key']) for row in chunk if row['kind'] == 'cash'} - {None}
+        payments = {}
+        fields = (
+            'id', 'pickup_request', 'amount', 'status', 'razorpay_order_id', 'razorpay_payment_id',
+            'reconciled_at', 'updated_at',
+        )
+        if order_ids:
+            for payment in Payment.objects.filter(razorpay_order_id__in=order_ids).only(*fields):
+                payments[('payment', payment.razorpay_order_id)] = payment
+        if receipts:
+            matched = (
+                Payment.objects
+                .filter(pickup_request__request_id__in=receipts)
+                .only(*fields, 'pickup_request__request_id')
+                .select_related('pickup_request')
+            )
+            for payment in matched:
+                payments[('cash', payment.pickup_request.request_id)] = payment
+        return payments
+
+    def _match(self, row, payment, changed, completed):
+        if payment is None:
+            return self._mismatch('unknown payment', row)
+        if row['amount'] is None:
+            return self._mismatch('unreadable amount', row, payment)
+        if payment.reconciled_at == self.stamp:
+            return self._mismatch('duplicate row', row, payment)
+        if row['amount'] != _paise(payment.amount):
+            return self._mismatch('amount differs', row, payment)
+        if not row['settled']:
+            return self._mismatch('not settled', row, payment)
+        if row['kind'] == 'cash' and payment.razorpay_payment_id not in (None, '', 'cash'):
+            return self._mismatch('paid online but settled as cash', row, payment)
+
+        if payment.status != 'completed':
+            # The gateway (or the cash ledger) has the money: trust it
+            payment.status = 'completed'
+            payment.razorpay_payment_id = row['payment_id'] if row['kind'] == 'payment' else 'cash'
+            payment.updated_at = self.stamp
+            completed.append(payment.pickup_request_id)
+            self.stats['updated'] += 1
+        elif row['kind'] == 'payment' and payment.razorpay_payment_id != row['payment_id']:
+            return self._mismatch('payment id differs', row, payment)
+        else:
+            self.stats['matched'] += 1
+        payment.reconciled_at = self.stamp
+        changed[payment.pk] = payment
+
+    def run(self, rows):
+        for chunk in _chunks(rows, self.chunk_size):
+            self.stats['rows'] += len(chunk)
+            payments = self._lookup(chunk)
+            changed = {}
+            completed = []
+            for row in chunk:
+                if row['kind'] not in ('payment', 'cash'):
+                    self.stats['skipped'] += 1
+                    continue
+                self._match(row, payments.get(_key(row)), changed, completed)
+            if self.apply and changed:
+                with transaction.atomic():
+                    Payment.objects.bulk_update(
+                        changed.values(), ['status', 'razorpay_payment_id', 'reconciled_at', 'updated_at'],
+                    )
+                    publish_pickup_changes(completed)
+        self._report_unsettled()
+        return self.stats
+
+    def _report_unsettled(self):
+        """Payments completed on the day that no settlement row covered."""
+        if not self.apply:
+            # Nothing was stamped, so rows matched in this run can't be told apart
+            return
+        start = timezone.make_aware(datetime.combine(self.day, time.min))
+        # Payments are created pending with the pickup and completed later;
+        # every path that completes one stamps updated_at, and nothing changes
+        # a completed payment afterwards, so updated_at is when it was paid
+        unsettled = (
+            Payment.objects
+            .filter(updated_at__gte=start, updated_at__lt=start + timedelta(days=1), status='completed')
+            .exclude(reconciled_at=self.stamp)
+            .select_related('pickup_request')
+            .only('id', 'amount', 'status', 'razorpay_order_id', 'razorpay_payment_id', 'pickup_request__request_id')
+        )
+        for payment in unsettled.iterator(chunk_size=self.chunk_size):
+            if payment.pk in self.flagged:
+                continue
+            self.stats['unsettled'] += 1
+            self._mismatch('missing from settlement', payment=payment)
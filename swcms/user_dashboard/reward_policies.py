@@ -0,0 +1,175 @@
+"""
+What-if evaluation of reward policies.
+
+recalculate_user_rewards ranks households by environmental impact (kg of
+each waste type times its weight, lower is better) and spreads points
+linearly over the ranks, from MAX_POINTS for the best to MIN_POINTS for the
+worst. Committees trying other weights or point scales can evaluate them
+here against the recorded history before changing the job.
+
+RewardHistory reads completed pickups once into columns (household index,
+waste-type code, kg) and sums them into a households x waste-types matrix. A policy only changes the weights, so the impacts of many policies
+are one matrix product, and their rankings one argsort along each column.
+The columns follow the job's tie-break (equal impact goes to the lower user
+id) and its points formula, so CURRENT_POLICY reproduces the points the job
+awards. compare() reports for each policy how ranks move, how points are
+distributed, and how the average per ward shifts against a baseline.
+"""
+from decimal import Decimal
+
+import numpy as np
+
+from .models import PickupRequest, Profile
+
+# Used by recalculate_user_rewards; higher weight = more harmful
+IMPACT_WEIGHTS = {
+    'wet': Decimal('1.0'),
+    'dry': Decimal('1.0'),
+    'recyclable': Decimal('0.5'),
+    'plastic': Decimal('2.0'),
+    'e-waste': Decimal('3.0'),
+}
+DEFAULT_WEIGHT = Decimal('1.0')
+MIN_POINTS = Decimal('10')
+MAX_POINTS = Decimal('100')
+
+NO_WARD = -1
+
+
+class Policy:
+
+    def __init__(self, name, weights=None, min_points=MIN_POINTS, max_points=MAX_POINTS, default_weight=DEFAULT_WEIGHT):
+        self.name = name
+        self.weights = {waste_type: float(weight) for waste_type, weight in (weights or {}).items()}
+        self.default_weight = float(default_weight)
+        self.min_points = float(min_points)
+        self.max_points = float(max_points)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data['name'], data.get('weights'), data.get('min_points', MIN_POINTS),
+            data.get('max_points', MAX_POINTS), data.get('default_weight', DEFAULT_WEIGHT),
+        )
+
+    def weight(self, waste_type):
+        return self.weights.get(waste_type, self.default_weight)
+
+    def __repr__(self):
+        return f'<Policy {self.name}>'
+
+
+CURRENT_POLICY = Policy('current', IMPACT_WEIGHTS)
+
+
+class RewardHistory:
+    """Completed-pickup kg per household and waste type, ready for policy evaluation."""
+
+    def __init__(self, user_ids, ward_ids, waste_types, user_index, type_code, kg):
+        # user_ids ascending, so a stable sort on impact breaks ties by user id
+        self.user_ids = np.asarray(user_ids, dtype=np.int64)
+        self.ward_ids = np.asarray(ward_ids, dtype=np.int64)
+        self.waste_types = list(waste_types)
+        n, t = len(self.user_ids), len(self.waste_types)
+        codes = np.asarray(user_index, dtype=np.int64) * t + np.asarray(type_code, dtype=np.int64)
+        # Kept in whole hundredths of a kg (the field's precision), which add
+        # up exactly, so households the job sees as tied stay tied
+        hundredths = np.rint(np.asarray(kg, dtype=float) * 100)
+        self.hundredths = np.bincount(codes, weights=hundredths, minlength=n * t).reshape(n, t)
+        self.pickups = len(codes)
+
+    @classmethod
+    def load(cls):
+        pickups = (
+            PickupRequest.objects
+            .filter(status='completed', waste_weight__isnull=False)
+            .values_list('user_id', 'waste_type', 'waste_weight')
+        )
+        users, codes, kg, type_codes = [], [], [], {}
+        for user_id, waste_type, weight in pickups.iterator(chunk_size=10000):
+            users.append(user_id)
+            codes.append(type_codes.setdefault(waste_type, len(type_codes)))
+            kg.append(weight)
+        users = np.asarray(users, dtype=np.int64)
+        # The job also ranks households with no completed pickups yet
+        households = Profile.objects.filter(role='user').values_list('user_id', flat=True)
+        user_ids = np.union1d(np.fromiter(households, dtype=np.int64), users)
+        ward_of = dict(Profile.objects.values_list('user_id', 'ward_id'))
+        return cls(
+            user_ids,
+            [ward_of.get(user_id) or NO_WARD for user_id in user_ids.tolist()],
+            list(type_codes),
+            np.searchsorted(user_ids, users),
+            codes,
+            np.asarray(kg, dtype=float),
+        )
+
+    def impacts(self, policies):
+        """Impact of every household under each policy, in weighted hundredths of a kg: (households, policies)."""
+        weights = np.array([[policy.weight(t) for policy in policies] for t in self.waste_types]).reshape(-1, len(policies))
+        return self.hundredths @ weights
+
+    def ranks(self, policies):
+        """Rank of every household under each policy, 0 being the best."""
+        impacts = self.impacts(policies)
+        order = np.argsort(impacts, axis=0, kind='stable')
+        ranks = np.empty_like(order)
+        np.put_along_axis(ranks, order, np.arange(len(self.user_ids))[:, None], axis=0)
+        return ranks
+
+    def points(self, policies, ranks=None):
+        """Points every household would get under each policy: (households, policies)."""
+        ranks = self.ranks(policies) if ranks is None else ranks
+        n = len(self.user_ids)
+        low = np.array([policy.min_points for policy in policies])
+        high = np.array([policy.max_points for policy in policies])
+        if n == 1:
+            return np.floor(high)[None, :].astype(np.int64)
+        ratio = (n - 1 - ranks) / (n - 1)
+        # The job truncates Decimal points; the epsilon keeps exact integers
+        # from landing just below themselves in floating point
+        return np.floor(low + (high - low) * ratio + 1e-9).astype(np.int64)
+
+    def compare(self, policies, baseline=CURRENT_POLICY, top=10):
+        """Per-policy report of rank changes, point distribution and ward effects against `baseline`."""
+        everything = [baseline, *policies]
+        ranks = self.ranks(everything)
+        points = self.points(everything, ranks)
+        n = len(self.user_ids)
+        shift = ranks[:, 1:] - ranks[:, :1]
+
+        wards, ward_index = np.unique(self.ward_ids, return_inverse=True)
+        per_ward = np.stack([np.bincount(ward_index, weights=points[:, p]) for p in range(len(everything))], axis=1)
+        per_ward /= np.bincount(ward_index)[:, None]
+        ward_shift = per_ward[:, 1:] - per_ward[:, :1]
+
+        top = min(top, n)
+        base_top = set(np.argsort(ranks[:, 0])[:top].tolist())
+        reports = []
+        for p, policy in enumerate(policies):
+            column = points[:, p + 1]
+            moved = np.abs(shift[:, p])
+            spearman = 1 - 6 * float((shift[:, p].astype(float) ** 2).sum()) / (n * (n * n - 1)) if n > 1 else 1.0
+            policy_top = set(np.argsort(ranks[:, p + 1])[:top].tolist())
+            biggest = np.argsort(-np.abs(ward_shift[:, p]))[:3]
+            reports.append({
+                'policy': policy.name,
+                'households': n,
+                'spearman': spearman,
+                'changed': int((moved > 0).sum()),
+                'mean_rank_shift': float(moved.mean()) if n else 0.0,
+                'max_rank_shift': int(moved.max()) if n else 0,
+                'top_overlap': len(base_top & policy_top) / top if top else 1.0,
+                'points': {
+                    'total': int(column.sum()),
+                    'mean': float(column.mean()) if n else 0.0,
+                    'percentiles': dict(zip(('p0', 'p25', 'p50', 'p75', 'p100'),
+                                            np.percentile(column, [0, 25, 50, 75, 100]).tolist() if n else [0.0] * 5)),
+                },
+                'wards': [
+                    {'ward_id': None if wards[w] == NO_WARD else int(wards[w]),
+                     'mean_points': float(per_ward[w, p + 1]), 'change': float(ward_shift[w, p])}
+                    for w in biggest.tolist()
+                ],
+            })
+        return reports
@@ -0,0 +1,204 @@
+"""
+Full-text search over feedback and pickup descriptions.
+
+On SQLite each searchable model has an FTS5 table (porter-stemmed, so
+"overflowing" finds "overflow") holding an external-content index of its
+text columns. Triggers created in migration 0021 keep it in step with every
+insert, update and delete, including bulk_create(), bulk_update() and
+queryset.update(), which signals would miss. On PostgreSQL the same columns
+are matched through a GIN index over their weighted tsvector, which needs
+no upkeep. Other backends fall back to icontains. Django rebuilds a SQLite
+table for some schema changes, which drops its triggers; `manage.py
+rebuild_search_index` puts them back and re-indexes.
+
+search() puts the match, the caller's ORM filters (ward, status, dates) as
+a derived table, the ranking (bm25 or ts_rank) and the LIMIT into a single
+statement. The text index drives it, so only matching rows are filtered and
+ranked, and only the top hits are fetched, each with a highlighted snippet.
+Queries are reduced to plain words: every word must match, and the last one
+also matches as a prefix, so results keep up while someone is typing.
+"""
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+from .models import Feedback, PickupRequest
+
+# Private-use characters survive HTML escaping, so the highlight can be
+# added after the snippet text is made safe
+MARK_START, MARK_END = '\ue000', '\ue001'
+MAX_TERMS = 8
+PG_CONFIG = 'english'
+
+
+class SearchIndex:
+
+    def __init__(self, model, table, columns, weights):
+        self.model = model
+        self.table = table
+        self.columns = columns
+        # bm25 weight and tsvector class per column, most important first
+        self.weights = weights
+
+    @property
+    def source(self):
+        return self.model._meta.db_table
+
+    def tsvector_sql(self, alias=None):
+        # Must stay identical to the expression indexed in migration 0021
+        prefix = f'{alias}.' if alias else ''
+        return ' || '.join(
+            f"setweight(to_tsvector('{PG_CONFIG}', coalesce({prefix}{column}, '')), '{pg_weight}')"
+            for column, (_, pg_weight) in zip(self.columns, self.weights)
+        )
+
+
+FEEDBACK = SearchIndex(
+    Feedback, 'search_feedback', ['subject', 'message', 'response'], [(4.0, 'A'), (1.0, 'B'), (0.5, 'C')],
+)
+PICKUPS = SearchIndex(PickupRequest, 'search_pickup', ['description'], [(1.0, 'A')])
+INDEXES = {'feedback': FEEDBACK, 'pickups': PICKUPS}
+
+
+def terms(text):
+    return re.findall(r'\w+', (text or '').lower())[:MAX_TERMS]
+
+
+def sqlite_triggers(index):
+    """CREATE TRIGGER statements keeping the index's FTS table in step with its source."""
+    table, source, cols = index.table, index.source, ', '.join(index.columns)
+    new = ', '.join(f'new.{column}' for column in index.columns)
+    old = ', '.join(f'old.{column}' for column in index.columns)
+    delete = f"INSERT INTO {table}({table}, rowid, {cols}) VALUES ('delete', old.id, {old});"
+    insert = f"INSERT INTO {table}(rowid, {cols}) VALUES (new.id, {new});"
+    return [
+        f'CREATE TRIGGER IF NOT EXISTS {table}_ai AFTER INSERT ON {source} BEGIN {insert} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_ad AFTER DELETE ON {source} BEGIN {delete} END',
+        f'CREATE TRIGGER IF NOT EXISTS {table}_au AFTER UPDATE OF {cols} ON {source} BEGIN {delete} {insert} END',
+    ]
+
+
+def rebuild(index, optimize=True):
+    """Restore the index's triggers if missing and rebuild it from the source table (SQLite)."""
+    if backend() != 'sqlite':
+        return False
+    with connection.cursor() as cursor:
+        for statement in sqlite_triggers(index):
+            cursor.execute(statement)
+        cursor.execute(f"INSERT INTO {index.table}({index.table}) VALUES ('rebuild')")
+        if optimize:
+            cursor.execute(f"INSERT INTO {index.table}({index.table}) VALUES ('optimize')")
+    return True
+
+
+def _fts_query(words):
+    return ' '.join(f'"{word}"' for word in words[:-1]) + f' "{words[-1]}"*'
+
+
+def _ts_query(words):
+    return ' & '.join(words[:-1] + [f'{words[-1]}:*'])
+
+
+_fts_tables = {}
+
+
+def backend():
+    if connection.vendor == 'postgresql':
+        return 'postgresql'
+    if connection.vendor == 'sqlite':
+        name = connection.settings_dict['NAME']
+        if name not in _fts_tables:
+            # Absent when SQLite was built without FTS5; see migration 0021
+            _fts_tables[name] = FEEDBACK.table in connection.introspection.table_names()
+        if _fts_tables[name]:
+            return 'sqlite'
+    return 'basic'
+
+
+def highlight(snippet):
+    """Escape a snippet from the database and turn its match markers into <mark>."""
+    return mark_safe(escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>'))
+
+
+def matching(index, text):
+    """An expression for `pk__in=` selecting rows that match `text`, unranked."""
+    words = terms(text)
+    if not words:
+        return None
+    kind = backend()
+    if kind == 'sqlite':
+        return RawSQL(f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s', [_fts_query(words)])
+    if kind == 'postgresql':
+        return RawSQL(
+            f"SELECT id FROM {index.source} WHERE ({index.tsvector_sql()}) @@ to_tsquery('{PG_CONFIG}', %s)",
+            [_ts_query(words)],
+        )
+    return None
+
+
+def _basic_filter(index, words):
+    condition = Q()
+    for word in words:
+        condition &= Q(*[Q(**{f'{column}__icontains': word}) for column in index.columns], _connector=Q.OR)
+    return condition
+
+
+def search(index, text, queryset=None, limit=None):
+    """
+    Rows of `queryset` (default: all) matching `text`, best first, at most
+    `limit`; each gets `search_rank` and an HTML-safe `search_snippet`.
+    """
+    words = terms(text)
+    if not words:
+        return []
+    limit = limit or getattr(settings, 'SEARCH_RESULT_LIMIT', 50)
+    queryset = index.model.objects.all() if queryset is None else queryset
+    kind = backend()
+
+    if kind == 'basic':
+        rows = list(queryset.filter(_basic_filter(index, words)).order_by('-pk')[:limit])
+        for row in rows:
+            text = ' '.join(getattr(row, column) or '' for column in index.columns)
+            row.search_rank = 0.0
+            row.search_snippet = escape(Truncator(text).words(24))
+        return rows
+
+    base_sql, base_params = queryset.order_by().values('pk').query.sql_with_params()
+    if kind == 'sqlite':
+        weights = ', '.join(str(bm25) for bm25, _ in index.weights)
+        sql = (
+            f"SELECT {index.table}.rowid, bm25({index.table}, {weights}) AS rank, "
+            f"snippet({index.table}, -1, %s, %s, '…', 16) "
+            f"FROM {index.table} JOIN ({base_sql}) AS base ON base.pk = {index.table}.rowid "
+            f"WHERE {index.table} MATCH %s ORDER BY rank LIMIT %s"
+        )
+        params = [MARK_START, MARK_END, *base_params, _fts_query(words), limit]
+    else:
+        document = " || ' ' || ".join(f"coalesce(doc.{column}, '')" for column in index.columns)
+        sql = (
+            f"SELECT doc.id, ts_rank({index.tsvector_sql('doc')}, query) AS rank, "
+            f"ts_headline('{PG_CONFIG}', {document}, query, %s) "
+            f"FROM {index.source} AS doc JOIN ({base_sql}) AS base ON base.pk = doc.id, "
+            f"to_tsquery('{PG_CONFIG}', %s) AS query "
+            f"WHERE ({index.tsvector_sql('doc')}) @@ query ORDER BY rank DESC LIMIT %s"
+        )
+        options = f'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=24, MinWords=8, MaxFragments=1'
+        params = [options, *base_params, _ts_query(words), limit]
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        hits = cursor.fetchall()
+    rows = queryset.in_bulk([pk for pk, _, _ in hits])
+    results = []
+    for pk, rank, snippet in hits:
+        row = rows[pk]
+        row.search_rank = rank
+        row.search_snippet = highlight(snippet)
+        results.append(row)
+    return results
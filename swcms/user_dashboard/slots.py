@@ -0,0 +1,182 @@
+"""
+Collection time slots and their capacity.
+
+Each ward defines PickupSlots: weekly windows in which its crews can serve a
+fixed number of pickups. reserve() takes a place in a slot on a date with a
+conditional UPDATE of that day's SlotUsage counter (booked < capacity), so
+two residents racing for the last place can't both get it on any database,
+and no lock is held beyond the booking's own transaction. Cancelling hands
+the place back the same way.
+
+Booking pages read availability from the cache: the ward's windows for a
+weekday, and a bitmap per ward-day whose bit i is set while the i-th window
+is full. A reservation only drops the bitmap when it fills a window, and a
+release only when it frees a full one, so at peak it is rebuilt (one query)
+only when the answer actually changes. Use a shared cache in production so
+every process sees those invalidations; SLOT_CACHE_SECONDS bounds how long
+a missed one can last. The counters stay the authority either way, and a
+window that looked free but has just filled ends in SlotFull.
+"""
+from collections import Counter, namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import PickupSlot, SlotUsage
+
+# Duck-types as a PickupSlot for reserve() and release()
+Window = namedtuple('Window', 'id ward_id start_time end_time capacity')
+
+
+class SlotFull(Exception):
+    pass
+
+
+def _timeout():
+    return getattr(settings, 'SLOT_CACHE_SECONDS', 300)
+
+
+def _windows_key(ward_id, weekday):
+    return f'slots:windows:{ward_id}:{weekday}'
+
+
+def _full_key(ward_id, date):
+    return f'slots:full:{ward_id}:{date.isoformat()}'
+
+
+def local_date_time(value):
+    value = timezone.localtime(value)
+    return value.date(), value.time()
+
+
+# Reading availability
+
+def ward_windows(ward_id, weekday):
+    """The ward's active windows on a weekday, in time order."""
+    key = _windows_key(ward_id, weekday)
+    windows = cache.get(key)
+    if windows is None:
+        windows = [
+            Window(*row) for row in
+            PickupSlot.objects.filter(ward_id=ward_id, weekday=weekday, is_active=True)
+            .order_by('start_time').values_list('id', 'ward_id', 'start_time', 'end_time', 'capacity')
+        ]
+        cache.set(key, windows, _timeout())
+    return windows
+
+
+def _build_full_bits(windows, date):
+    full = set(
+        SlotUsage.objects.filter(slot_id__in=[w.id for w in windows], date=date, booked__gte=F('slot__capacity'))
+        .values_list('slot_id', flat=True)
+    )
+    return sum(1 << i for i, window in enumerate(windows) if window.id in full)
+
+
+def full_bits(ward_id, date, windows=None):
+    """Bitmap of full windows for a ward-day, aligned with ward_windows()."""
+    if windows is None:
+        windows = ward_windows(ward_id, date.weekday())
+    key = _full_key(ward_id, date)
+    cached = cache.get(key)
+    shape = tuple((w.id, w.capacity) for w in windows)
+    # Stored with the windows it was built for, so edited definitions can't shift the bits
+    if cached is not None and cached[0] == shape:
+        return cached[1]
+    bits = _build_full_bits(windows, date)
+    cache.set(key, (shape, bits), _timeout())
+    return bits
+
+
+def availability(ward_id, date, now=None):
+    """[(window, available)] for a ward-day; windows already over are unavailable."""
+    windows = ward_windows(ward_id, date.weekday())
+    if not windows:
+        return []
+    bits = full_bits(ward_id, date, windows)
+    today, time_now = local_date_time(now or timezone.now())
+    return [
+        (window, not bits >> i & 1 and (date > today or (date == today and window.end_time > time_now)))
+        for i, window in enumerate(windows)
+    ]
+
+
+def window_for(ward_id, when):
+    """Return (window, available) for the window containing `when`, or None."""
+    date, time = local_date_time(when)
+    for window, available in availability(ward_id, date):
+        if window.start_time <= time < window.end_time:
+            return window, available
+    return None
+
+
+# Booking
+
+def _changed(slot, date):
+    key = _full_key(slot.ward_id, date)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def reserve(slot, date):
+    """Take one place in `slot` on `date`, in the caller's transaction; raise SlotFull if none is left."""
+    usage = SlotUsage.objects.filter(slot_id=slot.id, date=date)
+    for _ in range(2):
+        if usage.filter(booked__lt=slot.capacity - 1).update(booked=F('booked') + 1):
+            return
+        # Only the last place is left, the window is full, or nobody has booked it yet
+        if usage.filter(booked=slot.capacity - 1).update(booked=F('booked') + 1):
+            _changed(slot, date)
+            return
+        if usage.exists():
+            break
+        try:
+            with transaction.atomic():
+                SlotUsage.objects.create(slot_id=slot.id, date=date)
+        except IntegrityError:
+            # Another booking created the row first
+            pass
+    raise SlotFull(slot)
+
+
+def release(slot, date):
+    """Give back a place taken by reserve()."""
+    usage = SlotUsage.objects.filter(slot_id=slot.id, date=date)
+    if usage.filter(booked__gte=slot.capacity, booked__gt=0).update(booked=F('booked') - 1):
+        _changed(slot, date)
+    else:
+        usage.filter(booked__gt=0).update(booked=F('booked') - 1)
+
+
+def release_pickup(pickup):
+    """Free a cancelled pickup's place, unless its slot has already passed."""
+    if pickup.slot_id is None:
+        return
+    date, _ = local_date_time(pickup.schedule_date_time)
+    if date >= timezone.localdate():
+        release(pickup.slot, date)
+
+
+def release_pickups(pickups):
+    """Free the places of many pending pickups about to go, with one UPDATE per slot and date."""
+    today = timezone.localdate()
+    freed, slots = Counter(), {}
+    for pickup in pickups.filter(status='pending', slot__isnull=False).select_related('slot'):
+        date, _ = local_date_time(pickup.schedule_date_time)
+        if date >= today:
+            freed[(pickup.slot_id, date)] += 1
+            slots[pickup.slot_id] = pickup.slot
+    for (slot_id, date), count in freed.items():
+        SlotUsage.objects.filter(slot_id=slot_id, date=date).update(booked=Greatest(F('booked') - count, 0))
+        _changed(slots[slot_id], date)
+
+
+@receiver([post_save, post_delete], sender=PickupSlot)
+def _forget_windows(sender, instance, **kwargs):
+    # Every weekday, as an edit may have moved the window to another one
+    cache.delete_many([_windows_key(instance.ward_id, weekday) for weekday in range(7)])
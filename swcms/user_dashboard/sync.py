@@ -0,0 +1,350 @@
+"""
+Offline delta sync for the worker mobile app.
+
+Download (GET sync/changes/) returns the pickups, payments and feedback of
+the worker's ward that changed after the client's cursor. Each kind is
+paged by (updated_at, id), which is indexed, so a sync reads only what
+changed. Rows are sent as arrays under one field list per kind, which keeps
+payloads small and compresses well; responses are gzipped when the client
+accepts it. The opaque cursor records a position per kind and the ward it
+belongs to. A cursor is never moved past SYNC_SETTLE_SECONDS ago once the
+client has caught up, so a row written by a transaction that committed late
+is sent again rather than skipped; clients upsert by id.
+
+Upload (POST sync/actions/) takes a batch of actions queued while offline:
+"picked", "completed" with a weight, and "cash". They are applied in order
+in one transaction with the affected pickups and payments locked, and each
+gets its own result: applied, duplicate (its id was seen before), conflict
+(the pickup has moved on; the current state is included) or invalid. Action
+ids are recorded as idempotency keys, so re-sending a batch after a dropped
+response changes nothing.
+"""
+import base64
+import json
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.http import JsonResponse
+from django.utils import timezone
+from django.views.decorators.csrf import ensure_csrf_cookie
+from django.views.decorators.gzip import gzip_page
+from django.views.decorators.http import require_GET, require_POST
+
+from .claims import pick
+from .forms import WasteWeightForm
+from .idempotency import key_ttl
+from .live import publish_pickup_changes
+from .models import Feedback, IdempotencyKey, Payment, PickupRequest, Profile
+from .notifications import notify_payment_received, notify_pickup_status
+from .tasks import recalculate_user_rewards
+from .views import PICKUP_FEE
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+KEY_PREFIX = 'sync:'
+MAX_ACTION_ID_LENGTH = 64 - len(KEY_PREFIX)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _micros(value):
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _seconds(value):
+    return int(value.timestamp()) if value is not None else None
+
+
+def _decimal(value):
+    return str(value) if value is not None else None
+
+
+# Each kind: the cursor slot, the ward's rows as values_list (id first,
+# updated_at last; updated_at is not sent) and a function making a wire row.
+def _pickups(ward_id):
+    return PickupRequest.objects.filter(user__profile__ward_id=ward_id).values_list(
+        'id', 'request_id', 'user__username', 'waste_type', 'status', 'waste_weight', 'schedule_date_time',
+        'updated_at',
+    )
+
+
+def _payments(ward_id):
+    return Payment.objects.filter(pickup_request__user__profile__ward_id=ward_id).values_list(
+        'id', 'pickup_request_id', 'amount', 'status', 'razorpay_payment_id', 'updated_at',
+    )
+
+
+def _feedback(ward_id):
+    return Feedback.objects.filter(ward_id=ward_id).values_list(
+        'id', 'user__username', 'subject', 'message', 'is_complaint', 'status', 'response', 'created_at',
+        'updated_at',
+    )
+
+
+KINDS = {
+    'pickups': (
+        'p', _pickups,
+        ['id', 'ref', 'user', 'waste_type', 'status', 'weight', 'schedule'],
+        lambda r: [r[0], str(r[1]), r[2], r[3], r[4], _decimal(r[5]), _seconds(r[6])],
+    ),
+    'payments': (
+        'y', _payments,
+        ['id', 'pickup', 'amount', 'status', 'cash'],
+        lambda r: [r[0], r[1], _decimal(r[2]), r[3], r[4] == 'cash'],
+    ),
+    'feedback': (
+        'f', _feedback,
+        ['id', 'user', 'subject', 'message', 'complaint', 'status', 'response', 'created'],
+        lambda r: [r[0], r[1], r[2], r[3], r[4], r[5], r[6], _seconds(r[7])],
+    ),
+}
+
+
+def encode_cursor(ward_id, positions):
+    payload = json.dumps({'w': ward_id, **positions}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, ward_id):
+    """Return {slot: (micros, id)}; empty (a full sync) for another ward's cursor."""
+    if not token:
+        return {}
+    try:
+        data = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if data['w'] != ward_id:
+            return {}
+        return {
+            slot: (int(data[slot][0]), int(data[slot][1]))
+            for slot, _, _, _ in KINDS.values() if slot in data
+        }
+    except (ValueError, TypeError, KeyError, IndexError):
+        raise ValueError('Invalid cursor') from None
+
+
+def _after(queryset, position):
+    if position is None:
+        return queryset
+    since = EPOCH + timedelta(microseconds=position[0])
+    return queryset.filter(Q(updated_at__gt=since) | Q(updated_at=since, id__gt=position[1]))
+
+
+def changes_since(ward_id, positions, limit):
+    """One page of changes per kind; returns (payload, new positions, more)."""
+    settled = _micros(timezone.now() - timedelta(seconds=_setting('SYNC_SETTLE_SECONDS', 5)))
+    payload, new_positions, more = {}, {}, False
+    for name, (slot, rows_for, fields, wire) in KINDS.items():
+        position = positions.get(slot)
+        rows = list(_after(rows_for(ward_id), position).order_by('updated_at', 'id')[:limit + 1])
+        kind_more = len(rows) > limit
+        rows = rows[:limit]
+        if rows:
+            last = (_micros(rows[-1][-1]), rows[-1][0])
+            if not kind_more and last[0] > settled:
+                # Caught up: keep the window where late commits may still land
+                last = max(position or (0, 0), (settled, 0))
+            position = last
+        if position is not None:
+            new_positions[slot] = list(position)
+        payload[name] = {'fields': fields, 'rows': [wire(row) for row in rows]}
+        more = more or kind_more
+    return payload, new_positions, more
+
+
+def _worker_ward(user):
+    return (
+        Profile.objects.filter(user=user, role='worker', ward__isnull=False)
+        .values_list('ward_id', flat=True).first()
+    )
+
+
+def _json(data, status=200):
+    return JsonResponse(data, status=status, json_dumps_params={'separators': (',', ':')})
+
+
+@login_required
+@require_GET
+@gzip_page
+@ensure_csrf_cookie
+def sync_changes_view(request):
+    """Rows of the worker's ward changed since ?cursor=, at most ?limit= per kind."""
+    ward_id = _worker_ward(request.user)
+    if ward_id is None:
+        return _json({'error': 'Only workers with a ward can sync.'}, status=403)
+    try:
+        positions = decode_cursor(request.GET.get('cursor', ''), ward_id)
+        limit = int(request.GET.get('limit', _setting('SYNC_PAGE_SIZE', 500)))
+    except ValueError:
+        return _json({'error': 'Invalid cursor or limit.'}, status=400)
+    limit = max(1, min(limit, _setting('SYNC_MAX_PAGE_SIZE', 2000)))
+
+    payload, positions, more = changes_since(ward_id, positions, limit)
+    return _json({'cursor': encode_cursor(ward_id, positions), 'more': more, **payload})
+
+
+# Upload
+
+def _read_body(request):
+    """The request body, inflated if gzip-encoded; None if over the size limit."""
+    limit = _setting('SYNC_MAX_UPLOAD_BYTES', 1024 * 1024)
+    body = request.body
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        body = inflater.decompress(body, limit + 1)
+    return body if len(body) <= limit else None
+
+
+class _Batch:
+    """Applies one upload's actions to locked rows and records what changed."""
+
+    def __init__(self, user, ward_id, actions):
+        self.user = user
+        self.now = timezone.now()
+        pickup_ids = {action['pickup'] for action in actions}
+        self.pickups = {
+            pickup.pk: pickup for pickup in
+            PickupRequest.objects.select_for_update(of=('self',)).select_related('user')
+            .filter(pk__in=pickup_ids, user__profile__ward_id=ward_id)
+        }
+        self.payments = {
+            payment.pickup_request_id: payment
+            for payment in Payment.objects.select_for_update().filter(pickup_request_id__in=self.pickups)
+        }
+        keys = [KEY_PREFIX + action['id'] for action in actions]
+        IdempotencyKey.objects.filter(user=user, key__in=keys, created_at__lt=self.now - key_ttl()).delete()
+        self.seen = set(IdempotencyKey.objects.filter(user=user, key__in=keys).values_list('key', flat=True))
+        self.new_keys = []
+        self.changed_pickups = {}
+        self.changed_payments = {}
+        self.touched = set()
+        self.created_payments = []
+        self.completed = False
+
+    def apply(self, action):
+        key = KEY_PREFIX + action['id']
+        pickup = self.pickups.get(action['pickup'])
+        if key in self.seen:
+            return self._result(action, 'duplicate', pickup)
+        if pickup is None:
+            return self._result(action, 'invalid', None, 'Unknown pickup.')
+        handler = getattr(self, f'_{action["op"]}')
+        outcome = handler(pickup, action)
+        if outcome is None:
+            self.seen.add(key)
+            self.new_keys.append(IdempotencyKey(user=self.user, key=key, pickup_request=pickup))
+            return self._result(action, 'applied', pickup)
+        result, detail = outcome
+        return self._result(action, result, pickup, detail)
+
+    def _picked(self, pickup, action):
+        if pickup.status != 'pending':
+            return 'conflict', f'Pickup is {pickup.status}.'
+        # Written at once and conditionally: a claim can land after the rows were read
+        if not pick(pickup.pk, self.user):
+            return 'conflict', 'Another worker has claimed this pickup.'
+        pickup.assigned_to_id = self.user.pk
+        pickup.claimed_by_id = pickup.claim_expires_at = None
+        self._set_status(pickup, 'picked')
+
+    def _completed(self, pickup, action):
+        form = WasteWeightForm({'waste_weight': action.get('weight')})
+        if not form.is_valid():
+            return 'invalid', form.errors['waste_weight'][0]
+        if pickup.status != 'picked':
+            return 'conflict', f'Pickup is {pickup.status}.'
+        pickup.waste_weight = form.cleaned_data['waste_weight']
+        self._set_status(pickup, 'completed')
+        self.completed = True
+
+    def _cash(self, pickup, action):
+        payment = self.payments.get(pickup.pk)
+        if payment is None:
+            payment = self.payments[pickup.pk] = Payment(
+                user=pickup.user, pickup_request=pickup, amount=PICKUP_FEE,
+                status='completed', razorpay_payment_id='cash',
+            )
+            self.created_payments.append(payment)
+        elif payment.status == 'completed':
+            return 'conflict', 'Payment was already completed.'
+        else:
+            payment.status = 'completed'
+            payment.razorpay_payment_id = 'cash'
+            payment.updated_at = self.now
+            self.changed_payments[payment.pk] = payment
+        notify_payment_received(payment)
+        self.touched.add(pickup.pk)
+
+    def _set_status(self, pickup, status):
+        pickup.status = status
+        pickup.updated_at = self.now
+        self.changed_pickups[pickup.pk] = pickup
+        self.touched.add(pickup.pk)
+        notify_pickup_status(pickup)
+
+    def _result(self, action, result, pickup, detail=''):
+        payment = self.payments.get(pickup.pk) if pickup is not None else None
+        entry = {
+            'id': action['id'], 'result': result,
+            'status': pickup.status if pickup is not None else None,
+            'payment': payment.status if payment is not None else None,
+        }
+        if detail:
+            entry['detail'] = detail
+        return entry
+
+    def save(self):
+        PickupRequest.objects.bulk_update(self.changed_pickups.values(), ['status', 'assigned_to', 'claimed_by', 'claim_expires_at', 'waste_weight', 'updated_at'])
+        Payment.objects.bulk_update(self.changed_payments.values(), ['status', 'razorpay_payment_id', 'updated_at'])
+        Payment.objects.bulk_create(self.created_payments)
+        IdempotencyKey.objects.bulk_create(self.new_keys)
+        publish_pickup_changes(self.touched)
+        if self.completed:
+            recalculate_user_rewards.enqueue(dedup_key='recalculate-user-rewards')
+
+
+def _validate(action):
+    if not isinstance(action, dict):
+        return False
+    action_id, pickup = action.get('id'), action.get('pickup')
+    return (
+        isinstance(action_id, str) and 0 < len(action_id) <= MAX_ACTION_ID_LENGTH
+        and action.get('op') in ('picked', 'completed', 'cash')
+        and isinstance(pickup, int) and not isinstance(pickup, bool)
+    )
+
+
+@login_required
+@require_POST
+def sync_actions_view(request):
+    """Apply {"actions": [{"id", "op", "pickup", "weight"?}, ...]} in order."""
+    ward_id = _worker_ward(request.user)
+    if ward_id is None:
+        return _json({'error': 'Only workers with a ward can sync.'}, status=403)
+    try:
+        body = _read_body(request)
+        if body is None:
+            return _json({'error': 'Upload is too large.'}, status=413)
+        actions = json.loads(body)['actions']
+    except (zlib.error, ValueError, KeyError, TypeError):
+        return _json({'error': 'Expected a JSON object with an "actions" list.'}, status=400)
+    if not isinstance(actions, list) or len(actions) > _setting('SYNC_MAX_ACTIONS', 200):
+        return _json({'error': 'Too many actions in one upload.'}, status=413)
+    if not all(_validate(action) for action in actions):
+        return _json({'error': 'Each action needs an id, an op (picked, completed or cash) and a pickup.'},
+                     status=400)
+
+    try:
+        with transaction.atomic():
+            batch = _Batch(request.user, ward_id, actions)
+            results = [batch.apply(action) for action in actions]
+            batch.save()
+    except IntegrityError:
+        # The same actions are being uploaded concurrently; the retry will
+        # report them as duplicates
+        return _json({'error': 'Upload raced with another; retry it.'}, status=409)
+    return _json({'results': results})
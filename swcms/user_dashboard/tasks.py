@@ -0,0 +1,145 @@
+"""
+Background jobs for the dashboard, run by `manage.py run_jobs`.
+
+recalculate_user_rewards is queued from mark_completed_view,
+send_notifications whenever something lands in the outbox,
+assign_pickups whenever a pickup needs a worker and purge_deleted_users
+whenever an admin deletes a user; cluster_feedback groups duplicate
+complaints on a schedule; the clean-up
+tasks replace the opportunistic purges that otherwise only happen when
+someone submits a pickup or starts an upload. process_payment_webhooks is
+queued by each webhook delivery and also runs on a schedule as a backstop,
+and build_image_variants renders the photo of each new pickup.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from jobs.queue import task
+
+from .assignment import assign_pending
+from .clustering import cluster_complaints
+from .idempotency import purge_expired_keys
+from .images import build_variants
+from .live import purge_old_events
+from .models import PickupRequest, Profile, Reward
+from .notifications import send_pending
+from .purge import purge_pending
+from .reward_policies import DEFAULT_WEIGHT, IMPACT_WEIGHTS, MAX_POINTS, MIN_POINTS
+from .uploads import discard_expired_uploads
+from .webhooks import process_pending_events
+
+
+@task(queue='rewards', max_attempts=3)
+def recalculate_user_rewards():
+    """
+    Recalculate reward points automatically based on total waste generated
+    and its environmental impact. Users with less and less-harmful waste
+    receive higher scores. Only users with role='user' are ranked.
+    """
+    # Weight multipliers per waste type (higher = more harmful); see
+    # reward_policies.py to try alternatives against past pickups
+    weight_factors = IMPACT_WEIGHTS
+
+    impact_map = defaultdict(lambda: {'total_kg': Decimal('0'), 'impact': Decimal('0')})
+
+    completed = (
+        PickupRequest.objects
+        .filter(status='completed')
+        .select_related('user')
+        .only('user_id', 'waste_type', 'waste_weight')
+    )
+
+    for p in completed:
+        if p.waste_weight is None:
+            continue
+        if not hasattr(p, 'user') or p.user is None:
+            continue
+        weight = Decimal(str(p.waste_weight))
+        factor = weight_factors.get(p.waste_type, DEFAULT_WEIGHT)
+        impact_map[p.user]['total_kg'] += weight
+        impact_map[p.user]['impact'] += weight * factor
+
+    # Ensure all users with role 'user' exist in the map (even if zero waste)
+    for profile in Profile.objects.select_related('user').filter(role='user'):
+        _ = impact_map[profile.user]  # initialize default if missing
+
+    users_impacts = list(impact_map.items())
+    if not users_impacts:
+        return
+
+    # Sort by impact ascending (less impact = better)
+    users_impacts.sort(key=lambda item: (item[1]['impact'], item[0].id))
+    n = len(users_impacts)
+    max_points = MAX_POINTS
+    min_points = MIN_POINTS
+
+    for idx, (user, data) in enumerate(users_impacts):
+        # Linear scale: best user gets max_points, worst gets min_points
+        if n == 1:
+            points = max_points
+        else:
+            # rank 0 => best
+            ratio = Decimal(n - 1 - idx) / Decimal(n - 1)  # 1.0 .. 0.0
+            points = min_points + (max_points - min_points) * ratio
+        reward, _ = Reward.objects.get_or_create(
+            user=user,
+            defaults={'points': 0, 'total_waste_collected': Decimal('0')},
+        )
+        reward.total_waste_collected = data['total_kg']
+        reward.points = int(points)
+        reward.save()
+
+
+@task(queue='maintenance')
+def purge_idempotency_keys():
+    while purge_expired_keys():
+        pass
+
+
+@task(queue='maintenance')
+def discard_abandoned_uploads():
+    discard_expired_uploads(limit=500)
+
+
+@task(queue='maintenance')
+def purge_pickup_events():
+    while purge_old_events():
+        pass
+
+
+@task(queue='maintenance')
+def process_payment_webhooks():
+    process_pending_events()
+
+
+@task(queue='images', max_attempts=3)
+def build_image_variants(pickup_id):
+    pickup = PickupRequest.objects.filter(pk=pickup_id).first()
+    if pickup is not None:
+        build_variants(pickup)
+
+
+@task(queue='default')
+def assign_pickups():
+    assign_pending()
+
+
+@task(queue='maintenance')
+def cluster_feedback():
+    cluster_complaints()
+
+
+@task(queue='maintenance')
+def purge_deleted_users():
+    if purge_pending():
+        # More to remove: continue in a fresh job rather than outlive the lease
+        purge_deleted_users.enqueue(dedup_key='purge-deleted-users')
+
+
+# One sender at a time (see JOBS_QUEUES), so batches never overlap
+@task(queue='notifications')
+def send_notifications():
+    sent, more = send_pending()
+    if more:
+        # Rate limits left a backlog: continue in a fresh job rather than outlive the lease
+        send_notifications.enqueue(dedup_key='send-notifications')
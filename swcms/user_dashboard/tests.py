@@ -1,3 +1,1877 @@
-from django.test import TestCase
+import asyncio
+import csv
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import tempfile
+import uuid
+from datetime import datetime, time, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+import numpy as np
+import requests
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core import mail
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from jobs.models import Job
+
+from . import admin as dashboard_admin
+from . import assignment
+from . import claims
+from . import clustering
+from . import gateway
+from . import images
+from . import live
+from . import loadtest
+from . import metrics
+from . import notifications
+from . import profiling
+from . import purge
+from . import reconciliation
+from . import reward_policies
+from . import routing
+from . import search
+from . import slots
+from . import sync
+from . import tasks
+from . import uploads
+from . import webhooks
+from .mockgateway import MockGatewayServer, signed_webhook
+from .models import (
+    Panchayath, Ward, Profile, PickupRequest, Reward, Payment, Feedback, FeedbackCluster, IdempotencyKey, WebhookEvent,
+    Notification, PhotoUpload, PickupEvent, PickupSlot, SlotUsage, UserPurge,
+)
+
+
+class AdminChangelistQueryCountTests(TestCase):
+    """Changelist pages must issue a bounded number of queries."""
+
+    # Session, user, list, date hierarchy and filter lookups; never per row
+    MAX_QUERIES = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.superuser = User.objects.create_superuser('root', 'root@example.com', 'pass')
+        panchayath = Panchayath.objects.create(name='Test', code='T')
+        ward = Ward.objects.create(name='Central', panchayath=panchayath, ward_number=1)
+        for i in range(30):
+            user = User.objects.create_user(f'resident{i}')
+            Profile.objects.create(user=user, ward=ward, mobile_number=f'90000{i:05d}')
+            Reward.objects.create(user=user, points=i)
+            pickup = PickupRequest.objects.create(
+                user=user,
+                waste_type='dry',
+                schedule_date_time=timezone.now(),
+            )
+            Payment.objects.create(user=user, pickup_request=pickup, amount=Decimal('100.00'))
+            Feedback.objects.create(user=user, subject=f'Bin {i}', message='Overflowing', ward=ward)
+
+    def setUp(self):
+        self.client.force_login(self.superuser)
+
+    def assertBoundedChangelist(self, url_name, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse(url_name), params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertLessEqual(len(ctx.captured_queries), self.MAX_QUERIES, url_name)
+
+    def test_pickup_changelist(self):
+        self.assertBoundedChangelist('admin:user_dashboard_pickuprequest_changelist')
+
+    def test_payment_changelist(self):
+        self.assertBoundedChangelist('admin:user_dashboard_payment_changelist')
+
+    def test_feedback_changelist(self):
+        self.assertBoundedChangelist('admin:user_dashboard_feedback_changelist')
+
+    def test_profile_changelist(self):
+        self.assertBoundedChangelist('admin:user_dashboard_profile_changelist')
+
+    def test_reward_changelist(self):
+        self.assertBoundedChangelist('admin:user_dashboard_reward_changelist')
+
+    def test_prefix_search(self):
+        self.assertBoundedChangelist('admin:user_dashboard_pickuprequest_changelist', {'q': 'resident1'})
+
+    def test_estimated_count_for_large_tables(self):
+        original = dashboard_admin.ESTIMATED_COUNT_THRESHOLD
+        dashboard_admin.ESTIMATED_COUNT_THRESHOLD = 10
+        try:
+            paginator = dashboard_admin.EstimatedCountPaginator(PickupRequest.objects.order_by('pk'), 50)
+            max_pk = PickupRequest.objects.order_by('-pk').values_list('pk', flat=True).first()
+            with self.assertNumQueries(1):
+                self.assertEqual(paginator.count, max_pk)
+            filtered = dashboard_admin.EstimatedCountPaginator(
+                PickupRequest.objects.filter(status='pending').order_by('pk'), 50
+            )
+            self.assertEqual(filtered.count, 30)
+        finally:
+            dashboard_admin.ESTIMATED_COUNT_THRESHOLD = original
+
+
+@override_settings(METRICS_ALLOWED_IPS=['127.0.0.1'])
+class RequestMetricsTests(TestCase):
+
+    def setUp(self):
+        metrics.registry.reset()
+
+    def test_records_requests_per_url_name(self):
+        self.client.get(reverse('login'))
+        self.client.get(reverse('login'))
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('swcms_request_duration_seconds_count{view="login"} 2', body)
+        self.assertIn('swcms_request_db_queries_bucket{view="login",le="+Inf"} 2', body)
+
+    def test_request_round_trip_reaches_metrics(self):
+        admin = User.objects.create_user('metricsadmin')
+        Profile.objects.create(user=admin, role='admin')
+        self.client.force_login(admin)
+        metrics.registry.reset()
+        # The middleware is outermost, so it sees every query of the request
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(self.client.get(reverse('admin_users')).status_code, 200)
+        queries = len(ctx.captured_queries)
+        self.assertGreater(queries, 0)
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('swcms_request_duration_seconds_count{view="admin_users"} 1', body)
+        self.assertIn('swcms_request_duration_seconds_bucket{view="admin_users",le="+Inf"} 1', body)
+        self.assertIn(f'swcms_request_db_queries_sum{{view="admin_users"}} {float(queries)}', body)
+        self.assertIn('swcms_request_db_duration_seconds_count{view="admin_users"} 1', body)
+        self.assertIn('swcms_request_n_plus_one_total', body)
+        # Only the admin page had been served when /metrics rendered
+        self.assertNotIn('view="metrics"', body)
+
+    def test_flags_repeated_sql_templates(self):
+        tracker = metrics.QueryTracker()
+        for _ in range(metrics.DEFAULT_N_PLUS_ONE_THRESHOLD + 1):
+            tracker(lambda *args: None, 'SELECT 1 WHERE id = %s', (1,), False, {})
+        self.assertEqual(tracker.most_repeated()[1], metrics.DEFAULT_N_PLUS_ONE_THRESHOLD + 1)
+
+    def test_metrics_forbidden_for_remote_clients(self):
+        response = self.client.get(reverse('metrics'), REMOTE_ADDR='10.0.0.5')
+        self.assertEqual(response.status_code, 403)
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='scrape-secret')
+    def test_proxied_requests_need_the_token(self):
+        # Behind a local proxy every request arrives from loopback
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        wrong = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer guess'})
+        self.assertEqual(wrong.status_code, 403)
+        right = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(right.status_code, 200)
+
+
+class SamplingProfilerTests(TestCase):
+
+    def setUp(self):
+        self.profile_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.profile_dir.cleanup)
+        self.admin = User.objects.create_user('boss')
+        Profile.objects.create(user=self.admin, role='admin')
+
+    def test_profiles_matching_url_names_into_ring_buffer(self):
+        with override_settings(
+            PROFILER_ENABLED=True,
+            PROFILER_URL_NAMES=['login'],
+            PROFILER_DIR=self.profile_dir.name,
+            PROFILER_MAX_PROFILES=2,
+            PROFILER_INTERVAL=0.001,
+        ):
+            for _ in range(3):
+                self.client.get(reverse('login'))
+            profiles = profiling.list_profiles()
+            self.assertEqual(len(profiles), 2)
+            self.assertEqual(len(profiles[0]['paths']), 2)
+
+            self.client.force_login(self.admin)
+            response = self.client.get(reverse('admin_profiles'))
+            self.assertContains(response, profiles[0]['name'])
+            response = self.client.get(
+                reverse('admin_profile_download', args=[profiles[0]['name'], 'speedscope'])
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_download_rejects_unknown_format(self):
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin_profile_download', args=['x', 'exe']))
+        self.assertEqual(response.status_code, 404)
+
+    def test_speedscope_export(self):
+        stacks = profiling.Counter({('main (app.py:1)', 'work (app.py:10)'): 3})
+        document = profiling.to_speedscope(stacks, 'index', 0.005, 0.02)
+        self.assertEqual(len(document['shared']['frames']), 2)
+        self.assertEqual(document['profiles'][0]['weights'], [0.015])
+        self.assertEqual(profiling.to_collapsed(stacks), 'main (app.py:1);work (app.py:10) 3\n')
+
+
+class SeedAndBenchmarkTests(TestCase):
+
+    def test_seed_scale_then_benchmark_against_baseline(self):
+        call_command(
+            'seed_scale', panchayaths=1, wards_per_panchayath=2, users=10,
+            pickups_per_user=8, feedback=5, stdout=io.StringIO(),
+        )
+        self.assertEqual(Ward.objects.count(), 2)
+        self.assertEqual(Profile.objects.filter(role='worker').count(), 4)
+        self.assertEqual(PickupRequest.objects.count(), 80)
+        self.assertEqual(Feedback.objects.count(), 5)
+        self.assertEqual(
+            set(PickupRequest.objects.values_list('status', flat=True)),
+            {choice for choice, _ in PickupRequest.STATUS_CHOICES},
+        )
+
+        with tempfile.TemporaryDirectory() as tmp:
+            baseline = f'{tmp}/baseline.json'
+            call_command('benchmark_views', iterations=2, warmup=0, baseline=baseline,
+                         update_baseline=True, stdout=io.StringIO())
+            with open(baseline) as fh:
+                results = json.load(fh)
+            self.assertIn('mark_completed_view', results)
+            # The rolled-back iterations must leave the picked pickup untouched
+            self.assertFalse(PickupRequest.objects.filter(status='completed', waste_weight=4.5).exists())
+            call_command('benchmark_views', iterations=2, warmup=0, baseline=baseline,
+                         tolerance=100, stdout=io.StringIO())
+
+    def test_load_test_summary(self):
+        samples = [
+            ('resident', 'submit', 0.5, True), ('resident', 'submit', 0.01, True),
+            ('resident', 'submit', 0.02, False), ('worker', 'pick', 0.2, True),
+        ]
+        report = {(row['scenario'], row['step']): row for row in loadtest.summarize(samples, 10.0)}
+        submit = report[('resident', 'submit')]
+        # Throughput is over the run, not over any one request's latency
+        self.assertAlmostEqual(submit['throughput'], 0.3)
+        self.assertEqual((submit['requests'], submit['errors']), (3, 1))
+        self.assertAlmostEqual(submit['error_rate'], 1 / 3)
+        self.assertAlmostEqual(submit['p50_ms'], 20)
+        self.assertAlmostEqual(submit['p99_ms'], 500)
+        self.assertAlmostEqual(report[('worker', 'pick')]['throughput'], 0.1)
+
+
+class PickupImagePipelineTests(TestCase):
+
+    def _photo(self, size=(4000, 3000)):
+        from PIL import Image
+        buffer = io.BytesIO()
+        exif = Image.Exif()
+        exif[0x010F] = 'PhoneMaker'
+        Image.new('RGB', size, (40, 120, 60)).save(buffer, 'JPEG', quality=95, exif=exif)
+        return SimpleUploadedFile('IMG_0001.jpeg', buffer.getvalue(), content_type='image/jpeg')
+
+    def test_upload_is_downscaled_and_stripped(self):
+        from PIL import Image
+        optimized = images.optimize_upload(self._photo())
+        image = Image.open(io.BytesIO(optimized.read()))
+        self.assertEqual(max(image.size), images.MAX_DIMENSION)
+        self.assertFalse(image.getexif())
+        self.assertEqual(optimized.name, 'IMG_0001.jpg')
+
+    def test_variants_feed_srcset(self):
+        user = User.objects.create_user('photographer')
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            pickup = PickupRequest.objects.create(
+                user=user, waste_type='dry', schedule_date_time=timezone.now(),
+                image=images.optimize_upload(self._photo()),
+            )
+            variants = images.build_variants(pickup)
+            self.assertEqual(sorted(variants, key=int), ['320', '640', '1600'])
+            pickup.refresh_from_db()
+            self.assertIn('320w', pickup.image_webp_srcset)
+            self.assertIn('_320.jpg', pickup.image_thumbnail_url)
+
+    @override_settings(JOBS_IMMEDIATE=True)
+    def test_variants_are_built_by_a_job(self):
+        user = User.objects.create_user('photographer')
+        with tempfile.TemporaryDirectory() as media, override_settings(MEDIA_ROOT=media):
+            pickup = PickupRequest.objects.create(
+                user=user, waste_type='dry', schedule_date_time=timezone.now(),
+                image=images.optimize_upload(self._photo()),
+            )
+            with self.captureOnCommitCallbacks(execute=True):
+                images.schedule_variants(pickup)
+            self.assertEqual(Job.objects.get().status, 'done')
+            pickup.refresh_from_db()
+            self.assertEqual(sorted(pickup.image_variants, key=int), ['320', '640', '1600'])
+
+
+class ChunkedPhotoUploadTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('uploader')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.chunk_dir = tempfile.TemporaryDirectory()
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.chunk_dir.cleanup)
+        self.addCleanup(self.media_dir.cleanup)
+        overrides = override_settings(
+            PICKUP_UPLOAD_DIR=self.chunk_dir.name,
+            MEDIA_ROOT=self.media_dir.name,
+            PICKUP_PHOTO_CHUNK_BYTES=4096,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+    def _start(self, data):
+        response = self.client.post(reverse('start_photo_upload'), {
+            'filename': 'bin.png', 'size': len(data), 'content_type': 'image/png',
+        })
+        self.assertEqual(response.status_code, 201)
+        return response.json()['token']
+
+    def _put(self, token, offset, chunk):
+        return self.client.put(
+            reverse('photo_upload', args=[token]), chunk,
+            content_type='application/octet-stream', HTTP_UPLOAD_OFFSET=str(offset),
+        )
+
+    def _png(self):
+        from PIL import Image
+        buffer = io.BytesIO()
+        Image.effect_noise((120, 120), 64).convert('RGB').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def test_resumable_upload_then_tiny_idempotent_form_post(self):
+        data = self._png()
+        token = self._start(data)
+        self.assertEqual(self._put(token, 0, data[:4096]).json()['offset'], 4096)
+        # A repeated chunk is rejected with the offset to resume from
+        response = self._put(token, 0, data[:4096])
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['offset'], 4096)
+        offset = 4096
+        while offset < len(data):
+            state = self._put(token, offset, data[offset:offset + 4096]).json()
+            offset = state['offset']
+        self.assertEqual(state['status'], 'complete')
+
+        form = {
+            'waste_type': 'plastic',
+            'schedule_date_time': (timezone.now() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'upload_token': token,
+        }
+        first = self.client.post(reverse('request_pickup'), form)
+        second = self.client.post(reverse('request_pickup'), form)
+        self.assertEqual(first['Location'], second['Location'])
+        pickup = PickupRequest.objects.get()
+        self.assertTrue(pickup.image.name.endswith('.jpg'))
+
+    def test_rejects_content_that_is_not_the_declared_type(self):
+        data = b'GIF89a' + b'\0' * 100
+        token = self._start(data)
+        self.assertEqual(self._put(token, 0, data).status_code, 415)
+
+    def test_upload_failing_verification_is_marked_failed(self):
+        # Right magic bytes, but not a decodable PNG
+        data = self._png()[:16] + b'\0' * 200
+        token = self._start(data)
+        response = self._put(token, 0, data)
+        self.assertEqual(response.status_code, 415)
+        self.assertEqual(response.json()['status'], 'failed')
+        upload = PhotoUpload.objects.get(token=token)
+        self.assertEqual((upload.status, upload.received), ('failed', len(data)))
+        self.assertFalse(uploads.upload_path(upload).exists())
+        # The session is over: the client starts a new upload
+        self.assertEqual(self._put(token, len(data), b'x').status_code, 409)
+
+    def test_rejects_oversized_declarations(self):
+        response = self.client.post(reverse('start_photo_upload'), {
+            'filename': 'huge.jpg', 'size': 100 * 1024 * 1024, 'content_type': 'image/jpeg',
+        })
+        self.assertEqual(response.status_code, 413)
+
+
+class ProtectedMediaTests(TestCase):
+
+    def setUp(self):
+        self.media_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.media_dir.cleanup)
+        overrides = override_settings(MEDIA_ROOT=self.media_dir.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+
+        panchayath = Panchayath.objects.create(name='Media', code='M')
+        ward = Ward.objects.create(name='North', panchayath=panchayath, ward_number=1)
+        other_ward = Ward.objects.create(name='South', panchayath=panchayath, ward_number=2)
+        self.owner = User.objects.create_user('owner')
+        Profile.objects.create(user=self.owner, ward=ward)
+        self.worker = User.objects.create_user('crew')
+        Profile.objects.create(user=self.worker, ward=ward, role='worker')
+        self.stranger = User.objects.create_user('stranger')
+        Profile.objects.create(user=self.stranger, ward=other_ward, role='worker')
+        self.pickup = PickupRequest.objects.create(
+            user=self.owner, waste_type='dry', schedule_date_time=timezone.now(),
+            image=SimpleUploadedFile('bin.jpg', b'0123456789' * 10, content_type='image/jpeg'),
+        )
+        self.url = '/media/' + self.pickup.image.name
+
+    def test_owner_and_ward_worker_can_view(self):
+        for user in (self.owner, self.worker):
+            self.client.force_login(user)
+            response = self.client.get(self.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(b''.join(response.streaming_content), b'0123456789' * 10)
+
+    def test_other_ward_is_forbidden(self):
+        self.client.force_login(self.stranger)
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+
+    def test_range_and_conditional_requests(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url, HTTP_RANGE='bytes=10-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-14/100')
+        self.assertEqual(b''.join(response.streaming_content), b'01234')
+        etag = response['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE='bytes=500-').status_code, 416)
+
+    @override_settings(MEDIA_ACCEL='x-accel-redirect')
+    def test_hands_transfer_to_front_server(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(self.url)
+        self.assertEqual(response['X-Accel-Redirect'], '/protected-media/' + self.pickup.image.name)
+        self.assertEqual(response.content, b'')
+
+
+class IdempotentPickupTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('resident')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.data = {
+            'waste_type': 'dry',
+            'description': 'Boxes',
+            'schedule_date_time': (timezone.localtime() + timedelta(days=1)).strftime('%Y-%m-%dT%H:%M'),
+            'idempotency_key': 'a' * 32,
+        }
+
+    def test_submission_creates_pickup_and_pending_payment(self):
+        response = self.client.post(reverse('request_pickup'), self.data)
+        pickup = PickupRequest.objects.get(user=self.user)
+        self.assertRedirects(response, reverse('payment', args=[pickup.pk]))
+        self.assertEqual(pickup.payment.status, 'pending')
+        self.assertEqual(pickup.payment.amount, Decimal('100.00'))
+
+    def test_retry_returns_original_pickup_without_writes(self):
+        first = self.client.post(reverse('request_pickup'), self.data)
+        with CaptureQueriesContext(connection) as ctx:
+            retry = self.client.post(reverse('request_pickup'), self.data)
+        self.assertEqual(retry['Location'], first['Location'])
+        self.assertEqual(PickupRequest.objects.filter(user=self.user).count(), 1)
+        self.assertEqual(Payment.objects.filter(user=self.user).count(), 1)
+        writes = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        self.assertEqual(writes, [])
+
+    def test_expired_key_can_be_reused(self):
+        self.client.post(reverse('request_pickup'), self.data)
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        self.client.post(reverse('request_pickup'), self.data)
+        self.assertEqual(PickupRequest.objects.filter(user=self.user).count(), 2)
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+    def test_payment_page_does_not_write(self):
+        pickup = PickupRequest.objects.create(user=self.user, waste_type='wet', schedule_date_time=timezone.now())
+        response = self.client.get(reverse('payment', args=[pickup.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Payment.objects.exists())
+
+
+class PaymentGatewayTests(TestCase):
+
+    def setUp(self):
+        self.server = MockGatewayServer('key_test', 'secret_test').start()
+        self.addCleanup(self.server.stop)
+        overrides = override_settings(
+            RAZORPAY_KEY_ID='key_test',
+            RAZORPAY_KEY_SECRET='secret_test',
+            PAYMENT_GATEWAY_BASE_URL=self.server.base_url,
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.user = User.objects.create_user('payer')
+        Profile.objects.create(user=self.user)
+        self.client.force_login(self.user)
+        self.pickup = PickupRequest.objects.create(user=self.user, waste_type='dry', schedule_date_time=timezone.now())
+        self.payment = Payment.objects.create(user=self.user, pickup_request=self.pickup, amount=Decimal('100.00'))
+
+    def _gateway(self, **kwargs):
+        return gateway.RazorpayGateway('key_test', 'secret_test', base_url=self.server.base_url,
+                                       sleep=lambda seconds: None, **kwargs)
+
+    def test_pay_online_creates_order_once(self):
+        url = reverse('payment', args=[self.pickup.pk])
+        self.client.post(url)
+        self.client.post(url)
+        self.payment.refresh_from_db()
+        self.assertTrue(self.payment.razorpay_order_id.startswith('order_mock'))
+        self.assertEqual(len(self.server.orders), 1)
+        self.assertContains(self.client.get(url), self.payment.razorpay_order_id)
+
+    def test_checkout_signature_completes_payment(self):
+        self.client.post(reverse('payment', args=[self.pickup.pk]))
+        self.payment.refresh_from_db()
+        digest = hmac.new(b'secret_test', f'{self.payment.razorpay_order_id}|pay_1'.encode(), hashlib.sha256)
+        self.client.post(reverse('payment', args=[self.pickup.pk]), {
+            'razorpay_payment_id': 'pay_1', 'razorpay_signature': 'f' * 64,
+        })
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'pending')
+        self.client.post(reverse('payment', args=[self.pickup.pk]), {
+            'razorpay_payment_id': 'pay_1', 'razorpay_signature': digest.hexdigest(),
+        })
+        self.payment.refresh_from_db()
+        self.assertEqual(self.payment.status, 'completed')
+        self.assertEqual(self.payment.razorpay_payment_id, 'pay_1')
+
+    def test_transient_failures_are_retried(self):
+        self.server.fail_next = 2
+        client = self._gateway(max_retries=2)
+        self.assertEqual(client.create_order(5000, 'r1')['amount'], 5000)
+        self.assertEqual(self.server.request_count, 3)
+
+    def test_breaker_opens_and_fails_fast(self):
+        now = [0.0]
+        breaker = gateway.CircuitBreaker(failure_threshold=2, reset_timeout=10, clock=lambda: now[0])
+        client = self._gateway(max_retries=0, breaker=breaker)
+        self.server.fail_next = 2
+        for _ in range(2):
+            with self.assertRaises(gateway.GatewayUnavailable):
+                client.create_order(5000, 'r')
+        with self.assertRaises(gateway.GatewayUnavailable):
+            client.create_order(5000, 'r')
+        self.assertEqual(self.server.request_count, 2)
+        now[0] = 11
+        client.create_order(5000, 'r')
+        self.assertEqual(breaker.state, 'closed')
+
+    def test_other_request_errors_count_as_failures(self):
+        now = [0.0]
+        breaker = gateway.CircuitBreaker(failure_threshold=1, reset_timeout=10, clock=lambda: now[0])
+        client = self._gateway(max_retries=0, breaker=breaker)
+
+        def redirect_loop(*args, **kwargs):
+            raise requests.TooManyRedirects('Exceeded 30 redirects.')
+
+        client.session.request = redirect_loop
+        with self.assertRaises(gateway.GatewayUnavailable):
+            client.create_order(5000, 'r')
+        # The half-open trial that failed this way doesn't block later ones
+        now[0] = 11
+        with self.assertRaises(gateway.GatewayUnavailable):
+            client.create_order(5000, 'r')
+        self.assertFalse(breaker.trial_in_flight)
+        now[0] = 22
+        self.assertTrue(breaker.allow())
+
+    def test_non_json_body_is_a_gateway_error(self):
+        client = self._gateway(max_retries=0)
+        response = requests.Response()
+        response.status_code = 200
+        response._content = b'<html>maintenance</html>'
+        client.session.request = lambda *args, **kwargs: response
+        with self.assertRaises(gateway.GatewayError):
+            client.create_order(5000, 'r')
+
+
+@override_settings(RAZORPAY_WEBHOOK_SECRET='whsec', PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND=False)
+class PaymentWebhookTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('payer')
+        self.payments = []
+        for i in range(3):
+            pickup = PickupRequest.objects.create(user=self.user, waste_type='dry', schedule_date_time=timezone.now())
+            self.payments.append(Payment.objects.create(
+                user=self.user, pickup_request=pickup, amount=Decimal('100.00'), razorpay_order_id=f'order_{i}',
+            ))
+
+    def _deliver(self, event, order_id, payment_id, secret='whsec', event_id=None):
+        body, headers = signed_webhook(event, order_id, payment_id, secret, event_id)
+        return self.client.post(
+            reverse('payment_webhook'), body, content_type='application/json',
+            headers=headers,
+        )
+
+    @override_settings(PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND=True, JOBS_IMMEDIATE=False)
+    def test_deliveries_queue_one_drain_job(self):
+        self._deliver('payment.captured', 'order_0', 'pay_0')
+        self._deliver('payment.failed', 'order_1', 'pay_1')
+        job = Job.objects.get()
+        self.assertEqual((job.name, job.status), ('user_dashboard.tasks.process_payment_webhooks', 'queued'))
+        tasks.process_payment_webhooks()
+        self.assertFalse(WebhookEvent.objects.filter(processed_at__isnull=True).exists())
+
+    def test_delivery_is_stored_then_applied_in_a_batch(self):
+        self.assertEqual(self._deliver('payment.captured', 'order_0', 'pay_0').status_code, 200)
+        self._deliver('payment.failed', 'order_1', 'pay_1')
+        self._deliver('payment.captured', 'order_missing', 'pay_x')
+        self.assertEqual(Payment.objects.filter(status='pending').count(), 3)
+
+        # Includes the live dashboard event lookup for the changed pickups
+        with self.assertNumQueries(8):
+            self.assertEqual(webhooks.process_pending_events(), 3)
+        statuses = dict(Payment.objects.values_list('razorpay_order_id', 'status'))
+        self.assertEqual(statuses, {'order_0': 'completed', 'order_1': 'failed', 'order_2': 'pending'})
+        self.assertIsNotNone(WebhookEvent.objects.get(error='Unknown order').processed_at)
+
+    def test_bad_signature_is_rejected(self):
+        self.assertEqual(self._deliver('payment.captured', 'order_0', 'pay_0', secret='wrong').status_code, 400)
+        self.assertFalse(WebhookEvent.objects.exists())
+
+    def test_redelivery_and_late_failure_are_idempotent(self):
+        self._deliver('payment.captured', 'order_0', 'pay_0', event_id='evt_1')
+        self._deliver('payment.captured', 'order_0', 'pay_0', event_id='evt_1')
+        self.assertEqual(WebhookEvent.objects.count(), 1)
+        self._deliver('payment.failed', 'order_0', 'pay_0', event_id='evt_2')
+        webhooks.process_pending_events()
+        payment = Payment.objects.get(razorpay_order_id='order_0')
+        self.assertEqual((payment.status, payment.razorpay_payment_id), ('completed', 'pay_0'))
+        self.assertEqual(webhooks.process_pending_events(), 0)
+
+
+class PaymentReconciliationTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('payer')
+        self.payments = {}
+        for key, status, payment_id in [
+            ('order_paid', 'completed', 'pay_paid'),
+            ('order_pending', 'pending', None),
+            ('order_short', 'completed', 'pay_short'),
+            ('order_unreported', 'completed', 'pay_unreported'),
+            (None, 'completed', 'cash'),
+        ]:
+            pickup = PickupRequest.objects.create(user=user, waste_type='dry', schedule_date_time=timezone.now())
+            self.payments[key] = Payment.objects.create(
+                user=user, pickup_request=pickup, amount=Decimal('100.00'), status=status,
+                razorpay_order_id=key, razorpay_payment_id=payment_id,
+            )
+        self.cash_receipt = str(self.payments[None].pickup_request.request_id)
+        self.rows = [
+            {'type': 'payment', 'entity_id': 'pay_paid', 'order_id': 'order_paid', 'amount': 10000},
+            {'type': 'payment', 'entity_id': 'pay_late', 'order_id': 'order_pending', 'amount': 10000},
+            {'type': 'payment', 'entity_id': 'pay_short', 'order_id': 'order_short', 'amount': 9000},
+            {'type': 'payment', 'entity_id': 'pay_ghost', 'order_id': 'order_ghost', 'amount': 10000},
+            {'type': 'refund', 'entity_id': 'rfnd_1', 'order_id': 'order_paid', 'amount': 10000},
+            {'type': 'cash', 'entity_id': '', 'receipt': self.cash_receipt, 'amount': 10000},
+        ]
+
+    def _issues(self, report):
+        return sorted((row['issue'], row['key']) for row in csv.DictReader(io.StringIO(report)))
+
+    def _expected_issues(self):
+        return sorted([
+            ('amount differs', 'order_short'),
+            ('unknown payment', 'order_ghost'),
+            ('missing from settlement', 'order_unreported'),
+        ])
+
+    def test_file_is_matched_in_chunks(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/settlement.csv'
+            with open(path, 'w', newline='') as fh:
+                writer = csv.DictWriter(fh, fieldnames=['type', 'entity_id', 'order_id', 'receipt', 'amount'])
+                writer.writeheader()
+                writer.writerows(self.rows)
+            report = io.StringIO()
+            call_command('reconcile_payments', file=path, date=timezone.localdate(), chunk_size=2,
+                         stdout=report, stderr=io.StringIO())
+
+        self.assertEqual(self._issues(report.getvalue()), self._expected_issues())
+        pending = Payment.objects.get(razorpay_order_id='order_pending')
+        self.assertEqual((pending.status, pending.razorpay_payment_id), ('completed', 'pay_late'))
+        self.assertIsNotNone(Payment.objects.get(razorpay_payment_id='cash').reconciled_at)
+
+    def test_unreadable_amounts_are_reported_not_fatal(self):
+        rows = self.rows + [
+            {'type': 'payment', 'entity_id': 'pay_unreported', 'order_id': 'order_unreported', 'amount': ''},
+        ]
+        rows[0] = {**rows[0], 'amount': '10000.00'}
+        rows[2] = {**rows[2], 'amount': '9000.5'}
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/settlement.csv'
+            with open(path, 'w', newline='') as fh:
+                writer = csv.DictWriter(fh, fieldnames=['type', 'entity_id', 'order_id', 'receipt', 'amount'])
+                writer.writeheader()
+                writer.writerows(rows)
+            report = io.StringIO()
+            call_command('reconcile_payments', file=path, date=timezone.localdate(), stdout=report, stderr=io.StringIO())
+
+        issues = {row['key']: (row['issue'], row['reported_amount']) for row in csv.DictReader(io.StringIO(report.getvalue()))}
+        self.assertEqual(issues['order_short'], ('unreadable amount', '9000.5'))
+        # Flagged from its row, so not reported again as missing
+        self.assertEqual(issues['order_unreported'], ('unreadable amount', ''))
+        self.assertNotIn('order_paid', issues)
+        self.assertIsNotNone(Payment.objects.get(razorpay_order_id='order_paid').reconciled_at)
+
+    def test_malformed_receipts_are_unknown_payments(self):
+        rows = [row for row in self.rows if row['type'] != 'cash'] + [
+            # The hex spelling still names the pickup
+            {'type': 'cash', 'entity_id': '', 'receipt': uuid.UUID(self.cash_receipt).hex, 'amount': 10000},
+            {'type': 'cash', 'entity_id': '', 'receipt': 'not-a-uuid', 'amount': 10000},
+        ]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = f'{tmp}/settlement.csv'
+            with open(path, 'w', newline='') as fh:
+                writer = csv.DictWriter(fh, fieldnames=['type', 'entity_id', 'order_id', 'receipt', 'amount'])
+                writer.writeheader()
+                writer.writerows(rows)
+            report = io.StringIO()
+            call_command('reconcile_payments', file=path, date=timezone.localdate(), stdout=report, stderr=io.StringIO())
+
+        self.assertEqual(
+            self._issues(report.getvalue()),
+            sorted(self._expected_issues() + [('unknown payment', 'not-a-uuid')]),
+        )
+        self.assertIsNotNone(Payment.objects.get(razorpay_payment_id='cash').reconciled_at)
+
+    def test_unsettled_payments_are_chosen_by_completion_day(self):
+        today = timezone.now()
+        # Booked days ago and paid today: settles today
+        Payment.objects.filter(pk=self.payments['order_unreported'].pk).update(
+            created_at=today - timedelta(days=3), updated_at=today,
+        )
+        # Booked yesterday and paid today: not yesterday's business
+        Payment.objects.filter(pk=self.payments['order_paid'].pk).update(
+            created_at=today - timedelta(days=1), updated_at=today,
+        )
+        stats = reconciliation.Reconciler(timezone.localdate() - timedelta(days=1)).run([])
+        self.assertEqual(stats['unsettled'], 0)
+
+        report = io.StringIO()
+        writer = csv.DictWriter(report, fieldnames=reconciliation.REPORT_FIELDS)
+        writer.writeheader()
+        reconciliation.Reconciler(timezone.localdate(), writer).run(
+            reconciliation.iter_csv_rows(io.StringIO('type,entity_id,order_id,receipt,amount\n'))
+        )
+        self.assertIn(('missing from settlement', 'order_unreported'), self._issues(report.getvalue()))
+        self.assertIn(('missing from settlement', 'order_paid'), self._issues(report.getvalue()))
+
+    def test_gateway_report_is_paged(self):
+        server = MockGatewayServer('key_test', 'secret_test').start()
+        self.addCleanup(server.stop)
+        server.settlements[timezone.localdate().isoformat()] = [
+            {'type': row['type'], 'entity_id': row['entity_id'], 'order_id': row.get('order_id'),
+             'amount': row['amount']}
+            for row in self.rows if row['type'] != 'cash'
+        ]
+        client = gateway.RazorpayGateway('key_test', 'secret_test', base_url=server.base_url)
+        report = io.StringIO()
+        writer = csv.DictWriter(report, fieldnames=reconciliation.REPORT_FIELDS)
+        writer.writeheader()
+        stats = reconciliation.Reconciler(timezone.localdate(), writer).run(
+            reconciliation.iter_api_rows(client, timezone.localdate(), page_size=2)
+        )
+        self.assertEqual(stats['rows'], 5)
+        self.assertEqual(server.request_count, 3)
+        self.assertEqual(
+            self._issues(report.getvalue()),
+            sorted(self._expected_issues() + [('missing from settlement', self.cash_receipt)]),
+        )
+
+
+@override_settings(
+    JOBS_IMMEDIATE=True,
+    NOTIFICATION_SMS_BACKEND='user_dashboard.notifications.LocmemSMSBackend',
+    NOTIFICATION_RATE_LIMITS={},
+)
+class NotificationOutboxTests(TestCase):
+
+    def setUp(self):
+        notifications.LocmemSMSBackend.outbox.clear()
+        ward = Ward.objects.create(name='East', panchayath=Panchayath.objects.create(name='Notify', code='N'), ward_number=1)
+        self.resident = User.objects.create_user('resident', email='resident@example.com', password='pw')
+        Profile.objects.create(user=self.resident, ward=ward, mobile_number='9000000001')
+        self.worker = User.objects.create_user('collector')
+        Profile.objects.create(user=self.worker, ward=ward, role='worker')
+        self.pickup = PickupRequest.objects.create(
+            user=self.resident, waste_type='dry', schedule_date_time=timezone.now(),
+        )
+
+    def test_status_change_queues_and_sends_on_each_channel(self):
+        self.client.force_login(self.worker)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('mark_picked', args=[self.pickup.pk]))
+
+        self.assertEqual(Notification.objects.filter(status='sent').count(), 2)
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('collected', mail.outbox[0].body)
+        self.assertEqual(notifications.LocmemSMSBackend.outbox[0][0], '9000000001')
+
+    def test_password_reset_mail_goes_through_the_outbox(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('password_reset'), {'email': 'resident@example.com'})
+
+        notification = Notification.objects.get(channel='email')
+        self.assertEqual(notification.status, 'sent')
+        self.assertEqual(mail.outbox[0].to, ['resident@example.com'])
+        self.assertIn('/password-reset/confirm/', mail.outbox[0].body)
+
+    @override_settings(NOTIFICATION_SMS_BACKEND='user_dashboard.notifications.BaseSMSBackend')
+    def test_failed_send_is_retried_with_backoff(self):
+        notifications.notify(self.resident, 'Subject', 'Body')
+
+        with self.assertLogs('user_dashboard.notifications', 'WARNING'):
+            self.assertEqual(notifications.send_batch('sms'), (0, 1))
+        sms = Notification.objects.get(channel='sms')
+        self.assertEqual((sms.status, sms.attempts), ('pending', 1))
+        self.assertGreater(sms.next_attempt_at, timezone.now())
+        # Not due yet
+        self.assertEqual(notifications.send_batch('sms'), (0, 0))
+
+        Notification.objects.filter(pk=sms.pk).update(next_attempt_at=timezone.now())
+        with override_settings(NOTIFICATION_SMS_BACKEND='user_dashboard.notifications.LocmemSMSBackend'):
+            self.assertEqual(notifications.send_pending(), (2, False))
+        self.assertEqual(Notification.objects.get(pk=sms.pk).status, 'sent')
+
+    def test_claimed_rows_are_not_sent_twice(self):
+        notifications.notify(self.resident, 'Subject', 'Body')
+        # Another sender holds the email
+        email = Notification.objects.get(channel='email')
+        Notification.objects.filter(pk=email.pk).update(
+            status='sending', claim_token=uuid.uuid4(), next_attempt_at=timezone.now() + timedelta(minutes=5),
+        )
+        self.assertEqual(notifications.send_batch('email'), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+
+        # Its hold runs out (the sender died): the row is claimed and sent once
+        Notification.objects.filter(pk=email.pk).update(next_attempt_at=timezone.now())
+        self.assertEqual(notifications.send_batch('email'), (1, 0))
+        email.refresh_from_db()
+        self.assertEqual((email.status, email.claim_token, len(mail.outbox)), ('sent', None, 1))
+
+    def test_run_stops_at_its_deadline_and_hands_rows_back(self):
+        for i in range(3):
+            notifications.queue_email(f'r{i}@example.com', 'Subject', 'Body')
+        self.assertEqual(notifications.send_batch('email', deadline=timezone.now()), (0, 0))
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(Notification.objects.filter(status='pending', claim_token__isnull=True).count(), 3)
+        self.assertEqual(notifications.send_pending(seconds=60), (3, False))
+
+    def test_token_bucket_paces_sends(self):
+        now = [0.0]
+        slept = []
+
+        def sleep(seconds):
+            slept.append(seconds)
+            now[0] += seconds
+
+        bucket = notifications.TokenBucket(rate=2, burst=2, clock=lambda: now[0], sleep=sleep)
+        for _ in range(4):
+            bucket.acquire()
+        self.assertEqual(slept, [0.5, 0.5])
+
+
+class LiveDashboardTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Live', code='L')
+        self.ward = Ward.objects.create(name='Central', panchayath=panchayath, ward_number=1)
+        self.other_ward = Ward.objects.create(name='Outer', panchayath=panchayath, ward_number=2)
+        self.resident = User.objects.create_user('household')
+        Profile.objects.create(user=self.resident, ward=self.ward)
+        self.neighbour = User.objects.create_user('neighbour')
+        Profile.objects.create(user=self.neighbour, ward=self.other_ward)
+        self.worker = User.objects.create_user('sweeper')
+        Profile.objects.create(user=self.worker, ward=self.ward, role='worker')
+        self.pickup = PickupRequest.objects.create(user=self.resident, waste_type='wet', schedule_date_time=timezone.now())
+        self.elsewhere = PickupRequest.objects.create(user=self.neighbour, waste_type='wet', schedule_date_time=timezone.now())
+        Payment.objects.create(user=self.resident, pickup_request=self.pickup, amount=Decimal('100.00'))
+
+    def test_transition_publishes_event_and_row_renders_alone(self):
+        self.client.force_login(self.worker)
+        self.client.get(reverse('mark_picked', args=[self.pickup.pk]))
+
+        event = PickupEvent.objects.get()
+        self.assertEqual((event.ward_id, event.pickup_id, event.status, event.payment_status),
+                         (self.ward.pk, self.pickup.pk, 'picked', 'pending'))
+        row = self.client.get(reverse('worker_pickup_row', args=[self.pickup.pk]))
+        self.assertContains(row, 'data-status="picked"')
+        self.assertContains(row, reverse('collect_cash', args=[self.pickup.pk]))
+        self.assertEqual(self.client.get(reverse('worker_pickup_row', args=[self.elsewhere.pk])).status_code, 404)
+
+        PickupRequest.objects.filter(pk=self.pickup.pk).update(status='cancelled')
+        self.assertEqual(self.client.get(reverse('worker_pickup_row', args=[self.pickup.pk])).status_code, 204)
+
+    def test_stream_is_off_under_wsgi(self):
+        self.client.force_login(self.worker)
+        self.assertEqual(self.client.get(reverse('worker_events')).status_code, 204)
+
+    async def test_stream_catches_up_then_relays_only_its_ward(self):
+        missed = await PickupEvent.objects.acreate(ward=self.ward, pickup=self.pickup, status='pending')
+        broadcaster = live.WardBroadcaster(interval=0.01)
+        stream = live.event_stream(self.ward.pk, 0, broadcaster)
+
+        self.assertTrue((await anext(stream)).startswith('retry: '))
+        self.assertIn(f'id: {missed.id}\nevent: pickup\n', await anext(stream))
+        await PickupEvent.objects.acreate(ward=self.other_ward, pickup=self.elsewhere, status='picked')
+        ours = await PickupEvent.objects.acreate(ward=self.ward, pickup=self.pickup, status='picked', payment_status='pending')
+        # The broadcaster also sees `missed` on its first poll; it isn't repeated
+        message = await asyncio.wait_for(anext(stream), 2)
+        self.assertEqual(
+            message, f'id: {ours.id}\nevent: pickup\ndata: {{"pickup":{self.pickup.pk},"status":"picked","payment":"pending"}}\n\n',
+        )
+
+        await stream.aclose()
+        self.assertEqual(broadcaster.subscribers, {})
+
+    async def test_broadcaster_relays_ids_that_commit_late(self):
+        broadcaster = live.WardBroadcaster()
+        subscription = live.Subscription(self.ward.pk, 10)
+        broadcaster.subscribers[self.ward.pk] = {subscription}
+        broadcaster.cursor = 0
+        await PickupEvent.objects.acreate(id=10, ward=self.ward, pickup=self.pickup, status='pending')
+        self.assertEqual(await broadcaster.poll_once(), 1)
+        # Still within the settle window: read again but not repeated
+        self.assertEqual(await broadcaster.poll_once(), 0)
+        self.assertEqual(broadcaster.cursor, 0)
+
+        # A transaction that took id 5 before id 10 commits only now
+        await PickupEvent.objects.acreate(id=5, ward=self.ward, pickup=self.pickup, status='picked')
+        self.assertEqual(await broadcaster.poll_once(), 1)
+        self.assertEqual([subscription.queue.get_nowait().id for _ in range(2)], [10, 5])
+
+        with override_settings(LIVE_SETTLE_SECONDS=0):
+            self.assertEqual(await broadcaster.poll_once(), 0)
+        self.assertEqual((broadcaster.cursor, broadcaster.delivered), (10, set()))
+
+    async def test_stream_resets_when_too_far_behind(self):
+        for status in ('pending', 'picked'):
+            await PickupEvent.objects.acreate(ward=self.ward, pickup=self.pickup, status=status)
+        stream = live.event_stream(self.ward.pk, 0, live.WardBroadcaster(batch_size=1))
+        self.assertEqual([message async for message in stream][1:], [live.RESET])
+
+        # Everything up to the client's position has been purged
+        await PickupEvent.objects.all().adelete()
+        stream = live.event_stream(self.ward.pk, 5, live.WardBroadcaster())
+        self.assertEqual([message async for message in stream][1:], [live.RESET])
+
+    # Settled at once, so the catch-up does not re-send the last few seconds before Last-Event-ID
+    @override_settings(LIVE_STREAM_SECONDS=0.3, LIVE_HEARTBEAT_SECONDS=0.1, LIVE_SETTLE_SECONDS=0)
+    async def test_asgi_view_streams_from_last_event_id(self):
+        seen = await PickupEvent.objects.acreate(ward=self.ward, pickup=self.pickup, status='pending')
+        missed = await PickupEvent.objects.acreate(ward=self.ward, pickup=self.pickup, status='picked')
+        await self.async_client.aforce_login(self.worker)
+
+        response = await self.async_client.get(reverse('worker_events'), headers={'Last-Event-ID': str(seen.id)})
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+        self.assertNotIn(f'id: {seen.id}\nevent', body)
+        self.assertIn(f'id: {missed.id}\nevent: pickup', body)
+        # Heartbeats keep the client's position current
+        self.assertIn(f'id: {missed.id}\n\n', body)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class OfflineSyncTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Sync', code='S')
+        self.ward = Ward.objects.create(name='Hill', panchayath=panchayath, ward_number=1)
+        other_ward = Ward.objects.create(name='Valley', panchayath=panchayath, ward_number=2)
+        self.resident = User.objects.create_user('villager')
+        Profile.objects.create(user=self.resident, ward=self.ward)
+        outsider = User.objects.create_user('outsider')
+        Profile.objects.create(user=outsider, ward=other_ward)
+        self.worker = User.objects.create_user('crew-lead')
+        Profile.objects.create(user=self.worker, ward=self.ward, role='worker')
+        self.client.force_login(self.worker)
+
+        self.pickups = [
+            PickupRequest.objects.create(user=self.resident, waste_type='dry', schedule_date_time=timezone.now())
+            for _ in range(3)
+        ]
+        self.payment = Payment.objects.create(user=self.resident, pickup_request=self.pickups[0], amount=Decimal('100.00'))
+        Feedback.objects.create(user=self.resident, ward=self.ward, subject='Late', message='Truck was late')
+        self.elsewhere = PickupRequest.objects.create(user=outsider, waste_type='dry', schedule_date_time=timezone.now())
+
+    def _changes(self, cursor='', **params):
+        return self.client.get(reverse('sync_changes'), {'cursor': cursor, **params}).json()
+
+    def _upload(self, actions):
+        return self.client.post(reverse('sync_actions'), json.dumps({'actions': actions}), content_type='application/json')
+
+    def test_download_returns_only_ward_changes_since_cursor(self):
+        first = self._changes()
+        self.assertEqual([row[0] for row in first['pickups']['rows']], [p.pk for p in self.pickups])
+        self.assertEqual(first['payments']['rows'], [[self.payment.pk, self.pickups[0].pk, '100.00', 'pending', False]])
+        self.assertEqual(len(first['feedback']['rows']), 1)
+        self.assertFalse(first['more'])
+
+        quiet = self._changes(first['cursor'])
+        self.assertEqual([len(quiet[kind]['rows']) for kind in sync.KINDS], [0, 0, 0])
+
+        self.pickups[1].status = 'picked'
+        self.pickups[1].save()
+        changed = self._changes(quiet['cursor'])
+        status = changed['pickups']['fields'].index('status')
+        self.assertEqual([(row[0], row[status]) for row in changed['pickups']['rows']], [(self.pickups[1].pk, 'picked')])
+
+    def test_download_pages_and_holds_back_unsettled_cursor(self):
+        page = self._changes(limit=2)
+        self.assertTrue(page['more'])
+        rest = self._changes(page['cursor'], limit=2)
+        self.assertEqual([row[0] for row in page['pickups']['rows'] + rest['pickups']['rows']],
+                         [p.pk for p in self.pickups])
+        self.assertFalse(rest['more'])
+
+        with override_settings(SYNC_SETTLE_SECONDS=60):
+            again = self._changes(self._changes()['cursor'])
+        # Rows this recent may still be joined by late commits, so they come again
+        self.assertEqual(len(again['pickups']['rows']), 3)
+
+        self.assertEqual(self.client.get(reverse('sync_changes'), {'cursor': 'garbage!'}).status_code, 400)
+
+    def test_download_is_compressed(self):
+        response = self.client.get(reverse('sync_changes'), headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('pickups', json.loads(gzip.decompress(response.content)))
+
+    @override_settings(JOBS_IMMEDIATE=False)
+    def test_upload_applies_actions_in_order_and_idempotently(self):
+        pickup = self.pickups[0]
+        actions = [
+            {'id': 'a1', 'op': 'picked', 'pickup': pickup.pk},
+            {'id': 'a2', 'op': 'completed', 'pickup': pickup.pk, 'weight': '4.25'},
+            {'id': 'a3', 'op': 'cash', 'pickup': pickup.pk},
+            {'id': 'a4', 'op': 'cash', 'pickup': self.pickups[1].pk},
+            {'id': 'a5', 'op': 'completed', 'pickup': self.pickups[2].pk, 'weight': '1'},
+            {'id': 'a6', 'op': 'completed', 'pickup': self.pickups[2].pk, 'weight': '-1'},
+            {'id': 'a7', 'op': 'picked', 'pickup': self.elsewhere.pk},
+        ]
+        results = self._upload(actions).json()['results']
+        self.assertEqual(
+            [(r['id'], r['result'], r['status'], r['payment']) for r in results],
+            [
+                ('a1', 'applied', 'picked', 'pending'),
+                ('a2', 'applied', 'completed', 'pending'),
+                ('a3', 'applied', 'completed', 'completed'),
+                ('a4', 'applied', 'pending', 'completed'),
+                ('a5', 'conflict', 'pending', None),
+                ('a6', 'invalid', 'pending', None),
+                ('a7', 'invalid', None, None),
+            ],
+        )
+        pickup.refresh_from_db()
+        self.assertEqual((pickup.status, pickup.waste_weight), ('completed', Decimal('4.25')))
+        self.assertEqual(Payment.objects.get(pickup_request=self.pickups[1]).razorpay_payment_id, 'cash')
+        self.assertEqual(PickupEvent.objects.filter(pickup=pickup).count(), 1)
+
+        # A retry after a lost response changes nothing
+        replay = self._upload(actions[:4]).json()['results']
+        self.assertEqual({r['result'] for r in replay}, {'duplicate'})
+        self.assertEqual(PickupEvent.objects.count(), 2)
+
+        changes = self._changes()
+        self.assertIn([self.payment.pk, pickup.pk, '100.00', 'completed', True], changes['payments']['rows'])
+
+    def test_upload_accepts_gzip_and_rejects_malformed_batches(self):
+        body = gzip.compress(json.dumps({'actions': [{'id': 'g1', 'op': 'picked', 'pickup': self.pickups[0].pk}]}).encode())
+        response = self.client.post(reverse('sync_actions'), body, content_type='application/json',
+                                    headers={'Content-Encoding': 'gzip'})
+        self.assertEqual(response.json()['results'][0]['result'], 'applied')
+
+        self.assertEqual(self._upload([{'id': 'x', 'op': 'delete', 'pickup': 1}]).status_code, 400)
+        with override_settings(SYNC_MAX_ACTIONS=1):
+            self.assertEqual(self._upload([{'id': 'x', 'op': 'picked', 'pickup': 1}] * 2).status_code, 413)
+
+
+class RoutePlannerTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Route', code='R')
+        self.ward = Ward.objects.create(name='Lake', panchayath=panchayath, ward_number=1)
+        self.worker = User.objects.create_user('driver')
+        Profile.objects.create(user=self.worker, ward=self.ward, role='worker')
+        self.client.force_login(self.worker)
+
+    def _pickup(self, name, lat=None, lng=None, status='pending'):
+        user = User.objects.create_user(name)
+        Profile.objects.create(user=user, ward=self.ward, latitude=lat, longitude=lng)
+        return PickupRequest.objects.create(user=user, waste_type='dry', status=status,
+                                            schedule_date_time=timezone.now())
+
+    def test_parse_coordinates(self):
+        self.assertEqual(routing.parse_coordinates(' 12.9716, 77.5946 '), (12.9716, 77.5946))
+        self.assertEqual(routing.parse_coordinates('-33.8,151'), (-33.8, 151.0))
+        for text in ('', None, 'MG Road, Bengaluru', '95, 10', '10, 190'):
+            self.assertIsNone(routing.parse_coordinates(text))
+
+    def test_two_opt_removes_crossings(self):
+        # Corners of a square visited crosswise: 0 -> 2 -> 1 -> 3
+        distances = routing.Distances([0.0, 0.0, 0.01, 0.01], [0.0, 0.01, 0.0, 0.01])
+        crossed = np.array([0, 3, 1, 2])
+        improved, _ = routing.two_opt(crossed, distances)
+        self.assertLess(routing.route_length(improved, distances), routing.route_length(crossed, distances))
+        self.assertEqual(sorted(improved), [0, 1, 2, 3])
+
+        rng = np.random.default_rng(1)
+        lat, lng = rng.random(200) * 0.05, rng.random(200) * 0.05
+        for matrix_max in (2000, 0):
+            distances = routing.Distances(lat, lng, matrix_max=matrix_max)
+            greedy = routing.nearest_neighbour(distances, 0)
+            improved, _ = routing.two_opt(greedy, distances, fixed_start=True)
+            self.assertEqual(improved[0], 0)
+            self.assertEqual(sorted(improved), list(range(200)))
+            self.assertLess(routing.route_length(improved, distances), routing.route_length(greedy, distances))
+
+    def test_plan_route_starts_from_given_point(self):
+        lat, lng = [0.0, 0.0, 0.0], [0.02, 0.01, 0.03]
+        order, legs = routing.plan_route(lat, lng, start=(0.0, 0.0))
+        self.assertEqual(order, [1, 0, 2])
+        self.assertAlmostEqual(legs[0], 1.11, places=2)
+        self.assertEqual(routing.plan_route([], []), ([], []))
+
+    def test_route_view_orders_stops_and_lists_unlocated_last(self):
+        far = self._pickup('far', Decimal('12.990000'), Decimal('77.600000'))
+        near = self._pickup('near', Decimal('12.971000'), Decimal('77.600000'), status='picked')
+        middle = self._pickup('middle', Decimal('12.980000'), Decimal('77.600000'))
+        unknown = self._pickup('unknown')
+        self._pickup('done', Decimal('12.975000'), Decimal('77.600000'), status='completed')
+
+        response = self.client.get(reverse('worker_route'), {'lat': '12.970000', 'lng': '77.600000'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([pickup for pickup, _ in response.context['stops']], [near, middle, far])
+        self.assertEqual(response.context['unlocated'], [unknown])
+        self.assertAlmostEqual(response.context['total_km'], 2.22, places=1)
+        self.assertContains(response, 'destination=12.971000,77.600000')
+
+    def test_profile_location_fills_coordinates(self):
+        profile = Profile.objects.create(user=User.objects.create_user('resident'), ward=self.ward)
+        self.client.force_login(profile.user)
+        self.client.post(reverse('edit_profile'), {
+            'email': 'resident@example.com', 'location': '12.9716, 77.5946', 'ward': self.ward.pk,
+        })
+        profile.refresh_from_db()
+        self.assertEqual((profile.latitude, profile.longitude), (Decimal('12.971600'), Decimal('77.594600')))
+
+    def test_benchmark_command(self):
+        out = io.StringIO()
+        call_command('benchmark_routes', '--stops', '20', '60', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+
+class PickupSlotTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        panchayath = Panchayath.objects.create(name='Slots', code='SL')
+        self.ward = Ward.objects.create(name='Market', panchayath=panchayath, ward_number=1)
+        self.user = User.objects.create_user('resident')
+        Profile.objects.create(user=self.user, ward=self.ward)
+        self.client.force_login(self.user)
+        self.date = timezone.localdate() + timedelta(days=2)
+        self.morning = PickupSlot.objects.create(
+            ward=self.ward, weekday=self.date.weekday(), start_time='09:00', end_time='11:00', capacity=2,
+        )
+        self.evening = PickupSlot.objects.create(
+            ward=self.ward, weekday=self.date.weekday(), start_time='17:00', end_time='18:00', capacity=1,
+        )
+
+    def _book(self, time, key):
+        return self.client.post(reverse('request_pickup'), {
+            'waste_type': 'dry',
+            'schedule_date_time': f'{self.date.isoformat()}T{time}',
+            'idempotency_key': key,
+        })
+
+    def test_reserve_stops_at_capacity_and_release_frees_a_place(self):
+        slots.reserve(self.morning, self.date)
+        slots.reserve(self.morning, self.date)
+        with self.assertRaises(slots.SlotFull):
+            slots.reserve(self.morning, self.date)
+        self.assertEqual(SlotUsage.objects.get(slot=self.morning, date=self.date).booked, 2)
+
+        slots.release(self.morning, self.date)
+        slots.reserve(self.morning, self.date)
+        self.assertEqual(SlotUsage.objects.get(slot=self.morning, date=self.date).booked, 2)
+
+    def test_availability_is_served_from_cache_until_a_slot_fills(self):
+        self.assertEqual([available for _, available in slots.availability(self.ward.pk, self.date)], [True, True])
+        with self.assertNumQueries(0):
+            slots.availability(self.ward.pk, self.date)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            slots.reserve(self.morning, self.date)
+        with self.assertNumQueries(0):
+            # Not full yet, so the bitmap is still valid
+            slots.availability(self.ward.pk, self.date)
+        with self.captureOnCommitCallbacks(execute=True):
+            slots.reserve(self.evening, self.date)
+
+        response = self.client.get(reverse('slot_availability'), {'date': self.date.isoformat()})
+        self.assertEqual(response.json()['slots'], [
+            {'id': self.morning.pk, 'start': '09:00', 'end': '11:00', 'available': True},
+            {'id': self.evening.pk, 'start': '17:00', 'end': '18:00', 'available': False},
+        ])
+        self.assertEqual(self.client.get(reverse('slot_availability'), {'date': 'soon'}).status_code, 400)
+
+        # Editing a window drops the cached definitions
+        self.evening.capacity = 2
+        self.evening.save()
+        self.assertTrue(slots.availability(self.ward.pk, self.date)[1][1])
+
+    def test_booking_takes_a_place_and_cancelling_returns_it(self):
+        response = self._book('13:00', 'k1')
+        self.assertContains(response, 'collection slots that day: 09:00-11:00, 17:00-18:00')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self._book('17:30', 'k2')
+        pickup = PickupRequest.objects.get(user=self.user)
+        self.assertEqual(pickup.slot, self.evening)
+
+        response = self._book('17:15', 'k3')
+        self.assertContains(response, 'That collection slot is full')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('cancel_request', args=[pickup.pk]))
+        self.assertEqual(SlotUsage.objects.get(slot=self.evening).booked, 0)
+        self._book('17:15', 'k4')
+        self.assertEqual(PickupRequest.objects.filter(slot=self.evening, status='pending').count(), 1)
+
+    def test_slot_filled_after_the_form_check_rolls_the_booking_back(self):
+        slots.availability(self.ward.pk, self.date)
+        # Another process took the last place; this one's cache hasn't heard yet
+        SlotUsage.objects.create(slot=self.evening, date=self.date, booked=1)
+        response = self._book('17:30', 'k1')
+        self.assertContains(response, 'has just filled up')
+        self.assertFalse(PickupRequest.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    def test_wards_without_slots_book_any_time(self):
+        PickupSlot.objects.all().delete()
+        self._book('13:00', 'k1')
+        self.assertIsNone(PickupRequest.objects.get(user=self.user).slot)
+
+
+@override_settings(JOBS_IMMEDIATE=True)
+class PickupAssignmentTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Assign', code='AS')
+        self.ward = Ward.objects.create(name='Harbour', panchayath=panchayath, ward_number=1)
+        self.workers = []
+        for name in ('ana', 'ben', 'cho'):
+            worker = User.objects.create_user(name)
+            Profile.objects.create(user=worker, ward=self.ward, role='worker')
+            self.workers.append(worker)
+        self.resident = User.objects.create_user('household')
+        Profile.objects.create(user=self.resident, ward=self.ward)
+        self.tomorrow = timezone.now() + timedelta(days=1)
+
+    def _pickups(self, count, when=None):
+        return [
+            PickupRequest.objects.create(user=self.resident, waste_type='dry', schedule_date_time=when or self.tomorrow)
+            for _ in range(count)
+        ]
+
+    def _loads(self):
+        return [PickupRequest.objects.filter(assigned_to=w, status__in=['pending', 'picked']).count() for w in self.workers]
+
+    def test_ward_load_prefers_least_loaded_that_day(self):
+        day, other_day = self.tomorrow.date(), self.tomorrow.date() + timedelta(days=1)
+        load = assignment.WardLoad([1, 2, 3], [(1, day, 2), (2, day, 1), (3, other_day, 5)])
+        # Worker 3 is free that day; on equal days the lighter overall load wins
+        self.assertEqual([load.take(day) for _ in range(4)], [3, 2, 3, 1])
+        self.assertIsNone(assignment.WardLoad([]).take(day))
+
+    def test_deleted_households_pickups_are_not_assigned(self):
+        [pickup] = self._pickups(1)
+        # As if the pickup was submitted while the household was being deleted
+        Profile.objects.filter(user=self.resident).update(deleted_at=timezone.now())
+        self.assertEqual(assignment.assign_pending(), 0)
+        self.assertEqual(assignment.assign_ward(self.ward.pk), 0)
+        pickup.refresh_from_db()
+        self.assertIsNone(pickup.assigned_to)
+
+    def test_new_pickups_are_spread_over_on_duty_workers(self):
+        self._pickups(2)
+        PickupRequest.objects.update(assigned_to=self.workers[0])
+        Profile.objects.filter(user=self.workers[2]).update(on_duty=False)
+        self._pickups(4)
+        self.assertEqual(assignment.assign_pending(), 4)
+        self.assertEqual(self._loads(), [3, 3, 0])
+        self.assertEqual(assignment.assign_pending(), 0)
+
+    def test_submitting_a_pickup_assigns_it(self):
+        self.client.force_login(self.resident)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('request_pickup'), {
+                'waste_type': 'wet', 'schedule_date_time': timezone.localtime(self.tomorrow).strftime('%Y-%m-%dT%H:%M'),
+            })
+        self.assertIn(PickupRequest.objects.get().assigned_to, self.workers)
+
+    def test_going_off_duty_hands_pending_pickups_back(self):
+        self._pickups(6)
+        assignment.assign_pending()
+        leaving = self.workers[0]
+        picked = PickupRequest.objects.filter(assigned_to=leaving).first()
+        picked.status = 'picked'
+        picked.save()
+
+        self.client.force_login(leaving)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('worker_duty'))
+        self.assertFalse(Profile.objects.get(user=leaving).on_duty)
+        # The picked one stays; the other pending one went to a colleague
+        self.assertEqual(self._loads(), [1, 3, 2])
+
+        response = self.client.get(reverse('worker_queue'))
+        self.assertEqual(list(response.context['pickups']), [picked])
+
+    def test_marking_picked_claims_the_pickup(self):
+        pickup, = self._pickups(1)
+        assignment.assign_pending()
+        pickup.refresh_from_db()
+        other = next(w for w in self.workers if w != pickup.assigned_to)
+        self.client.force_login(other)
+        self.client.get(reverse('mark_picked', args=[pickup.pk]))
+        self.assertEqual(PickupRequest.objects.get().assigned_to, other)
+
+    def test_rebalance_command_evens_out_load(self):
+        self._pickups(6)
+        PickupRequest.objects.update(assigned_to=self.workers[0])
+        call_command('assign_pickups', '--rebalance', '--ward', str(self.ward.pk), stdout=io.StringIO())
+        self.assertEqual(self._loads(), [2, 2, 2])
+
+
+class PickupClaimTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Claims', code='CL')
+        self.ward = Ward.objects.create(name='Orchard', panchayath=panchayath, ward_number=1)
+        self.first, self.second = User.objects.create_user('first'), User.objects.create_user('second')
+        for worker in (self.first, self.second):
+            Profile.objects.create(user=worker, ward=self.ward, role='worker')
+        resident = User.objects.create_user('neighbour')
+        Profile.objects.create(user=resident, ward=self.ward)
+        self.pickup = PickupRequest.objects.create(user=resident, waste_type='dry', schedule_date_time=timezone.now())
+
+    def _expire(self):
+        PickupRequest.objects.filter(pk=self.pickup.pk).update(claim_expires_at=timezone.now() - timedelta(seconds=1))
+
+    def test_only_one_worker_holds_a_claim_until_it_lapses(self):
+        self.assertIsNotNone(claims.claim(self.pickup.pk, self.first))
+        self.assertIsNone(claims.claim(self.pickup.pk, self.second))
+        self.assertIsNone(claims.renew(self.pickup.pk, self.second))
+        self.assertFalse(claims.release(self.pickup.pk, self.second))
+        # Claiming again just extends your own lease
+        self.assertIsNotNone(claims.claim(self.pickup.pk, self.first))
+
+        self._expire()
+        self.pickup.refresh_from_db()
+        self.assertIsNone(self.pickup.active_claimant)
+        self.assertIsNotNone(claims.claim(self.pickup.pk, self.second))
+        self.assertIsNone(claims.renew(self.pickup.pk, self.first))
+        self.assertTrue(claims.release(self.pickup.pk, self.second))
+        self.assertIsNotNone(claims.claim(self.pickup.pk, self.first))
+
+    def test_claim_api(self):
+        self.client.force_login(self.first)
+        response = self.client.post(reverse('claim_pickup', args=[self.pickup.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['claimed'], True)
+        self.assertEqual(PickupEvent.objects.filter(pickup=self.pickup).count(), 1)
+
+        self.client.force_login(self.second)
+        response = self.client.post(reverse('claim_pickup', args=[self.pickup.pk]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual((response.json()['claimed'], response.json()['claimant']), (False, 'first'))
+        self.assertEqual(self.client.post(reverse('release_pickup_claim', args=[self.pickup.pk])).status_code, 409)
+        self.assertContains(self.client.get(reverse('worker_dashboard')), 'first is on the way')
+
+        outsider = User.objects.create_user('outsider')
+        Profile.objects.create(user=outsider, ward=Ward.objects.create(name='Far', ward_number=2), role='worker')
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.post(reverse('claim_pickup', args=[self.pickup.pk])).status_code, 404)
+
+    def test_picking_respects_and_clears_claims(self):
+        claims.claim(self.pickup.pk, self.first)
+        self.client.force_login(self.second)
+        self.client.get(reverse('mark_picked', args=[self.pickup.pk]))
+        self.pickup.refresh_from_db()
+        self.assertEqual(self.pickup.status, 'pending')
+
+        self._expire()
+        self.client.get(reverse('mark_picked', args=[self.pickup.pk]))
+        self.pickup.refresh_from_db()
+        self.assertEqual((self.pickup.status, self.pickup.claimed_by), ('picked', None))
+
+    def test_claim_between_read_and_pick_wins(self):
+        # The second worker read the pickup unclaimed; the first claims before the write
+        seen = PickupRequest.objects.get(pk=self.pickup.pk)
+        self.assertIsNone(seen.active_claimant)
+        claims.claim(self.pickup.pk, self.first)
+        self.assertFalse(claims.pick(seen.pk, self.second))
+        self.pickup.refresh_from_db()
+        self.assertEqual((self.pickup.status, self.pickup.claimed_by), ('pending', self.first))
+        self.assertTrue(claims.pick(seen.pk, self.first))
+
+    def test_worker_dashboard_queries_do_not_grow_with_pickups(self):
+        self.client.force_login(self.first)
+
+        def queries():
+            with CaptureQueriesContext(connection) as captured:
+                self.client.get(reverse('worker_dashboard'))
+            return len(captured)
+
+        before = queries()
+        for i, status in enumerate(['pending', 'pending', 'picked', 'completed'] * 2):
+            resident = User.objects.create_user(f'resident{i}')
+            Profile.objects.create(user=resident, ward=self.ward)
+            PickupRequest.objects.create(
+                user=resident, waste_type='wet', status=status, schedule_date_time=timezone.now(), claimed_by=self.second,
+            )
+        self.assertEqual(queries(), before)
+
+
+class SearchTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Search', code='SR')
+        self.ward = Ward.objects.create(name='Harbour', panchayath=panchayath, ward_number=1)
+        self.other_ward = Ward.objects.create(name='Hillside', panchayath=panchayath, ward_number=2)
+        self.resident = User.objects.create_user('resident')
+        Profile.objects.create(user=self.resident, ward=self.ward)
+        self.admin = User.objects.create_user('searchadmin')
+        Profile.objects.create(user=self.admin, role='admin')
+        self.worker = User.objects.create_user('searchworker')
+        Profile.objects.create(user=self.worker, role='worker', ward=self.ward)
+
+    def _feedback(self, subject, message='', ward=None, **fields):
+        return Feedback.objects.create(
+            user=self.resident, subject=subject, message=message, ward=ward or self.ward, **fields
+        )
+
+    def _ids(self, text, queryset=None):
+        return [row.pk for row in search.search(search.FEEDBACK, text, queryset)]
+
+    def test_index_follows_inserts_updates_and_deletes(self):
+        self.assertEqual(search.backend(), 'sqlite')
+        feedback = self._feedback('Bin overflowing', 'Near the market')
+        self.assertEqual(self._ids('overflow'), [feedback.pk])
+
+        Feedback.objects.filter(pk=feedback.pk).update(message='Near the temple')
+        self.assertEqual(self._ids('market'), [])
+        self.assertEqual(self._ids('temple'), [feedback.pk])
+
+        feedback.response = 'Crew sent on Monday'
+        feedback.save()
+        self.assertEqual(self._ids('crew'), [feedback.pk])
+
+        created = Feedback.objects.bulk_create([Feedback(user=self.resident, subject='Broken lid', message='')])
+        self.assertEqual(self._ids('lid'), [created[0].pk])
+
+        feedback.delete()
+        self.assertEqual(self._ids('temple'), [])
+
+    def test_words_stems_and_prefixes(self):
+        drain = self._feedback('Blocked drains', 'Water everywhere after rain')
+        self._feedback('Truck came late', 'Drain is fine')
+        # Every word must match; the last may be a prefix of one
+        self.assertEqual(self._ids('blocking drain'), [drain.pk])
+        self.assertEqual(self._ids('water everyw'), [drain.pk])
+        # Query syntax is treated as plain text
+        self.assertEqual(self._ids('"blocked" -drain*'), [drain.pk])
+        self.assertEqual(search.search(search.FEEDBACK, '  ?! '), [])
+
+    def test_subject_matches_rank_first_with_highlighted_snippet(self):
+        in_message = self._feedback('Collection missed', 'The plastic was left <b>outside</b>')
+        in_subject = self._feedback('Plastic everywhere', 'Please send someone')
+        results = search.search(search.FEEDBACK, 'plastic')
+        self.assertEqual([row.pk for row in results], [in_subject.pk, in_message.pk])
+        # The snippet comes from the column that matched
+        self.assertEqual(results[1].search_snippet, 'The <mark>plastic</mark> was left &lt;b&gt;outside&lt;/b&gt;')
+
+    def test_filters_apply_before_ranking_and_limit(self):
+        mine = [self._feedback('Dogs near bins', status='resolved') for _ in range(3)]
+        self._feedback('Dogs near bins', ward=self.other_ward, status='resolved')
+        self._feedback('Dogs near bins')
+        queryset = Feedback.objects.filter(ward=self.ward, status='resolved')
+        self.assertEqual(sorted(self._ids('dogs', queryset)), [f.pk for f in mine])
+        self.assertEqual(len(search.search(search.FEEDBACK, 'dogs', limit=2)), 2)
+
+    def test_feedback_pages_search_within_filters(self):
+        match = self._feedback('Mosquitoes by the canal')
+        old = self._feedback('Mosquitoes again')
+        Feedback.objects.filter(pk=old.pk).update(created_at=timezone.now() - timedelta(days=40))
+        elsewhere = self._feedback('Mosquitoes at school', ward=self.other_ward)
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin_feedbacks'), {'q': 'mosquito', 'from': since})
+        self.assertEqual({f.pk for f in response.context['feedbacks']}, {match.pk, elsewhere.pk})
+        self.assertContains(response, '<mark>Mosquitoes</mark>')
+        response = self.client.get(reverse('admin_feedbacks'), {'ward': self.other_ward.pk})
+        self.assertEqual([f.pk for f in response.context['feedbacks']], [elsewhere.pk])
+
+        self.client.force_login(self.worker)
+        response = self.client.get(reverse('feedback_management'), {'q': 'mosquitoes'})
+        self.assertEqual({f.pk for f in response.context['feedbacks']}, {match.pk, old.pk})
+        response = self.client.get(reverse('feedback_management'), {'to': 'not-a-date', 'status': 'resolved'})
+        self.assertEqual(list(response.context['feedbacks']), [])
+
+    def test_admin_search_includes_full_text_matches(self):
+        resident_pickup = PickupRequest.objects.create(
+            user=self.resident, waste_type='dry', description='Old fridge and a broken chair',
+            schedule_date_time=timezone.now(),
+        )
+        self.admin.is_staff = self.admin.is_superuser = True
+        self.admin.save()
+        self.client.force_login(self.admin)
+        response = self.client.get(reverse('admin:user_dashboard_pickuprequest_changelist'), {'q': 'chairs'})
+        self.assertEqual([p.pk for p in response.context['cl'].result_list], [resident_pickup.pk])
+        response = self.client.get(reverse('admin:user_dashboard_pickuprequest_changelist'), {'q': 'resid'})
+        self.assertEqual([p.pk for p in response.context['cl'].result_list], [resident_pickup.pk])
+
+
+class FeedbackClusteringTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Clusters', code='CU')
+        self.ward = Ward.objects.create(name='Riverside', panchayath=panchayath, ward_number=1)
+        self.other_ward = Ward.objects.create(name='Uplands', panchayath=panchayath, ward_number=2)
+        self.residents = [User.objects.create_user(f'resident{i}') for i in range(4)]
+        for resident in self.residents:
+            Profile.objects.create(user=resident, ward=self.ward)
+        self.now = timezone.now()
+
+    def _complaint(self, subject, message, hours_ago=0, ward=None, user=0, **fields):
+        feedback = Feedback.objects.create(
+            user=self.residents[user], subject=subject, message=message, is_complaint=True,
+            ward=ward or self.ward, **fields
+        )
+        Feedback.objects.filter(pk=feedback.pk).update(created_at=self.now - timedelta(hours=hours_ago))
+        return feedback
+
+    def _clusters(self):
+        clusters = {}
+        for pk, cluster_id in Feedback.objects.filter(cluster__isnull=False).values_list('pk', 'cluster_id'):
+            clusters.setdefault(cluster_id, set()).add(pk)
+        return clusters
+
+    def test_vectors_are_normalised_and_dot_matches_dense(self):
+        texts = ['Bin overflowing near the temple', 'The bin near temple is overflowing', 'Truck never came', '']
+        vectors = clustering.Vectors(texts, hash_bits=16)
+        sims = vectors.dot((0, 4), (0, 4))
+        dense = np.zeros((4, 1 << 16))
+        for row in range(4):
+            lo, hi = vectors.indptr[row], vectors.indptr[row + 1]
+            dense[row, vectors.indices[lo:hi]] = vectors.data[lo:hi]
+        np.testing.assert_allclose(sims, dense @ dense.T, atol=1e-12)
+        np.testing.assert_allclose(np.diag(sims)[:3], 1.0)
+        # Reordered words share no word pairs, so score lower than a copy would
+        self.assertGreater(sims[0, 1], 0.4)
+        self.assertLess(sims[0, 2], 0.1)
+
+    def test_groups_duplicates_by_ward_and_window(self):
+        first = self._complaint('Overflowing bin near temple', 'The bin at the temple gate is overflowing again', 30)
+        second = self._complaint('Bin overflowing near temple', 'Bin at temple gate overflowing, please clear', 20, user=1)
+        third = self._complaint('Overflowing bin near the temple', 'Temple gate bin is overflowing', 2, user=2)
+        # Same words, but another ward, too long ago, resolved or not a complaint
+        self._complaint('Overflowing bin near temple', 'The bin at the temple gate is overflowing', 10, ward=self.other_ward)
+        self._complaint('Overflowing bin near temple', 'The bin at the temple gate is overflowing again', 200, user=3)
+        self._complaint('Overflowing bin near temple', 'The bin at the temple gate is overflowing', 5, status='resolved')
+        Feedback.objects.create(user=self.residents[3], subject='Overflowing bin near temple', message='Same bin', ward=self.ward)
+        self._complaint('Stray dogs at school', 'Dogs tearing garbage bags by the school', 1, user=3)
+
+        self.assertEqual(clustering.cluster_complaints(self.now), (6, 1))
+        self.assertEqual(list(self._clusters().values()), [{first.pk, second.pk, third.pk}])
+        cluster = FeedbackCluster.objects.get()
+        self.assertEqual((cluster.ward, cluster.subject), (self.ward, first.subject))
+
+    def test_rerun_keeps_cluster_ids_and_drops_empty_clusters(self):
+        a = self._complaint('Drain blocked on Main Road', 'Drain blocked on Main Road, water on road', 3)
+        b = self._complaint('Drain blocked on Main Road', 'Main Road drain blocked and water on road', 2, user=1)
+        clustering.cluster_complaints(self.now)
+        cluster_id = FeedbackCluster.objects.get().pk
+
+        c = self._complaint('Main Road drain blocked', 'Water on road, drain blocked on Main Road', 1, user=2)
+        clustering.cluster_complaints(self.now)
+        self.assertEqual(self._clusters(), {cluster_id: {a.pk, b.pk, c.pk}})
+
+        Feedback.objects.filter(pk__in=[b.pk, c.pk]).delete()
+        clustering.cluster_complaints(self.now)
+        self.assertEqual(self._clusters(), {})
+        self.assertFalse(FeedbackCluster.objects.exists())
+
+    def test_admin_resolves_a_cluster_at_once(self):
+        admin_user = User.objects.create_user('clusteradmin')
+        Profile.objects.create(user=admin_user, role='admin')
+        complaints = [
+            self._complaint('No collection this week', f'No collection on Elm Street this week {n}', n, user=n)
+            for n in range(3)
+        ]
+        clustering.cluster_complaints(self.now)
+        cluster = FeedbackCluster.objects.get()
+        Feedback.objects.filter(pk=complaints[2].pk).update(status='resolved', response='Already done')
+
+        self.client.force_login(admin_user)
+        response = self.client.get(reverse('admin_feedback_clusters'))
+        self.assertEqual([c.pk for c in response.context['clusters']], [cluster.pk])
+        self.assertEqual(response.context['clusters'][0].pending_count, 2)
+
+        response = self.client.post(reverse('admin_respond_cluster', args=[cluster.pk]), {'response': 'Crew sent'})
+        self.assertRedirects(response, reverse('admin_feedback_clusters'))
+        self.assertEqual(
+            list(Feedback.objects.order_by('pk').values_list('status', 'response')),
+            [('resolved', 'Crew sent'), ('resolved', 'Crew sent'), ('resolved', 'Already done')],
+        )
+        response = self.client.get(reverse('admin_feedback_clusters'))
+        self.assertEqual(list(response.context['clusters']), [])
+
+    def test_submitted_feedback_takes_the_residents_ward(self):
+        self.client.force_login(self.residents[0])
+        self.client.post(reverse('feedback'), {'subject': 'Bin broken', 'message': 'Lid missing', 'is_complaint': 'on'})
+        self.assertEqual(Feedback.objects.get().ward, self.ward)
+
+
+class RewardPolicyTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Rewards', code='RW')
+        self.wards = [Ward.objects.create(name=f'Ward {i}', panchayath=panchayath, ward_number=i) for i in (1, 2)]
+        self.households = []
+        for i in range(7):
+            user = User.objects.create_user(f'household{i}')
+            Profile.objects.create(user=user, ward=self.wards[i % 2])
+            self.households.append(user)
+        pickups = [
+            (0, 'wet', '4.00'), (0, 'plastic', '1.00'),
+            (1, 'e-waste', '2.00'),
+            (2, 'wet', '3.00'), (2, 'dry', '3.00'),
+            (3, 'recyclable', '12.00'),
+            # Ties on impact with household 3 (exactly 6.00)
+            (4, 'wet', '0.10'), (4, 'dry', '0.20'), (4, 'plastic', '2.85'),
+            (5, 'plastic', '0.75'),
+        ]
+        for index, waste_type, kg in pickups:
+            PickupRequest.objects.create(
+                user=self.households[index], waste_type=waste_type, waste_weight=Decimal(kg),
+                status='completed', schedule_date_time=timezone.now(),
+            )
+        # Household 6 has no completed pickups and still gets ranked
+
+    def test_current_policy_reproduces_the_job(self):
+        tasks.recalculate_user_rewards()
+        awarded = dict(Reward.objects.values_list('user_id', 'points'))
+
+        history = reward_policies.RewardHistory.load()
+        self.assertEqual(history.pickups, 10)
+        points = history.points([reward_policies.CURRENT_POLICY])[:, 0]
+        self.assertEqual(dict(zip(history.user_ids.tolist(), points.tolist())), awarded)
+
+    def test_many_policies_in_one_pass(self):
+        history = reward_policies.RewardHistory.load()
+        lenient = reward_policies.Policy('lenient plastic', {**reward_policies.IMPACT_WEIGHTS, 'plastic': 1})
+        flat = reward_policies.Policy('flat scale', reward_policies.IMPACT_WEIGHTS, min_points=50, max_points=60)
+        ranks = history.ranks([reward_policies.CURRENT_POLICY, lenient, flat])
+        position = {pk: index for index, pk in enumerate(history.user_ids.tolist())}
+        # Household 5 stays second behind the one with no waste; household 4 overtakes 3 once plastic is cheaper
+        self.assertEqual(ranks[position[self.households[5].pk]].tolist(), [1, 1, 1])
+        self.assertLess(ranks[position[self.households[3].pk], 0], ranks[position[self.households[4].pk], 0])
+        self.assertGreater(ranks[position[self.households[3].pk], 1], ranks[position[self.households[4].pk], 1])
+
+        reports = history.compare([lenient, flat], top=3)
+        self.assertEqual([r['policy'] for r in reports], ['lenient plastic', 'flat scale'])
+        self.assertEqual(reports[1]['changed'], 0)
+        self.assertEqual(reports[1]['spearman'], 1.0)
+        self.assertEqual(reports[1]['points']['percentiles']['p100'], 60)
+        self.assertGreater(reports[0]['changed'], 0)
+        self.assertEqual({w['ward_id'] for w in reports[1]['wards']}, {w.pk for w in self.wards})
+
+    def test_command_compares_a_grid(self):
+        out = io.StringIO()
+        call_command('simulate_rewards', '--weight', 'plastic=1,3', '--points', '0:100', stdout=out)
+        self.assertIn('plastic=1 0-100pts', out.getvalue())
+        self.assertIn('plastic=3 0-100pts', out.getvalue())
+
+
+class UserPurgeTests(TestCase):
+
+    def setUp(self):
+        panchayath = Panchayath.objects.create(name='Purge', code='PU')
+        self.ward = Ward.objects.create(name='Central', panchayath=panchayath, ward_number=1)
+        self.admin = User.objects.create_user('purgeadmin', password='pass')
+        Profile.objects.create(user=self.admin, role='admin')
+        self.worker = User.objects.create_user('purgeworker', password='pass')
+        Profile.objects.create(user=self.worker, role='worker', ward=self.ward)
+        self.household = User.objects.create_user('household', password='pass')
+        Profile.objects.create(user=self.household, ward=self.ward)
+        self.neighbour = User.objects.create_user('neighbour')
+        Profile.objects.create(user=self.neighbour, ward=self.ward)
+        Reward.objects.create(user=self.household, points=40)
+        for i in range(7):
+            pickup = PickupRequest.objects.create(
+                user=self.household, waste_type='wet', schedule_date_time=timezone.now(), assigned_to=self.worker,
+            )
+            Payment.objects.create(user=self.household, pickup_request=pickup, amount=Decimal('100.00'))
+            PickupEvent.objects.create(ward=self.ward, pickup=pickup, status='pending')
+            Feedback.objects.create(user=self.household, subject=f'Complaint {i}', message='Bin overflowing')
+        self.kept = PickupRequest.objects.create(
+            user=self.neighbour, waste_type='dry', schedule_date_time=timezone.now(), assigned_to=self.worker,
+        )
+        Notification.objects.create(user=self.household, channel='email', recipient='h@example.com', body='Hi')
+
+    def test_delete_view_hides_the_user_and_queues_the_purge(self):
+        self.client.login(username='purgeadmin', password='pass')
+        response = self.client.post(reverse('admin_delete_user', args=[self.household.pk]))
+        self.assertRedirects(response, reverse('admin_users'))
+
+        # Nothing is removed in the request
+        self.assertEqual(PickupRequest.objects.filter(user=self.household).count(), 7)
+        self.assertFalse(Profile.objects.filter(user=self.household).exists())
+        self.assertTrue(Profile.all_objects.filter(user=self.household, deleted_at__isnull=False).exists())
+        self.assertFalse(User.objects.get(pk=self.household.pk).is_active)
+        self.assertFalse(self.client.login(username='household', password='pass'))
+        self.assertEqual(UserPurge.objects.get(user_id=self.household.pk).requested_by, self.admin)
+        self.assertTrue(Job.objects.filter(name='user_dashboard.tasks.purge_deleted_users', status='queued').exists())
+
+        self.client.login(username='purgeadmin', password='pass')
+        listed = self.client.get(reverse('admin_users'))
+        self.assertNotContains(listed, 'household')
+        self.assertEqual(self.client.get(reverse('admin_delete_user', args=[self.household.pk])).status_code, 404)
+
+    def test_purge_removes_rows_in_batches_and_resumes(self):
+        record = purge.soft_delete_user(self.household, requested_by=self.admin)
+        # Five batches for the fourteen events (each pickup's creation and its
+        # cancellation), one to move on, and the first three payments
+        self.assertTrue(purge.purge_pending(batch_size=3, max_batches=7))
+        record.refresh_from_db()
+        self.assertEqual(record.stage, 'payments')
+        self.assertEqual(record.removed, {'pickup events': 14, 'payments': 3})
+        self.assertEqual(PickupEvent.objects.count(), 0)
+        self.assertEqual(Payment.objects.count(), 4)
+
+        while purge.purge_pending(batch_size=3, max_batches=5):
+            pass
+        record.refresh_from_db()
+        self.assertIsNotNone(record.finished_at)
+        self.assertEqual(record.removed['pickups'], 7)
+        self.assertEqual(record.removed['feedback'], 7)
+        self.assertEqual(record.removed['notifications'], 1)
+        self.assertFalse(User.objects.filter(pk=self.household.pk).exists())
+        self.assertFalse(Profile.all_objects.filter(user_id=self.household.pk).exists())
+        self.assertFalse(Reward.objects.filter(user_id=self.household.pk).exists())
+        self.assertEqual(Notification.objects.get().user, None)
+        self.assertTrue(PickupRequest.objects.filter(pk=self.kept.pk).exists())
+        self.assertFalse(purge.purge_pending())
+
+    def test_purged_pending_pickups_free_their_slot_places(self):
+        date = timezone.localdate() + timedelta(days=2)
+        slot = PickupSlot.objects.create(ward=self.ward, weekday=date.weekday(), start_time='09:00', end_time='11:00', capacity=3)
+        at = timezone.make_aware(datetime.combine(date, time(9, 30)))
+        for user, status in ((self.household, 'pending'), (self.household, 'pending'), (self.neighbour, 'pending')):
+            slots.reserve(slot, date)
+            PickupRequest.objects.create(user=user, waste_type='dry', schedule_date_time=at, slot=slot, status=status)
+        self.assertEqual(SlotUsage.objects.get(slot=slot, date=date).booked, 3)
+
+        purge.soft_delete_user(self.household)
+        while purge.purge_pending(batch_size=4):
+            pass
+        # The neighbour's booking still holds its place
+        self.assertEqual(SlotUsage.objects.get(slot=slot, date=date).booked, 1)
+
+    def test_deleted_households_pending_pickups_leave_workers_at_once(self):
+        unassigned = PickupRequest.objects.create(user=self.household, waste_type='dry', schedule_date_time=timezone.now())
+        purge.soft_delete_user(self.household)
+        self.assertEqual(
+            set(PickupRequest.objects.filter(user=self.household).values_list('status', flat=True)), {'cancelled'},
+        )
+
+        assignment.assign_pending()
+        unassigned.refresh_from_db()
+        self.assertIsNone(unassigned.assigned_to)
+        # Only the neighbour's pickup still counts towards the worker's load
+        self.assertEqual(assignment.WardLoad.from_db(self.ward.pk).totals[self.worker.pk], 1)
+
+        self.client.login(username='purgeworker', password='pass')
+        dashboard = self.client.get(reverse('worker_dashboard'))
+        self.assertEqual([row['pickup'] for row in dashboard.context['pending_pickups']], [self.kept])
+
+    def test_deleted_worker_hands_back_pickups(self):
+        record = purge.soft_delete_user(self.worker)
+        self.kept.refresh_from_db()
+        self.assertIsNone(self.kept.assigned_to)
+        self.assertNotIn(self.worker.pk, assignment.WardLoad.from_db(self.ward.pk).workers)
+
+        tasks.purge_deleted_users()
+        record.refresh_from_db()
+        self.assertIsNotNone(record.finished_at)
+        self.assertEqual(PickupRequest.objects.filter(assigned_to__isnull=False).count(), 0)
+        self.assertEqual(PickupRequest.objects.count(), 8)
+
+    def test_command_reports_progress(self):
+        purge.soft_delete_user(self.household)
+        out = io.StringIO()
+        call_command('purge_deleted_users', '--status', stdout=out)
+        self.assertIn('household (id', out.getvalue())
+        self.assertIn('pickup events', out.getvalue())
+        call_command('purge_deleted_users', '--batch-size', '2', stdout=io.StringIO())
+        self.assertFalse(User.objects.filter(username='household').exists())
+
+
+class AdminUserListTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        panchayath = Panchayath.objects.create(name='List', code='LI')
+        cls.north = Ward.objects.create(name='North', panchayath=panchayath, ward_number=1)
+        cls.south = Ward.objects.create(name='South', panchayath=panchayath, ward_number=2)
+        cls.admin = User.objects.create_user('listadmin', password='pass')
+        Profile.objects.create(user=cls.admin, role='admin')
+        users = User.objects.bulk_create(
+            [User(username=f'resident{i:02d}', email=f'Resident{i:02d}@Example.com') for i in range(60)]
+            + [User(username='Anitha', email='anitha@example.com'), User(username='biju', email='Kerala.Biju@example.com')]
+        )
+        Profile.objects.bulk_create(
+            [Profile(user=user, ward=cls.north if i % 2 else cls.south) for i, user in enumerate(users)]
+        )
+        Profile.objects.filter(user__username='biju').update(mobile_number='9847012345')
+
+    def setUp(self):
+        self.client.login(username='listadmin', password='pass')
+
+    def _usernames(self, **params):
+        response = self.client.get(reverse('admin_users'), params)
+        return [user.username for user in response.context['users']], response.context['page_obj']
+
+    def test_pages_through_users_keeping_filters(self):
+        first, page = self._usernames()
+        self.assertEqual(len(first), 50)
+        self.assertEqual(page.paginator.count, 63)
+        second, _ = self._usernames(page=2)
+        self.assertEqual(len(second), 13)
+        self.assertFalse(set(first) & set(second))
+        response = self.client.get(reverse('admin_users'), {'q': 'resident', 'page': 2})
+        self.assertContains(response, 'q=resident')
+        self.assertEqual(len(response.context['users']), 10)
+
+    def test_search_matches_prefixes_ignoring_case(self):
+        self.assertEqual(self._usernames(q='ANI')[0], ['Anitha'])
+        self.assertEqual(self._usernames(q='kerala.')[0], ['biju'])
+        self.assertEqual(self._usernames(q='98470')[0], ['biju'])
+        # Prefixes only, like the indexes that serve them
+        self.assertEqual(self._usernames(q='nitha')[0], [])
+        self.assertEqual(self._usernames(q='resident0')[1].paginator.count, 10)
+
+    def test_ward_filter(self):
+        north, page = self._usernames(ward=self.north.pk, q='resident')
+        self.assertEqual(page.paginator.count, 30)
+        self.assertTrue(all(int(name[-2:]) % 2 for name in north))
+        self.assertEqual(self._usernames(ward=self.south.pk, q='biju')[0], [])
+        # A malformed ward id is ignored rather than failing the page
+        self.assertEqual(self._usernames(ward='x')[1].paginator.count, 63)
@@ -0,0 +1,190 @@
+"""
+Resumable chunked uploads for pickup photos.
+
+A client first POSTs the file's name, size and type to start an upload and
+receives a token. It then PUTs the raw bytes in order, each chunk carrying
+its byte offset in an `Upload-Offset` header; chunks are streamed straight
+to a part file without going through Django's upload handlers. If a chunk
+fails, GET on the upload returns the offset to resume from. The image magic
+bytes are checked on the first chunk and the whole file is verified with
+Pillow once the last byte arrives; a file that fails is deleted and its
+upload marked failed, so the client starts a new one. PickupRequestForm
+accepts the token in place of a file.
+"""
+import logging
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.views.decorators.http import require_http_methods, require_POST
+from PIL import Image
+
+from .models import PhotoUpload
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK = 64 * 1024
+
+# Leading bytes of each accepted format
+MAGIC_NUMBERS = {
+    'image/jpeg': [(0, b'\xff\xd8\xff')],
+    'image/png': [(0, b'\x89PNG\r\n\x1a\n')],
+    'image/webp': [(0, b'RIFF'), (8, b'WEBP')],
+}
+
+
+def max_upload_bytes():
+    return getattr(settings, 'PICKUP_PHOTO_MAX_BYTES', 15 * 1024 * 1024)
+
+
+def chunk_bytes():
+    return getattr(settings, 'PICKUP_PHOTO_CHUNK_BYTES', 1024 * 1024)
+
+
+def upload_dir():
+    return Path(getattr(settings, 'PICKUP_UPLOAD_DIR', Path(settings.BASE_DIR) / 'upload_chunks'))
+
+
+def upload_path(upload):
+    return upload_dir() / f'{upload.token.hex}.part'
+
+
+def header_matches(content_type, head):
+    signatures = MAGIC_NUMBERS.get(content_type, [])
+    return bool(signatures) and all(head[offset:offset + len(magic)] == magic for offset, magic in signatures)
+
+
+def discard_expired_uploads(limit=20):
+    """Delete a few abandoned uploads; called opportunistically."""
+    max_age = getattr(settings, 'PICKUP_UPLOAD_EXPIRY', timedelta(hours=24))
+    expired = PhotoUpload.objects.filter(
+        created_at__lt=timezone.now() - max_age,
+        pickup_request__isnull=True,
+    )[:limit]
+    for upload in expired:
+        try:
+            os.remove(upload_path(upload))
+        except FileNotFoundError:
+            pass
+        upload.delete()
+
+
+def _state(upload):
+    return {
+        'token': str(upload.token),
+        'offset': upload.received,
+        'size': upload.size,
+        'status': upload.status,
+        'chunk_size': chunk_bytes(),
+    }
+
+
+@login_required
+@require_POST
+def start_photo_upload_view(request):
+    """Open an upload session after checking the declared size and type."""
+    content_type = request.POST.get('content_type', '')
+    filename = os.path.basename(request.POST.get('filename', ''))[:255] or 'photo'
+    try:
+        size = int(request.POST.get('size', ''))
+    except ValueError:
+        return JsonResponse({'error': 'A numeric size is required.'}, status=400)
+
+    if content_type not in MAGIC_NUMBERS:
+        return JsonResponse({'error': 'Only JPEG, PNG and WebP photos are accepted.'}, status=415)
+    if not 0 < size <= max_upload_bytes():
+        return JsonResponse({'error': f'Photos must be at most {max_upload_bytes() // (1024 * 1024)} MB.'}, status=413)
+
+    discard_expired_uploads()
+    upload = PhotoUpload.objects.create(
+        user=request.user, filename=filename, content_type=content_type, size=size,
+    )
+    upload_dir().mkdir(parents=True, exist_ok=True)
+    upload_path(upload).touch()
+    return JsonResponse(_state(upload), status=201)
+
+
+@login_required
+@require_http_methods(['GET', 'PUT'])
+def photo_upload_view(request, token):
+    """GET reports the resume offset; PUT appends one chunk."""
+    upload = get_object_or_404(PhotoUpload, token=token, user=request.user)
+    if request.method == 'GET':
+        return JsonResponse(_state(upload))
+
+    if upload.status != 'uploading':
+        return JsonResponse(_state(upload), status=409)
+    try:
+        offset = int(request.headers.get('Upload-Offset', ''))
+        length = int(request.headers.get('Content-Length', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Upload-Offset and Content-Length headers are required.'}, status=400)
+    if offset != upload.received:
+        # Out-of-order or repeated chunk: tell the client where to resume
+        return JsonResponse(_state(upload), status=409)
+    if length <= 0 or length > chunk_bytes() or offset + length > upload.size:
+        return JsonResponse({'error': 'Chunk exceeds the allowed or declared size.'}, status=413)
+
+    path = upload_path(upload)
+    written = 0
+    with open(path, 'r+b') as part:
+        part.seek(offset)
+        part.truncate()
+        while written < length:
+            block = request.read(min(READ_BLOCK, length - written))
+            if not block:
+                break
+            if offset == 0 and written == 0 and not header_matches(upload.content_type, block[:16]):
+                return JsonResponse({'error': 'File content does not match its image type.'}, status=415)
+            part.write(block)
+            written += len(block)
+    if written != length:
+        # Connection dropped mid-chunk; keep only the bytes already confirmed
+        with open(path, 'r+b') as part:
+            part.truncate(offset)
+        return JsonResponse(_state(upload), status=400)
+
+    upload.received = offset + written
+    if upload.received == upload.size:
+        try:
+            with Image.open(path) as image:
+                image.verify()
+        except (OSError, Image.DecompressionBombError):
+            upload.status = 'failed'
+            upload.save(update_fields=['received', 'status', 'updated_at'])
+            os.remove(path)
+            return JsonResponse({**_state(upload), 'error': 'The uploaded file is not a valid image.'}, status=415)
+        upload.status = 'complete'
+    upload.save(update_fields=['received', 'status', 'updated_at'])
+    return JsonResponse(_state(upload))
+
+
+def claim_completed_upload(token, user):
+    """Return the completed PhotoUpload for token owned by user, or None."""
+    return (
+        PhotoUpload.objects
+        .filter(token=token, user=user, status__in=['complete', 'consumed'])
+        .select_related('pickup_request')
+        .first()
+    )
+
+
+def mark_consumed(upload, pickup):
+    """Attach the upload to its pickup and delete the part file afterwards."""
+    upload.status = 'consumed'
+    upload.pickup_request = pickup
+    upload.save(update_fields=['status', 'pickup_request', 'updated_at'])
+    path = upload_path(upload)
+
+    def remove_part():
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+    transaction.on_commit(remove_part)
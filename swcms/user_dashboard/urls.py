@@ -2,6 +2,14 @@ from django.urls import path
 from django.urls import reverse_lazy
 from django.contrib.auth import views as auth_views
 from . import views
+from .forms import OutboxPasswordResetForm
+from . import claims
+from . import live
+from . import metrics
+from . import profiling
+from . import sync
+from . import uploads
+from . import webhooks
 
 urlpatterns = [
     path('', views.index, name='index'),
@@ -13,6 +21,9 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     path('edit-profile/', views.edit_profile_view, name='edit_profile'),
     path('request-pickup/', views.request_pickup_view, name='request_pickup'),
+    path('request-pickup/slots/', views.slot_availability_view, name='slot_availability'),
+    path('request-pickup/photo/', uploads.start_photo_upload_view, name='start_photo_upload'),
+    path('request-pickup/photo/<uuid:token>/', uploads.photo_upload_view, name='photo_upload'),
     path('pickup/<int:pk>/', views.pickup_detail_view, name='pickup_detail'),
     path('payment/<int:pk>/', views.payment_view, name='payment'),
     path('request-management/', views.request_management_view, name='request_management'),
@@ -22,6 +33,16 @@ urlpatterns = [
     path('feedback-management/', views.feedback_management_view, name='feedback_management'),
     path('resolve-feedback/<int:pk>/', views.resolve_feedback_view, name='resolve_feedback'),
     path('worker-dashboard/', views.worker_dashboard_view, name='worker_dashboard'),
+    path('worker-dashboard/queue/', views.worker_queue_view, name='worker_queue'),
+    path('worker-dashboard/duty/', views.worker_duty_view, name='worker_duty'),
+    path('worker-dashboard/route/', views.worker_route_view, name='worker_route'),
+    path('worker-dashboard/events/', live.worker_events_view, name='worker_events'),
+    path('worker-dashboard/pickup/<int:pk>/', views.worker_pickup_row_view, name='worker_pickup_row'),
+    path('pickups/<int:pk>/claim/', claims.pickup_claim_view, {'action': 'claim'}, name='claim_pickup'),
+    path('pickups/<int:pk>/claim/renew/', claims.pickup_claim_view, {'action': 'renew'}, name='renew_pickup_claim'),
+    path('pickups/<int:pk>/claim/release/', claims.pickup_claim_view, {'action': 'release'}, name='release_pickup_claim'),
+    path('sync/changes/', sync.sync_changes_view, name='sync_changes'),
+    path('sync/actions/', sync.sync_actions_view, name='sync_actions'),
     path('mark-picked/<int:pk>/', views.mark_picked_view, name='mark_picked'),
     path('mark-completed/<int:pk>/', views.mark_completed_view, name='mark_completed'),
     path('collect-cash/<int:pk>/', views.collect_cash_view, name='collect_cash'),
@@ -29,6 +50,8 @@ urlpatterns = [
     path('admin-dashboard/', views.admin_dashboard_view, name='admin_dashboard'),
     path('admin-users/', views.admin_users_view, name='admin_users'),
     path('admin-feedbacks/', views.admin_feedbacks_view, name='admin_feedbacks'),
+    path('admin-feedbacks/clusters/', views.admin_feedback_clusters_view, name='admin_feedback_clusters'),
+    path('admin-feedbacks/clusters/<int:pk>/respond/', views.admin_respond_cluster_view, name='admin_respond_cluster'),
     path('admin-wards/', views.admin_wards_view, name='admin_wards'),
     path('admin-rewards/', views.admin_rewards_view, name='admin_rewards'),
     path('admin-mark-picked/<int:pk>/', views.admin_mark_picked_view, name='admin_mark_picked'),
@@ -49,8 +72,13 @@ urlpatterns = [
     path('admin-wards/add/', views.admin_add_ward_view, name='admin_add_ward'),
     path('admin-wards/<int:pk>/edit/', views.admin_edit_ward_view, name='admin_edit_ward'),
     path('admin-wards/<int:pk>/delete/', views.admin_delete_ward_view, name='admin_delete_ward'),
+    path('admin-profiles/', profiling.admin_profiles_view, name='admin_profiles'),
+    path('admin-profiles/<str:name>/<str:fmt>/', profiling.admin_profile_download_view, name='admin_profile_download'),
+    path('metrics', metrics.metrics_view, name='metrics'),
+    path('payments/webhook/', webhooks.payment_webhook_view, name='payment_webhook'),
     # Password reset (using Django built-in auth views with app templates)
     path('password-reset/', auth_views.PasswordResetView.as_view(
+        form_class=OutboxPasswordResetForm,
         template_name='user_dashboard/password_reset_form.html',
         email_template_name='user_dashboard/password_reset_email.html',
         success_url=reverse_lazy('password_reset_done')
@@ -3,16 +3,39 @@ from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.auth.models import User
-from django.db.models import Sum, Q
+from django.db.models import Count, Max, Min, Prefetch, Sum, Q
+from django.db.models.functions import Lower
 from django.db import transaction
 from django.conf import settings
+from datetime import datetime, time, timedelta
 from decimal import Decimal
-from collections import defaultdict
 from .forms import UserRegistrationForm, WorkerRegistrationForm, AdminRegistrationForm, LoginForm, PickupRequestForm, FeedbackForm, WasteWeightForm, UserProfileEditForm, ProfileEditForm
-from .models import PickupRequest, Reward, Profile, Ward, Payment, Feedback, Panchayath
+from .models import PickupRequest, Reward, Profile, Ward, Payment, Feedback, FeedbackCluster, Panchayath
+from .images import schedule_variants
+from .uploads import chunk_bytes, max_upload_bytes, mark_consumed
+from .gateway import GatewayError, get_gateway
+from .live import latest_event_id, publish_pickup_change, publish_pickup_changes
+from .notifications import notify_payment_received, notify_pickup_status
+from .assignment import hand_back, schedule_assignment
+from .claims import pick
+from .clustering import resolve_cluster
+from .purge import soft_delete_user
+from .routing import parse_coordinates, ward_route
+from .search import FEEDBACK, search
+from .slots import SlotFull, availability, local_date_time, release_pickup, reserve
+from .tasks import recalculate_user_rewards
+from .idempotency import claim_key, previous_pickup_id, purge_expired_keys, request_key
 import io
-from django.http import HttpResponse
+from django.http import HttpResponse, JsonResponse
+from django.core.paginator import Paginator
+from django.views.decorators.http import require_POST
+
+ADMIN_USERS_PAGE_SIZE = 50
+FEEDBACK_PAGE_SIZE = 50
+CLUSTER_PAGE_SIZE = 20
+PICKUP_FEE = Decimal('100.00')
 
 # Decorator for role-based access
 def role_required(allowed_roles):
@@ -160,16 +183,72 @@ def edit_profile_view(request):
 @login_required
 def request_pickup_view(request):
     if request.method == 'POST':
-        form = PickupRequestForm(request.POST, request.FILES)
+        key = request_key(request)
+        if key is not None:
+            previous = previous_pickup_id(request.user, key)
+            if previous is not None:
+                # A retry of a submission that already went through
+                return redirect('payment', pk=previous)
+        form = PickupRequestForm(request.POST, request.FILES, user=request.user)
         if form.is_valid():
-            pickup = form.save(commit=False)
-            pickup.user = request.user
-            pickup.save()
-            messages.success(request, 'Pickup request submitted successfully.')
-            return redirect('payment', pk=pickup.pk)
+            upload = form.photo_upload
+            if upload is not None and upload.pickup_request_id:
+                # The same photo token was already submitted: don't create a duplicate
+                return redirect('payment', pk=upload.pickup_request_id)
+            try:
+                with transaction.atomic():
+                    claimed = claim_key(request.user, key) if key is not None else None
+                    if key is not None and claimed is None:
+                        # A concurrent submission with this key won the race
+                        previous = previous_pickup_id(request.user, key)
+                        return redirect('payment', pk=previous) if previous else redirect('request_management')
+                    pickup = form.save(commit=False)
+                    pickup.user = request.user
+                    if form.slot is not None:
+                        reserve(form.slot, local_date_time(pickup.schedule_date_time)[0])
+                        pickup.slot_id = form.slot.id
+                    pickup.save()
+                    Payment.objects.create(pickup_request=pickup, user=request.user, amount=PICKUP_FEE)
+                    if claimed is not None:
+                        claimed.pickup_request = pickup
+                        claimed.save(update_fields=['pickup_request'])
+                    if upload is not None:
+                        mark_consumed(upload, pickup)
+                    schedule_variants(pickup)
+                    publish_pickup_change(pickup)
+                    schedule_assignment()
+            except SlotFull:
+                # Filled up since the form checked; the key claim is rolled back too
+                form.add_error('schedule_date_time', "That collection slot has just filled up. Please pick another time.")
+            else:
+                purge_expired_keys()
+                messages.success(request, 'Pickup request submitted successfully.')
+                return redirect('payment', pk=pickup.pk)
     else:
-        form = PickupRequestForm()
-    return render(request, 'user_dashboard/request_pickup.html', {'form': form})
+        form = PickupRequestForm(user=request.user)
+    context = {
+        'form': form,
+        'photo_chunk_size': chunk_bytes(),
+        'photo_max_bytes': max_upload_bytes(),
+    }
+    return render(request, 'user_dashboard/request_pickup.html', context)
+
+@login_required
+def slot_availability_view(request):
+    """The collection slots in the user's ward on ?date=YYYY-MM-DD, for the booking page."""
+    try:
+        date = datetime.strptime(request.GET.get('date', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return JsonResponse({'error': 'date must be YYYY-MM-DD'}, status=400)
+    ward_id = Profile.objects.filter(user=request.user).values_list('ward_id', flat=True).first()
+    slots = availability(ward_id, date) if ward_id is not None else []
+    return JsonResponse({
+        'date': date.isoformat(),
+        'slots': [
+            {'id': window.id, 'start': f'{window.start_time:%H:%M}', 'end': f'{window.end_time:%H:%M}', 'available': available}
+            for window, available in slots
+        ],
+    })
 
 @login_required
 def pickup_detail_view(request, pk):
@@ -183,14 +262,23 @@ def pickup_detail_view(request, pk):
 @login_required
 def payment_view(request, pk):
     pickup = get_object_or_404(PickupRequest, pk=pk, user=request.user)
-    
-    # Get or create payment record
-    payment, created = Payment.objects.get_or_create(
-        pickup_request=pickup,
-        user=request.user,
-        defaults={'amount': Decimal('100.00')}  # Default amount, adjust as needed
-    )
-    
+
+    # The pending payment is created with the pickup; pickups from before
+    # that get an unsaved one so viewing this page never writes.
+    try:
+        payment = pickup.payment
+    except Payment.DoesNotExist:
+        payment = Payment(pickup_request=pickup, user=request.user, amount=PICKUP_FEE)
+
+    if request.method == 'POST':
+        if payment.status != 'pending':
+            messages.info(request, 'Payment was already completed.')
+        elif request.POST.get('razorpay_payment_id'):
+            _confirm_online_payment(request, payment)
+        else:
+            _start_online_payment(request, payment)
+        return redirect('payment', pk=pickup.pk)
+
     # Context data for Razorpay
     context = {
         'pickup': pickup,
@@ -202,6 +290,44 @@ def payment_view(request, pk):
     }
     return render(request, 'user_dashboard/payment.html', context)
 
+
+def _start_online_payment(request, payment):
+    """Create the gateway order the checkout form needs."""
+    if payment.razorpay_order_id:
+        return
+    if payment.pk is None:
+        payment.save()
+    try:
+        order = get_gateway().create_order(
+            int(payment.amount * 100),
+            receipt=str(payment.pickup_request.request_id)[:40],
+            notes={'pickup_request': payment.pickup_request_id},
+        )
+    except GatewayError:
+        messages.error(request, 'Online payment is unavailable right now. Please try again shortly.')
+        return
+    # Conditional so two tabs racing here keep whichever order landed first
+    Payment.objects.filter(pk=payment.pk).filter(
+        Q(razorpay_order_id__isnull=True) | Q(razorpay_order_id='')
+    ).update(razorpay_order_id=order['id'])
+
+
+def _confirm_online_payment(request, payment):
+    """Record a checkout success after checking its signature."""
+    payment_id = request.POST.get('razorpay_payment_id', '')
+    signature = request.POST.get('razorpay_signature', '')
+    # Verify against the order we issued, not the one the browser reports
+    if not get_gateway().verify_payment_signature(payment.razorpay_order_id, payment_id, signature):
+        messages.error(request, 'Payment could not be verified.')
+        return
+    with transaction.atomic():
+        if Payment.objects.filter(pk=payment.pk, status='pending').update(
+            status='completed', razorpay_payment_id=payment_id, updated_at=timezone.now(),
+        ):
+            notify_payment_received(payment)
+            publish_pickup_changes([payment.pickup_request_id])
+    messages.success(request, 'Payment received. Thank you!')
+
 @login_required
 def request_management_view(request):
     pickups = PickupRequest.objects.filter(user=request.user).order_by('-created_at')
@@ -221,8 +347,11 @@ def request_management_view(request):
 def cancel_request_view(request, pk):
     pickup = get_object_or_404(PickupRequest, pk=pk, user=request.user)
     if pickup.status == 'pending':
-        pickup.status = 'cancelled'
-        pickup.save()
+        with transaction.atomic():
+            pickup.status = 'cancelled'
+            pickup.save()
+            release_pickup(pickup)
+            publish_pickup_change(pickup)
         messages.success(request, 'Request cancelled.')
     elif pickup.status == 'completed':
         messages.error(request, 'Cannot cancel completed requests.')
@@ -244,6 +373,8 @@ def feedback_view(request):
         if form.is_valid():
             feedback = form.save(commit=False)
             feedback.user = request.user
+            # Lets the ward's workers see it and duplicates be grouped
+            feedback.ward_id = Profile.objects.filter(user=request.user).values_list('ward_id', flat=True).first()
             feedback.save()
             messages.success(request, 'Feedback submitted.')
             return redirect('index')
@@ -258,8 +389,57 @@ def feedback_management_view(request):
         messages.error(request, "Access denied.")
         return redirect('index')
 
-    feedbacks = Feedback.objects.filter(ward=user_profile.ward).order_by('-created_at') if user_profile.role == 'worker' else Feedback.objects.all().order_by('-created_at')
-    return render(request, 'user_dashboard/feedback_management.html', {'feedbacks': feedbacks})
+    feedbacks = Feedback.objects.filter(ward=user_profile.ward) if user_profile.role == 'worker' else Feedback.objects.all()
+    context = _feedback_list(request, feedbacks)
+    return render(request, 'user_dashboard/feedback_management.html', context)
+
+def _day_start(value):
+    try:
+        day = parse_date(value)
+    except ValueError:
+        return None
+    return timezone.make_aware(datetime.combine(day, time.min)) if day else None
+
+def _feedback_list(request, feedbacks):
+    """Filter feedback by the request's GET parameters, then search it or page through it."""
+    feedbacks = feedbacks.select_related('user', 'ward__panchayath').order_by('-created_at')
+
+    status = request.GET.get('status', '')
+    if status in ('pending', 'resolved'):
+        feedbacks = feedbacks.filter(status=status)
+
+    ward_id = request.GET.get('ward', '')
+    if ward_id.isdigit():
+        feedbacks = feedbacks.filter(ward_id=ward_id)
+
+    # Bounds on created_at itself, not its date, so the index is used
+    date_from = request.GET.get('from', '')
+    start = _day_start(date_from)
+    if start:
+        feedbacks = feedbacks.filter(created_at__gte=start)
+    date_to = request.GET.get('to', '')
+    end = _day_start(date_to)
+    if end:
+        feedbacks = feedbacks.filter(created_at__lt=end + timedelta(days=1))
+
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    context = {
+        'query': request.GET.get('q', '').strip(),
+        'selected_status': status,
+        'selected_ward': ward_id,
+        'date_from': date_from,
+        'date_to': date_to,
+        'filter_querystring': filters.urlencode(),
+        'page_obj': None,
+    }
+    if context['query']:
+        # Best matches only; search() ranks and cuts them off in the database
+        context['feedbacks'] = search(FEEDBACK, context['query'], feedbacks)
+    else:
+        context['page_obj'] = Paginator(feedbacks, FEEDBACK_PAGE_SIZE).get_page(request.GET.get('page'))
+        context['feedbacks'] = context['page_obj'].object_list
+    return context
 
 @login_required
 def resolve_feedback_view(request, pk):
@@ -287,9 +467,9 @@ def worker_dashboard_view(request):
     # Filter pickups by worker's ward
     pickups = PickupRequest.objects.filter(user__profile__ward=user_profile.ward).order_by('-created_at')
 
-    pending_qs = pickups.filter(status='pending')
-    picked_qs = pickups.filter(status='picked')
-    completed_qs = pickups.filter(status='completed')
+    pending_qs = pickups.filter(status='pending').select_related('user', 'claimed_by')
+    picked_qs = pickups.filter(status='picked').select_related('user', 'claimed_by')
+    completed_qs = pickups.filter(status='completed').select_related('user', 'claimed_by')
 
     # Attach payments to pickups to avoid RelatedObjectDoesNotExist in templates
     def attach_payments(qs):
@@ -312,10 +492,71 @@ def worker_dashboard_view(request):
         'completed_pickups': completed_pickups,
         'pending_feedbacks': pending_feedbacks,
         'resolved_feedbacks': resolved_feedbacks,
+        # Live updates resume from here, so nothing between render and connect is lost
+        'live_after': latest_event_id(),
     }
     return render(request, 'user_dashboard/worker_dashboard.html', context)
 
 
+@login_required
+@role_required(['worker'])
+def worker_queue_view(request):
+    """The open pickups assigned to this worker, in schedule order."""
+    user_profile = Profile.objects.get(user=request.user)
+    pickups = (
+        PickupRequest.objects
+        .filter(assigned_to=request.user, status__in=['pending', 'picked'])
+        .select_related('user__profile', 'payment')
+        .order_by('schedule_date_time', 'pk')
+    )
+    return render(request, 'user_dashboard/worker_queue.html', {'pickups': pickups, 'profile': user_profile})
+
+
+@login_required
+@role_required(['worker'])
+@require_POST
+def worker_duty_view(request):
+    """Go on or off duty; going off hands pending pickups to the ward's other workers."""
+    user_profile = Profile.objects.get(user=request.user)
+    with transaction.atomic():
+        user_profile.on_duty = not user_profile.on_duty
+        user_profile.save(update_fields=['on_duty'])
+        if user_profile.on_duty:
+            schedule_assignment()
+            messages.success(request, "You are on duty and will be assigned pickups.")
+        else:
+            count = hand_back(request.user.pk)
+            messages.success(request, f"You are off duty. {count} pending pickup{'s' if count != 1 else ''} handed back.")
+    return redirect('worker_queue')
+
+
+@login_required
+@role_required(['worker'])
+def worker_route_view(request):
+    """Open pickups in the worker's ward in a planned visiting order."""
+    user_profile = Profile.objects.get(user=request.user)
+    # Start from the phone's position if sent, else the worker's saved one
+    start = parse_coordinates(f"{request.GET.get('lat', '')},{request.GET.get('lng', '')}")
+    if start is None and user_profile.latitude is not None and user_profile.longitude is not None:
+        start = (float(user_profile.latitude), float(user_profile.longitude))
+    route = ward_route(user_profile.ward, start=start)
+    return render(request, 'user_dashboard/worker_route.html', {**route, 'start': start})
+
+
+@login_required
+@role_required(['worker'])
+def worker_pickup_row_view(request, pk):
+    """One worker dashboard row, fetched by the page when a pickup changes."""
+    user_profile = Profile.objects.get(user=request.user)
+    pickup = get_object_or_404(
+        PickupRequest.objects.select_related('user', 'claimed_by'), pk=pk, user__profile__ward=user_profile.ward,
+    )
+    if pickup.status not in ('pending', 'picked', 'completed'):
+        return HttpResponse(status=204)
+    payment = Payment.objects.filter(pickup_request=pickup).first()
+    return render(request, 'user_dashboard/worker_pickup_row.html', {'pickup': pickup, 'payment': payment})
+
+
 @login_required
 @role_required(['worker'])
 def collect_cash_view(request, pk):
@@ -327,22 +568,28 @@ def collect_cash_view(request, pk):
         payment = pickup.payment
     except Payment.DoesNotExist:
         # Create a payment record and mark as completed (cash)
-        payment = Payment.objects.create(
-            user=pickup.user,
-            pickup_request=pickup,
-            amount=Decimal('100.00'),
-            status='completed',
-            razorpay_payment_id='cash'
-        )
+        with transaction.atomic():
+            payment = Payment.objects.create(
+                user=pickup.user,
+                pickup_request=pickup,
+                amount=PICKUP_FEE,
+                status='completed',
+                razorpay_payment_id='cash'
+            )
+            notify_payment_received(payment)
+            publish_pickup_change(pickup)
         messages.success(request, 'Payment recorded as collected (cash).')
         return redirect('worker_dashboard')
 
     if payment.status == 'completed':
         messages.info(request, 'Payment was already completed.')
     else:
-        payment.status = 'completed'
-        payment.razorpay_payment_id = 'cash'
-        payment.save()
+        with transaction.atomic():
+            payment.status = 'completed'
+            payment.razorpay_payment_id = 'cash'
+            payment.save()
+            notify_payment_received(payment)
+            publish_pickup_change(pickup)
         messages.success(request, 'Payment marked as collected (cash).')
 
     return redirect('worker_dashboard')
@@ -482,78 +729,23 @@ def mark_picked_view(request, pk):
         return redirect('index')
 
     pickup = get_object_or_404(PickupRequest, pk=pk, user__profile__ward=user_profile.ward)
+    picked = False
     if pickup.status == 'pending':
-        pickup.status = 'picked'
-        pickup.save()
+        with transaction.atomic():
+            # Conditional on nobody else holding a claim at the moment of writing
+            picked = pick(pickup.pk, request.user)
+            if picked:
+                pickup.refresh_from_db()
+                notify_pickup_status(pickup)
+                publish_pickup_change(pickup)
+    if picked:
         messages.success(request, "Pickup marked as picked.")
+    elif PickupRequest.objects.filter(pk=pickup.pk, status='pending').exists():
+        messages.error(request, "Another worker has claimed this pickup.")
     else:
         messages.error(request, "Cannot mark this pickup as picked.")
     return redirect('worker_dashboard')
 
-def _recalculate_user_rewards():
-    """
-    Recalculate reward points automatically based on total waste generated
-    and its environmental impact. Users with less and less-harmful waste
-    receive higher scores. Only users with role='user' are ranked.
-    """
-    # Weight multipliers per waste type (higher = more harmful)
-    weight_factors = {
-        'wet': Decimal('1.0'),
-        'dry': Decimal('1.0'),
-        'recyclable': Decimal('0.5'),
-        'plastic': Decimal('2.0'),
-        'e-waste': Decimal('3.0'),
-    }
-
-    impact_map = defaultdict(lambda: {'total_kg': Decimal('0'), 'impact': Decimal('0')})
-
-    completed = (
-        PickupRequest.objects
-        .filter(status='completed')
-        .select_related('user')
-        .only('user_id', 'waste_type', 'waste_weight')
-    )
-
-    for p in completed:
-        if p.waste_weight is None:
-            continue
-        if not hasattr(p, 'user') or p.user is None:
-            continue
-        weight = Decimal(str(p.waste_weight))
-        factor = weight_factors.get(p.waste_type, Decimal('1.0'))
-        impact_map[p.user]['total_kg'] += weight
-        impact_map[p.user]['impact'] += weight * factor
-
-    # Ensure all users with role 'user' exist in the map (even if zero waste)
-    for profile in Profile.objects.select_related('user').filter(role='user'):
-        _ = impact_map[profile.user]  # initialize default if missing
-
-    users_impacts = list(impact_map.items())
-    if not users_impacts:
-        return
-
-    # Sort by impact ascending (less impact = better)
-    users_impacts.sort(key=lambda item: (item[1]['impact'], item[0].id))
-    n = len(users_impacts)
-    max_points = Decimal('100')
-    min_points = Decimal('10')
-
-    for idx, (user, data) in enumerate(users_impacts):
-        # Linear scale: best user gets max_points, worst gets min_points
-        if n == 1:
-            points = max_points
-        else:
-            # rank 0 => best
-            ratio = Decimal(n - 1 - idx) / Decimal(n - 1)  # 1.0 .. 0.0
-            points = min_points + (max_points - min_points) * ratio
-        reward, _ = Reward.objects.get_or_create(
-            user=user,
-            defaults={'points': 0, 'total_waste_collected': Decimal('0')},
-        )
-        reward.total_waste_collected = data['total_kg']
-        reward.points = int(points)
-        reward.save()
-
 @login_required
 @role_required(['worker'])
 def mark_completed_view(request, pk):
@@ -569,12 +761,15 @@ def mark_completed_view(request, pk):
         if form.is_valid():
             waste_weight = form.cleaned_data['waste_weight']
             if pickup.status == 'picked':
-                pickup.status = 'completed'
-                pickup.waste_weight = waste_weight
-                pickup.save()
-
-                # Automatically recalculate rewards for all users
-                _recalculate_user_rewards()
+                with transaction.atomic():
+                    pickup.status = 'completed'
+                    pickup.waste_weight = waste_weight
+                    pickup.save()
+                    # Rankings depend on every user's totals; one queued
+                    # recalculation covers any burst of completions
+                    recalculate_user_rewards.enqueue(dedup_key='recalculate-user-rewards')
+                    notify_pickup_status(pickup)
+                    publish_pickup_change(pickup)
 
                 # Generate PDF receipt
                 buffer = _generate_pickup_receipt_pdf(pickup)
@@ -602,7 +797,7 @@ def admin_dashboard_view(request):
         messages.error(request, "Access denied. Only admins can view this page.")
         return redirect('index')
 
-    users = User.objects.filter(profile__isnull=False)
+    users = User.objects.filter(profile__isnull=False, profile__deleted_at__isnull=True)
     pickups = PickupRequest.objects.all()
     feedbacks = Feedback.objects.all()
     payments = Payment.objects.all()
@@ -634,12 +829,56 @@ def admin_users_view(request):
         messages.error(request, "Access denied. Only admins can view this page.")
         return redirect('index')
 
-    users = User.objects.filter(profile__isnull=False)
-    wards = Ward.objects.all()
+    users = (
+        User.objects
+        .filter(profile__isnull=False, profile__deleted_at__isnull=True)
+        .select_related('profile__ward__panchayath')
+        .order_by('username')
+    )
+
+    # Case-sensitive prefix lookups so every branch can use an index: the
+    # mobile number's own, and LOWER(username)/LOWER(email) (migration 0025)
+    query = request.GET.get('q', '').strip()
+    if query:
+        prefix = query.lower()
+        users = users.alias(username_lower=Lower('username'), email_lower=Lower('email')).filter(
+            Q(username_lower__startswith=prefix)
+            | Q(email_lower__startswith=prefix)
+            | Q(profile__mobile_number__startswith=query)
+        )
+
+    role = request.GET.get('role', '')
+    if role in ('user', 'worker', 'admin'):
+        users = users.filter(profile__role=role)
+
+    ward_id = request.GET.get('ward', '')
+    if ward_id.isdigit():
+        users = users.filter(profile__ward_id=ward_id)
+
+    panchayath_id = request.GET.get('panchayath', '')
+    if panchayath_id.isdigit():
+        users = users.filter(profile__ward__panchayath_id=panchayath_id)
+
+    paginator = Paginator(users, ADMIN_USERS_PAGE_SIZE)
+    page_obj = paginator.get_page(request.GET.get('page'))
+
+    # Keep the active filters on pagination links
+    filters = request.GET.copy()
+    filters.pop('page', None)
+
+    wards = Ward.objects.select_related('panchayath')
+    panchayaths = Panchayath.objects.all()
 
     context = {
-        'users': users,
+        'users': page_obj.object_list,
+        'page_obj': page_obj,
         'wards': wards,
+        'panchayaths': panchayaths,
+        'query': query,
+        'selected_role': role,
+        'selected_ward': ward_id,
+        'selected_panchayath': panchayath_id,
+        'filter_querystring': filters.urlencode(),
     }
     return render(request, 'user_dashboard/admin_users.html', context)
 
@@ -651,11 +890,8 @@ def admin_feedbacks_view(request):
         messages.error(request, "Access denied. Only admins can view this page.")
         return redirect('index')
 
-    feedbacks = Feedback.objects.all().order_by('-created_at')
-
-    context = {
-        'feedbacks': feedbacks,
-    }
+    context = _feedback_list(request, Feedback.objects.all())
+    context['wards'] = Ward.objects.select_related('panchayath')
     return render(request, 'user_dashboard/admin_feedbacks.html', context)
 
 @login_required
@@ -681,7 +917,7 @@ def admin_rewards_view(request):
         messages.error(request, "Access denied. Only admins can view this page.")
         return redirect('index')
 
-    rewards = Reward.objects.filter(user__profile__role='user').order_by('-points')
+    rewards = Reward.objects.filter(user__profile__role='user', user__profile__deleted_at__isnull=True).order_by('-points')
     user_with_least_waste = rewards.order_by('total_waste_collected').first()
 
     context = {
@@ -700,8 +936,12 @@ def admin_mark_picked_view(request, pk):
 
     pickup = get_object_or_404(PickupRequest, pk=pk)
     if pickup.status == 'pending':
-        pickup.status = 'picked'
-        pickup.save()
+        with transaction.atomic():
+            pickup.status = 'picked'
+            pickup.claimed_by = pickup.claim_expires_at = None
+            pickup.save()
+            notify_pickup_status(pickup)
+            publish_pickup_change(pickup)
         messages.success(request, "Pickup marked as picked.")
     else:
         messages.error(request, "Cannot mark this pickup as picked.")
@@ -717,8 +957,11 @@ def admin_mark_completed_view(request, pk):
 
     pickup = get_object_or_404(PickupRequest, pk=pk)
     if pickup.status == 'picked':
-        pickup.status = 'completed'
-        pickup.save()
+        with transaction.atomic():
+            pickup.status = 'completed'
+            pickup.save()
+            notify_pickup_status(pickup)
+            publish_pickup_change(pickup)
         messages.success(request, "Pickup marked as completed.")
     else:
         messages.error(request, "Cannot mark this pickup as completed.")
@@ -753,8 +996,13 @@ def admin_update_role_view(request, pk):
         new_role = request.POST.get('role')
         if new_role in ['user', 'worker', 'admin']:
             profile = get_object_or_404(Profile, pk=pk)
-            profile.role = new_role
-            profile.save()
+            with transaction.atomic():
+                if profile.role == 'worker' and new_role != 'worker':
+                    hand_back(profile.user_id)
+                elif new_role == 'worker' and profile.role != 'worker':
+                    schedule_assignment()
+                profile.role = new_role
+                profile.save()
             messages.success(request, f"Role updated to {new_role}.")
         else:
             messages.error(request, "Invalid role.")
@@ -773,8 +1021,13 @@ def admin_allocate_ward_view(request, pk):
         if ward_id:
             ward = get_object_or_404(Ward, pk=ward_id)
             profile = get_object_or_404(Profile, pk=pk)
-            profile.ward = ward
-            profile.save()
+            with transaction.atomic():
+                if profile.role == 'worker' and profile.ward_id != ward.pk:
+                    # Their old ward's pending pickups go to its other workers
+                    hand_back(profile.user_id)
+                    schedule_assignment()
+                profile.ward = ward
+                profile.save()
             messages.success(request, f"Ward allocated to {profile.user.username}.")
         else:
             messages.error(request, "Invalid ward.")
@@ -800,6 +1053,71 @@ def admin_respond_feedback_view(request, pk):
             messages.error(request, "Response cannot be empty.")
     return redirect('admin_feedbacks')
 
+@login_required
+@role_required(['admin'])
+def admin_feedback_clusters_view(request):
+    user_profile = Profile.objects.get(user=request.user)
+    if user_profile.role != 'admin':
+        messages.error(request, "Access denied. Only admins can view this page.")
+        return redirect('index')
+
+    pending = Q(feedbacks__status='pending')
+    clusters = (
+        FeedbackCluster.objects
+        .annotate(
+            pending_count=Count('feedbacks', filter=pending),
+            first_at=Min('feedbacks__created_at', filter=pending),
+            last_at=Max('feedbacks__created_at', filter=pending),
+        )
+        .filter(pending_count__gte=2)
+        .select_related('ward__panchayath')
+        .order_by('-pending_count', '-last_at')
+    )
+    ward_id = request.GET.get('ward', '')
+    if ward_id.isdigit():
+        clusters = clusters.filter(ward_id=ward_id)
+
+    page_obj = Paginator(clusters, CLUSTER_PAGE_SIZE).get_page(request.GET.get('page'))
+    # Only the clusters on this page, with their pending complaints
+    clusters = FeedbackCluster.objects.filter(pk__in=[c.pk for c in page_obj.object_list]).prefetch_related(
+        Prefetch(
+            'feedbacks',
+            queryset=Feedback.objects.filter(status='pending').select_related('user').order_by('created_at'),
+            to_attr='pending_feedbacks',
+        )
+    ).in_bulk()
+    for cluster in page_obj.object_list:
+        cluster.pending_feedbacks = clusters[cluster.pk].pending_feedbacks
+
+    filters = request.GET.copy()
+    filters.pop('page', None)
+    context = {
+        'clusters': page_obj.object_list,
+        'page_obj': page_obj,
+        'wards': Ward.objects.select_related('panchayath'),
+        'selected_ward': ward_id,
+        'filter_querystring': filters.urlencode(),
+    }
+    return render(request, 'user_dashboard/admin_feedback_clusters.html', context)
+
+@login_required
+@role_required(['admin'])
+def admin_respond_cluster_view(request, pk):
+    user_profile = Profile.objects.get(user=request.user)
+    if user_profile.role != 'admin':
+        messages.error(request, "Access denied.")
+        return redirect('index')
+
+    cluster = get_object_or_404(FeedbackCluster, pk=pk)
+    if request.method == 'POST':
+        response = request.POST.get('response')
+        if response:
+            resolved = resolve_cluster(cluster, response)
+            messages.success(request, f"Responded to and resolved {resolved} complaint{'s' if resolved != 1 else ''}.")
+        else:
+            messages.error(request, "Response cannot be empty.")
+    return redirect('admin_feedback_clusters')
+
 @login_required
 @role_required(['admin'])
 def admin_add_user_view(request):
@@ -846,7 +1164,8 @@ def admin_delete_user_view(request, pk):
         messages.error(request, "Access denied.")
         return redirect('index')
     
-    user_to_delete = get_object_or_404(User, pk=pk)
+    # Users already deleted are only waiting for their data to be purged
+    user_to_delete = get_object_or_404(User.objects.exclude(profile__deleted_at__isnull=False), pk=pk)
     
     # Prevent admin from deleting themselves
     if user_to_delete == request.user:
@@ -855,7 +1174,8 @@ def admin_delete_user_view(request, pk):
     
     if request.method == 'POST':
         username = user_to_delete.username
-        user_to_delete.delete()
+        # Hidden and signed out now; their data is removed in the background
+        soft_delete_user(user_to_delete, requested_by=request.user)
         messages.success(request, f"User {username} has been deleted successfully.")
         return redirect('admin_users')
     
@@ -870,7 +1190,7 @@ def admin_give_reward_to_least_waste_view(request):
         return redirect('index')
     
     # Find user with least waste collected
-    user_reward = Reward.objects.filter(user__profile__role='user').order_by('total_waste_collected').first()
+    user_reward = Reward.objects.filter(user__profile__role='user', user__profile__deleted_at__isnull=True).order_by('total_waste_collected').first()
     
     if user_reward:
         # Give bonus points (e.g., 50 points)
@@ -0,0 +1,124 @@
+"""
+Payment gateway webhooks.
+
+payment_webhook_view only checks the signature and inserts the raw body into
+the WebhookEvent inbox, so the gateway gets its 200 in a few milliseconds
+however busy the database is; a repeated delivery hits the unique event_id
+and is dropped. process_pending_events() later parses the backlog in batches,
+loads the affected payments with one query on the indexed razorpay_order_id
+and writes them back with bulk_update. Applying an event is idempotent (a
+completed payment is never downgraded), so running two drainers at once or
+re-running a batch is harmless. By default each delivery queues the
+process_payment_webhooks job, which a job worker runs to drain the inbox;
+`manage.py process_webhooks` does the same by hand.
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, HttpResponseBadRequest
+from django.utils import timezone
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from .gateway import verify_webhook_signature
+from .live import publish_pickup_changes
+from .models import Payment, WebhookEvent
+
+# Payment status each handled event moves a payment to
+EVENT_STATUSES = {
+    'payment.captured': 'completed',
+    'order.paid': 'completed',
+    'payment.failed': 'failed',
+}
+
+def batch_size():
+    return getattr(settings, 'PAYMENT_WEBHOOK_BATCH_SIZE', 200)
+
+
+@csrf_exempt
+@require_POST
+def payment_webhook_view(request):
+    """Acknowledge a signed delivery after storing it; nothing else."""
+    body = request.body
+    signature = request.headers.get('X-Razorpay-Signature')
+    if not verify_webhook_signature(body, signature, getattr(settings, 'RAZORPAY_WEBHOOK_SECRET', '')):
+        return HttpResponseBadRequest('Invalid signature')
+    event_id = request.headers.get('X-Razorpay-Event-Id') or hashlib.sha256(body).hexdigest()
+    WebhookEvent.objects.bulk_create(
+        [WebhookEvent(event_id=event_id[:100], body=body.decode('utf-8', 'replace'))],
+        ignore_conflicts=True,
+    )
+    if getattr(settings, 'PAYMENT_WEBHOOK_PROCESS_IN_BACKGROUND', True):
+        schedule_processing()
+    return HttpResponse(status=200)
+
+
+def _parse(event):
+    """Return (status, order_id, payment_id) for a handled event, else None."""
+    data = json.loads(event.body)
+    status = EVENT_STATUSES.get(data.get('event'))
+    if status is None:
+        return None
+    entity = data['payload']['payment']['entity']
+    return status, entity['order_id'], entity['id']
+
+
+def apply_events(events):
+    """Apply one batch of inbox rows and mark them processed."""
+    parsed = []
+    for event in events:
+        event.error = ''
+        try:
+            action = _parse(event)
+        except (ValueError, KeyError, TypeError):
+            event.error = 'Malformed event'
+            continue
+        if action is not None:
+            parsed.append((event, *action))
+
+    with transaction.atomic():
+        order_ids = {order_id for _, _, order_id, _ in parsed}
+        payments = {
+            payment.razorpay_order_id: payment
+            for payment in Payment.objects.select_for_update().filter(razorpay_order_id__in=order_ids)
+        }
+        changed = {}
+        now = timezone.now()
+        for event, status, order_id, payment_id in parsed:
+            payment = payments.get(order_id)
+            if payment is None:
+                event.error = 'Unknown order'
+            elif payment.status != 'completed' and payment.status != status:
+                payment.status = status
+                if status == 'completed':
+                    payment.razorpay_payment_id = payment_id
+                payment.updated_at = now
+                changed[payment.pk] = payment
+        Payment.objects.bulk_update(changed.values(), ['status', 'razorpay_payment_id', 'updated_at'])
+        publish_pickup_changes([payment.pickup_request_id for payment in changed.values()])
+        for event in events:
+            event.processed_at = now
+        WebhookEvent.objects.bulk_update(events, ['processed_at', 'error'])
+    return len(changed)
+
+
+def process_pending_events(limit=None):
+    """Drain the inbox batch by batch; return the number of events handled."""
+    handled = 0
+    while limit is None or handled < limit:
+        size = batch_size() if limit is None else min(batch_size(), limit - handled)
+        events = list(WebhookEvent.objects.filter(processed_at__isnull=True).order_by('pk')[:size])
+        if not events:
+            break
+        apply_events(events)
+        handled += len(events)
+    return handled
+
+
+def schedule_processing():
+    """Queue a drain of the inbox unless one is already waiting to start."""
+    # Imported here: tasks imports this module
+    from .tasks import process_payment_webhooks
+    process_payment_webhooks.enqueue(dedup_key='process-payment-webhooks')